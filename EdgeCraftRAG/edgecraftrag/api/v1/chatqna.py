@@ -55,7 +55,8 @@ async def chatqna(request: ChatCompletionRequest):
         generator = active_pl.get_generator(GeneratorType.CHATQNA)
         inference_type = generator.inference_type if generator else "local"
 
-        request.input = ctx.get_session_mgr().concat_history(sessionid, inference_type, request.messages)
+        model_path = generator.model_path if generator else None
+        request.input = ctx.get_session_mgr().concat_history(sessionid, inference_type, request.messages, model_path)
 
         # Run agent if activated, otherwise, run pipeline
         if ctx.get_agent_mgr().get_active_agent():
@@ -145,13 +146,11 @@ def check_vllm(request_data: dict = Body(...)):
 
 
 async def save_session(sessionid, run_agent_gen):
-    collected_data = []
     session_mgr = ctx.get_session_mgr()
+    session_mgr.start_streaming_message(sessionid, "assistant")
     async for chunk in run_agent_gen:
         if chunk:
-            collected_data.append(chunk)
-            current_content = "".join(collected_data)
-            session_mgr.update_current_message(sessionid, "assistant", current_content)
+            session_mgr.append_streaming_chunk(sessionid, chunk)
         yield chunk or ""
         await asyncio.sleep(0)
-    session_mgr.save_current_message(sessionid, "assistant", current_content)
+    session_mgr.commit_streaming_message(sessionid)
@@ -1,11 +1,12 @@
 # Copyright (C) 2025 Intel Corporation
 # SPDX-License-Identifier: Apache-2.0
 
+import asyncio
 import itertools
 import json
 import os
 import re
-from typing import Dict, List, Union
+from typing import Dict, List, Optional, Union
 
 from edgecraftrag.api_schema import DataIn, ExperienceIn, KnowledgeBaseCreateIn
 from edgecraftrag.base import (
@@ -14,7 +15,9 @@ from edgecraftrag.base import (
     NodeParserType,
 )
 from edgecraftrag.components.benchmark import Benchmark
-from edgecraftrag.components.indexer import KBADMINIndexer, VectorIndexer, get_kbs_info
+from edgecraftrag.components.experience_index import get_embed_model
+from edgecraftrag.components.indexer import KBADMINIndexer, VectorIndexer
+from edgecraftrag.components.kbs_rev_map import kbs_rev_map
 from edgecraftrag.components.node_parser import (
     HierarchyNodeParser,
     KBADMINParser,
@@ -23,6 +26,7 @@ from edgecraftrag.components.node_parser import (
     UnstructedNodeParser,
 )
 from edgecraftrag.components.query_preprocess import query_search
+from edgecraftrag.components.retriever import AutoMergeRetriever
 from edgecraftrag.config_repository import (
     MilvusConfigRepository,
     save_knowledge_configurations,
@@ -67,6 +71,55 @@ async def get_knowledge_base_filemap(
         return None
 
 
+# Compare FAISS index types (recall against the flat index, latency) on a knowledge base's own chunks.
+@kb_app.get("/v1/knowledge/{knowledge_name}/faiss_report")
+async def get_faiss_report(
+    knowledge_name: str, top_k: int = Query(10, ge=1), num_queries: int = Query(100, ge=1, le=1000)
+):
+    kb = ctx.knowledgemgr.get_knowledge_base_by_name_or_id(knowledge_name)
+    if kb is None or kb.indexer is None or kb.indexer.comp_subtype != IndexerType.FAISS_VECTOR:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="FAISS knowledge base not found")
+    if not kb.nodes:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Knowledge base has no nodes")
+    try:
+        nodes = await asyncio.to_thread(kb.get_embedded_nodes)
+        return await asyncio.to_thread(kb.indexer.get_recall_latency_report, nodes, top_k, num_queries)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
+# Retrain the FAISS index of a knowledge base on all of its chunks, e.g. an IVF index trained on a small corpus.
+@kb_app.post("/v1/knowledge/{knowledge_name}/faiss_retrain")
+async def retrain_faiss_index(knowledge_name: str):
+    kb = ctx.knowledgemgr.get_knowledge_base_by_name_or_id(knowledge_name)
+    if kb is None or kb.indexer is None or kb.indexer.comp_subtype != IndexerType.FAISS_VECTOR:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="FAISS knowledge base not found")
+    await asyncio.to_thread(kb.retrain_indexer)
+    return kb.indexer.get_faiss_status()
+
+
+# Time the auto-merge retriever setup per query, rebuilt every query versus cached, on a knowledge base's index.
+@kb_app.get("/v1/knowledge/{knowledge_name}/automerge_report")
+async def get_automerge_report(
+    knowledge_name: str, top_k: int = Query(10, ge=1), num_queries: int = Query(100, ge=1, le=1000)
+):
+    kb = ctx.knowledgemgr.get_knowledge_base_by_name_or_id(knowledge_name)
+    if (
+        kb is None
+        or kb.indexer is None
+        or kb.indexer.comp_subtype
+        not in (
+            IndexerType.FAISS_VECTOR,
+            IndexerType.MILVUS_VECTOR,
+        )
+    ):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Vector knowledge base not found")
+    if not kb.nodes:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Knowledge base has no nodes")
+    retriever = AutoMergeRetriever(kb.indexer, similarity_top_k=top_k)
+    return await asyncio.to_thread(retriever.get_construction_overhead_report, num_queries, top_k)
+
+
 # Get the specified knowledge base.
 @kb_app.get("/v1/knowledge/{knowledge_name}")
 async def get_knowledge_base(knowledge_name: str):
@@ -127,6 +180,8 @@ async def delete_knowledge_base(knowledge_name: str):
                 rm_kb.indexer.clear_milvus_collection(knowledge_name)
             if kb_file_path:
                 rm_kb.clear_documents()
+                for file_path in kb_file_path:
+                    ctx.get_file_mgr().del_file(file_path, rm_kb.name)
         if rm_kb.comp_type == "experience":
             if rm_kb.experience_active:
                 raise HTTPException(
@@ -202,16 +257,16 @@ async def add_file_to_knowledge_base(knowledge_name, file_path: DataIn):
         if not normalized_path.startswith(UI_DIRECTORY):
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid file path")
         if os.path.isdir(normalized_path):
-            for root, _, files in os.walk(normalized_path):
-                for file in files:
-                    file_full_path = os.path.join(root, file)
-                    if file_full_path not in kb_file_list:
-                        await add_document_handler(file_full_path, kb)
-                    else:
-                        raise HTTPException(
-                            status_code=status.HTTP_409_CONFLICT,
-                            detail=f"File already exists {file_full_path}",
-                        )
+            file_full_paths = [
+                os.path.join(root, file) for root, _, files in os.walk(normalized_path) for file in files
+            ]
+            for file_full_path in file_full_paths:
+                if file_full_path in kb_file_list:
+                    raise HTTPException(
+                        status_code=status.HTTP_409_CONFLICT,
+                        detail=f"File already exists {file_full_path}",
+                    )
+            await add_documents_handler(file_full_paths, kb)
         elif os.path.isfile(normalized_path) and normalized_path in kb.get_file_paths():
             raise HTTPException(
                 status_code=status.HTTP_409_CONFLICT,
@@ -250,14 +305,15 @@ async def remove_file_from_knowledge_base(knowledge_name, file_path: DataIn):
                 detail="Please proceed to the kbadmin interface to perform the operation.",
             )
         prev_indexer = kb.indexer
+        file_id = kb.all_document_maps.get(file_path.local_path)
         document_list = kb.remove_file_path(file_path.local_path)
-        ctx.get_file_mgr().del_file(file_path.local_path)
+        ctx.get_file_mgr().del_file(file_path.local_path, kb.name)
         if not document_list:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Deleted file documents not found",
             )
-        await remove_document_handler(document_list, kb)
+        await remove_document_handler(document_list, kb, file_id)
         # update retriever with indexer since indexer updated
         if kb.active:
             active_pl = ctx.get_pipeline_mgr().get_active_pipeline()
@@ -360,18 +416,22 @@ async def view_sub_questions(que: ExperienceIn):
         SEARCH_CONFIG_PATH=SEARCH_CONFIG_PATH,
         SEARCH_DIR=SEARCH_DIR,
         pl=active_pl,
+        embed_model=get_embed_model(ctx.knowledgemgr.get_active_knowledge_base()),
     )
     return sub_questions_result
 
 
 @kb_app.get("/v1/kbadmin/kbs_list")
-def get_kbs_list(vector_url: str = Query(default="http://localhost:29530")):
+def get_kbs_list(
+    vector_url: str = Query(default="http://localhost:29530"),
+    offset: int = Query(default=0, ge=0),
+    limit: Optional[int] = Query(default=None, ge=1),
+    reprobe: bool = Query(default=False),
+):
     active_kb = ctx.knowledgemgr.get_active_knowledge_base()
     try:
         CONNECTION_ARGS = {"uri": vector_url}
-        kbs_list = get_kbs_info(CONNECTION_ARGS)
-        kb_names = [name for name in kbs_list.keys()]
-        return kb_names
+        return kbs_rev_map.list_names(CONNECTION_ARGS, offset, limit, reprobe)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -379,17 +439,39 @@ def get_kbs_list(vector_url: str = Query(default="http://localhost:29530")):
 # add knowledge file node
 async def add_document_handler(file_path=None, kb=None):
     if file_path and kb:
-        docs = ctx.get_file_mgr().add_files(docs=file_path)
-        kb.add_file_path(file_path, docs)
-        nodelist = await kb.run_node_parser(docs=docs)
-        ctx.get_node_mgr().add_nodes(kb.node_parser.idx, nodelist)
-        await kb.add_nodes_to_indexer(nodelist)
+        await add_documents_handler([file_path], kb)
+
+
+# add the files of a directory, each file goes to the node parser as soon as it is loaded
+async def add_documents_handler(file_paths=None, kb=None):
+    if file_paths and kb:
+        loaded = ctx.get_file_mgr().iter_add_files(docs=file_paths, kb_name=kb.name)
+        try:
+            while True:
+                # Loading blocks on the worker pool, keep it off the event loop
+                item = await asyncio.to_thread(next, loaded, None)
+                if item is None:
+                    break
+                file_path, docs = item
+                kb.add_file_path(file_path, docs)
+                nodelist = await kb.run_node_parser(docs=docs)
+                kb.cache_nodes(file_path, nodelist)
+                # The reload path reads the cached nodes, the documents are read again only if those are stale
+                ctx.get_file_mgr().release_documents(file_path)
+                ctx.get_node_mgr().add_nodes(kb.node_parser.idx, nodelist)
+                await kb.insert_file_nodes(file_path, nodelist)
+        finally:
+            loaded.close()
 
 
 # remove knowledge file node
-async def remove_document_handler(document_list=None, kb=None):
+async def remove_document_handler(document_list=None, kb=None, file_id=None):
 
-    if kb.indexer.comp_subtype == "milvus_vector":
+    if file_id is not None and kb.has_file_nodes(file_id):
+        # Only the file's own nodes are deleted from the indexer
+        node_ids = await kb.delete_file_nodes(file_id)
+        ctx.get_node_mgr().del_nodes(kb.node_parser.idx, node_ids)
+    elif kb.indexer.comp_subtype == "milvus_vector":
         kb.indexer.reinitialize_indexer(kb.name)
         kb.indexer.delete(document_list)
         ctx.get_node_mgr().del_nodes_by_np_idx(kb.node_parser.idx)
@@ -428,7 +510,10 @@ async def restore_knowledge_configurations():
                     if kb.indexer.comp_subtype == "milvus_vector":
                         kb.indexer.reinitialize_indexer(Knowledgebase_data["name"])
                     else:
-                        ctx.get_file_mgr().add_files(docs=Knowledgebase_data["file_paths"])
+                        # Not loaded here, handle_reload_data reads only the files whose cached nodes are stale
+                        file_paths = Knowledgebase_data["file_paths"]
+                        file_hashes = [kb.reload_manifest.content_hash(file_path) for file_path in file_paths]
+                        ctx.get_file_mgr().add_unloaded_files(file_paths, file_hashes, kb_name=kb.name)
                         await handle_reload_data(kb, node_parser_changed=True)
             elif kb.comp_subtype == "kbadmin_kb":
                 kb.indexer.config_kbadmin_milvus(kb.name)
@@ -441,6 +526,8 @@ async def restore_knowledge_configurations():
 
 
 # reloading data that is not a milvus indexer
+# Only files whose content or node parser config changed are reparsed, and only nodes whose
+# text or embedding model changed are embedded again, see ReloadManifest
 async def handle_reload_data(kb, node_parser_changed: bool = False):
 
     if kb.indexer and kb.indexer.comp_subtype == "milvus_vector":
@@ -451,12 +538,22 @@ async def handle_reload_data(kb, node_parser_changed: bool = False):
         ctx.get_node_mgr().del_nodes_by_np_idx(kb.node_parser.idx)
         kb.update_nodes([])
         kb_file_paths = kb.get_file_paths()
+        reparsed = 0
         for file_path in kb_file_paths:
-            docs = ctx.get_file_mgr().get_docs_by_file(file_path)
-            nodelist = await kb.run_node_parser(docs=docs)
-            if nodelist is None or len(nodelist) == 0:
-                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found")
+            nodelist, content_hash = kb.get_cached_nodes(file_path)
+            if nodelist:
+                kb.add_nodes(nodelist)
+            else:
+                docs = ctx.get_file_mgr().get_docs_by_file(file_path)
+                nodelist = await kb.run_node_parser(docs=docs)
+                if nodelist is None or len(nodelist) == 0:
+                    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found")
+                kb.cache_nodes(file_path, nodelist, content_hash)
+                reparsed += 1
+            ctx.get_file_mgr().release_documents(file_path)
+            kb.track_file_nodes(file_path, nodelist)
             ctx.get_node_mgr().add_nodes(kb.node_parser.idx, nodelist)
+        print(f"Knowledge base {kb.name}: reparsed {reparsed} of {len(kb_file_paths)} files")
     # update indexer
     await kb.update_nodes_to_indexer()
 
@@ -505,16 +602,15 @@ async def update_kb_handler(kb, knowledge):
             match ind.indexer_type:
                 case IndexerType.DEFAULT_VECTOR | IndexerType.FAISS_VECTOR | IndexerType.MILVUS_VECTOR:
                     if ind.embedding_model:
-                        embed_model = ctx.get_model_mgr().search_model(ind.embedding_model)
                         embed_type = ind.inference_type
-                        if embed_model is None:
-                            if embed_type == "local":
-                                ind.embedding_model.model_type = ModelType.EMBEDDING
-                            elif embed_type == "vllm":
-                                ind.embedding_model.model_type = ModelType.VLLM_EMBEDDING
-                            embed_model = ctx.get_model_mgr().load_model(ind.embedding_model)
-                            ctx.get_model_mgr().add(embed_model)
-                    new_indexer = VectorIndexer(embed_model, ind.indexer_type, ind.vector_url, kb.name)
+                        if embed_type == "local":
+                            ind.embedding_model.model_type = ModelType.EMBEDDING
+                        elif embed_type == "vllm":
+                            ind.embedding_model.model_type = ModelType.VLLM_EMBEDDING
+                        embed_model = ctx.get_model_mgr().get_or_load_model(ind.embedding_model)
+                    new_indexer = VectorIndexer(
+                        embed_model, ind.indexer_type, ind.vector_url, kb.name, ind.faiss_index_type, ind.faiss_params
+                    )
                 case IndexerType.KBADMIN_INDEXER:
                     kbadmin_embedding_url = ind.embedding_url
                     KBADMIN_VECTOR_URL = ind.vector_url
@@ -1,6 +1,7 @@
 # Copyright (C) 2024 Intel Corporation
 # SPDX-License-Identifier: Apache-2.0
 
+import asyncio
 import gc
 import os
 from typing import Optional
@@ -72,10 +73,7 @@ async def add_model(request: ModelIn):
     modelmgr = ctx.get_model_mgr()
     # Currently use asyncio.Lock() to deal with multi-requests
     async with modelmgr._lock:
-        model = modelmgr.search_model(request)
-        if model is None:
-            model = modelmgr.load_model(request)
-            modelmgr.add(model)
+        model = await asyncio.to_thread(modelmgr.get_or_load_model, request)
     return model.model_id + " model loaded"
 
 
@@ -102,8 +100,7 @@ async def update_model(model_id, request: ModelIn):
                 # Clean up memory occupation
                 gc.collect()
                 # load new model
-                model = modelmgr.load_model(request)
-                modelmgr.add(model)
+                model = await asyncio.to_thread(modelmgr.get_or_load_model, request)
         return model
 
 
@@ -1,11 +1,11 @@
 # Copyright (C) 2024 Intel Corporation
 # SPDX-License-Identifier: Apache-2.0
 
+import asyncio
 import json
 import os
 import re
 import time
-import weakref
 
 from edgecraftrag.api_schema import MilvusConnectRequest, PipelineCreateIn
 from edgecraftrag.base import (
@@ -21,6 +21,7 @@ from edgecraftrag.config_repository import MilvusConfigRepository, save_pipeline
 from edgecraftrag.context import ctx
 from edgecraftrag.env import PIPELINE_FILE
 from fastapi import FastAPI, File, HTTPException, UploadFile, status
+from fastapi.responses import PlainTextResponse
 from pymilvus import connections
 
 pipeline_app = FastAPI()
@@ -61,8 +62,16 @@ async def get_pipeline_benchmark():
 async def get_pipeline_benchmarks(name):
     pl = ctx.get_pipeline_mgr().get_pipeline_by_name_or_id(name)
     if pl and pl.benchmark:
-        bench_res = {"pipeline_bench": pl.benchmark.benchmark_data_list, "llm_bench": pl.benchmark.llm_data_list}
-        return bench_res
+        return pl.benchmark.get_records()
+
+
+# GET Pipeline benchmark in Prometheus text format
+@pipeline_app.get(path="/v1/settings/pipelines/{name}/benchmarks/metrics", response_class=PlainTextResponse)
+async def get_pipeline_benchmark_metrics(name):
+    pl = ctx.get_pipeline_mgr().get_pipeline_by_name_or_id(name)
+    if not pl or not pl.benchmark:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"No benchmark for pipeline {name}")
+    return pl.benchmark.prometheus_text(pl.name)
 
 
 # POST Pipeline
@@ -155,7 +164,7 @@ async def update_pipeline_handler(pl, req):
 
     if req.retriever is not None:
         retr = req.retriever
-        pl.update_retriever_config(retr.retriever_type, retr.retrieve_topk)
+        pl.update_retriever_config(retr.retriever_type, retr.retrieve_topk, retr.fusion_type, retr.retrieve_timeout)
 
     if req.postprocessor is not None:
         pp = req.postprocessor
@@ -165,11 +174,8 @@ async def update_pipeline_handler(pl, req):
                 case PostProcessorType.RERANKER:
                     if processor.reranker_model:
                         prm = processor.reranker_model
-                        reranker_model = ctx.get_model_mgr().search_model(prm)
-                        if reranker_model is None:
-                            prm.model_type = ModelType.RERANKER
-                            reranker_model = ctx.get_model_mgr().load_model(prm)
-                            ctx.get_model_mgr().add(reranker_model)
+                        prm.model_type = ModelType.RERANKER
+                        reranker_model = ctx.get_model_mgr().get_or_load_model(prm)
                         postprocessor = RerankProcessor(reranker_model, processor.top_n)
                         pl.postprocessor.append(postprocessor)
                     else:
@@ -184,19 +190,17 @@ async def update_pipeline_handler(pl, req):
             if gen.model is None:
                 raise Exception("No ChatQnA Model")
             if gen.inference_type:
-                model = ctx.get_model_mgr().search_model(gen.model)
-                if model is None:
-                    if gen.inference_type == InferenceType.VLLM:
-                        gen.model.model_type = ModelType.VLLM
-                    else:
-                        gen.model.model_type = ModelType.LLM
-                    if pl.enable_benchmark:
-                        model, tokenizer, bench_hook = ctx.get_model_mgr().load_model_ben(gen.model)
-                    else:
-                        model = ctx.get_model_mgr().load_model(gen.model)
-                    ctx.get_model_mgr().add(model)
-                # Use weakref to achieve model deletion and memory release
-                model_ref = weakref.ref(model)
+                if gen.inference_type == InferenceType.VLLM:
+                    gen.model.model_type = ModelType.VLLM
+                else:
+                    gen.model.model_type = ModelType.LLM
+                # Loading compiles the model, keep it off the event loop
+                model = await asyncio.to_thread(
+                    ctx.get_model_mgr().get_or_load_model, gen.model, benchmark=pl.enable_benchmark
+                )
+                # The registry keeps the only strong reference, so the model can be deleted or evicted
+                # to release memory; the handle reloads an evicted model on next use
+                model_ref = ctx.get_model_mgr().get_model_ref(model)
                 if gen.generator_type == GeneratorType.CHATQNA:
                     pl.generator.append(
                         QnAGenerator(
@@ -207,8 +211,9 @@ async def update_pipeline_handler(pl, req):
                     pl.generator.append(FreeChatGenerator(model_ref, gen.inference_type, gen.vllm_endpoint))
 
                 if pl.enable_benchmark:
-                    if "tokenizer" not in locals() or tokenizer is None:
-                        _, tokenizer, bench_hook = ctx.get_model_mgr().load_model_ben(gen.model)
+                    tokenizer, bench_hook = await asyncio.to_thread(
+                        ctx.get_model_mgr().get_bench_tools, model, gen.model
+                    )
                     pl.benchmark = Benchmark(pl.enable_benchmark, gen.inference_type, tokenizer, bench_hook)
                 else:
                     pl.benchmark = Benchmark(pl.enable_benchmark, gen.inference_type)
@@ -8,6 +8,9 @@ import cpuinfo
 import distro
 import openvino as ov
 import psutil
+from edgecraftrag.components.embedding_client import embedding_client_registry
+from edgecraftrag.components.generation_scheduler import generation_schedulers
+from edgecraftrag.components.vllm_client import vllm_client_registry
 from fastapi import FastAPI, HTTPException, status
 
 
@@ -69,3 +72,30 @@ async def get_device_info():
         return get_available_devices()
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+
+# GET vLLM client connection pool metrics
+@system_app.get(path="/v1/system/vllm_pool")
+async def get_vllm_pool_info():
+    try:
+        return vllm_client_registry.get_metrics()
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+
+# GET embedding client batching metrics
+@system_app.get(path="/v1/system/embedding_clients")
+async def get_embedding_clients_info():
+    try:
+        return embedding_client_registry.get_metrics()
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+
+# GET local generation queue metrics
+@system_app.get(path="/v1/system/generation_queue")
+async def get_generation_queue_info():
+    try:
+        return generation_schedulers.get_metrics()
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
@@ -4,7 +4,7 @@
 from typing import Any, Dict, Optional
 
 from edgecraftrag import base
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict, Field
 
 
 class ModelIn(BaseModel):
@@ -24,17 +24,40 @@ class NodeParserIn(BaseModel):
     window_size: Optional[int] = 3
 
 
+class FaissParamsIn(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    # IVF / IVF-PQ
+    nlist: Optional[int] = Field(default=None, ge=1)
+    nprobe: Optional[int] = Field(default=None, ge=1)
+    # HNSW
+    hnsw_m: Optional[int] = Field(default=None, ge=2)
+    ef_construction: Optional[int] = Field(default=None, ge=1)
+    ef_search: Optional[int] = Field(default=None, ge=1)
+    # IVF-PQ
+    pq_m: Optional[int] = Field(default=None, ge=1)
+    pq_nbits: Optional[int] = Field(default=None, ge=1, le=16)
+    # IVF / IVF-PQ training thresholds
+    min_train_size: Optional[int] = Field(default=None, ge=1)
+    retrain_growth: Optional[float] = Field(default=None, gt=1.0)
+
+
 class IndexerIn(BaseModel):
     indexer_type: str
     embedding_model: Optional[ModelIn] = None
     embedding_url: Optional[str] = None
     vector_url: Optional[str] = None
     inference_type: Optional[str] = "local"
+    # FAISS only: flat, ivf, hnsw or ivfpq, and build/search parameters such as nlist, nprobe, ef_search
+    faiss_index_type: Optional[base.FaissIndexType] = None
+    faiss_params: Optional[FaissParamsIn] = None
 
 
 class RetrieverIn(BaseModel):
     retriever_type: str
     retrieve_topk: Optional[int] = 3
+    fusion_type: Optional[base.FusionType] = None
+    retrieve_timeout: Optional[float] = None
 
 
 class PostProcessorIn(BaseModel):
@@ -29,6 +29,7 @@ class CompType(str, Enum):
 class BenchType(str, Enum):
 
     CHUNK_NUM = "chunk_num"
+    QUERYSEARCH_BREAKDOWN = "querysearch_breakdown"
 
 
 class ModelType(str, Enum):
@@ -65,6 +66,14 @@ class IndexerType(str, Enum):
     KBADMIN_INDEXER = "kbadmin_indexer"
 
 
+class FaissIndexType(str, Enum):
+
+    FLAT = "flat"
+    IVF = "ivf"
+    HNSW = "hnsw"
+    IVFPQ = "ivfpq"
+
+
 class RetrieverType(str, Enum):
 
     VECTORSIMILARITY = "vectorsimilarity"
@@ -73,6 +82,13 @@ class RetrieverType(str, Enum):
     KBADMIN_RETRIEVER = "kbadmin_retriever"
 
 
+class FusionType(str, Enum):
+
+    CONCAT = "concat"
+    RRF = "rrf"
+    SCORE_NORM = "score_norm"
+
+
 class PostProcessorType(str, Enum):
 
     RERANKER = "reranker"
@@ -3,6 +3,8 @@
 
 import os
 from abc import abstractmethod
+from contextvars import ContextVar
+from typing import List, Optional
 
 from comps.cores.proto.api_protocol import ChatCompletionRequest
 from edgecraftrag.base import BaseComponent, CallbackType, CompType, GeneratorType
@@ -11,6 +13,16 @@ from edgecraftrag.utils import stream_generator
 from langgraph.config import get_stream_writer
 from pydantic import model_serializer
 
+# Set while the output of a task is collected instead of streamed, e.g. by plan steps running concurrently
+stream_buffer: ContextVar[Optional[List[str]]] = ContextVar("agent_stream_buffer", default=None)
+
+
+def get_writer():
+    buffer = stream_buffer.get()
+    if buffer is not None:
+        return buffer.append
+    return get_stream_writer()
+
 
 class Agent(BaseComponent):
 
@@ -40,17 +52,17 @@ class Agent(BaseComponent):
             return kb
         return None
 
-    async def llm_generate(self, request: ChatCompletionRequest, streaming):
+    async def llm_generate(self, request: ChatCompletionRequest, streaming, messages=None):
         request.stream = streaming
-        request.messages = self._messages
+        request.messages = self._messages if messages is None else messages
         response = await self._run_pipeline_generate(request)
         return response
 
-    async def llm_generate_astream_writer(self, request, prefix=None, suffix=None) -> str:
+    async def llm_generate_astream_writer(self, request, prefix=None, suffix=None, messages=None) -> str:
         response = ""
-        writer = get_stream_writer()
+        writer = get_writer()
         first = True
-        generator = await self.llm_generate(request, True)
+        generator = await self.llm_generate(request, True, messages)
         async for chunk in generator:
             if first and prefix:
                 writer(prefix + chunk)
@@ -111,6 +123,6 @@ class Agent(BaseComponent):
 
 
 async def stream_writer(input):
-    writer = get_stream_writer()
+    writer = get_writer()
     async for chunk in stream_generator(input):
         writer(chunk)
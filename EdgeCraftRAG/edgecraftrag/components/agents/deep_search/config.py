@@ -10,6 +10,8 @@ from typing import Any, Dict
 
 from pydantic import BaseModel, Field
 
+from .utils import read_text_cached
+
 
 class PromptTemplates(BaseModel):
     """Collection of prompt templates used by the DeepSearch workflow."""
@@ -33,11 +35,15 @@ class Config(BaseModel):
     query_instruction: str
     answer_instruction: str
     domain_knowledge: str
+    # Set by load_config when domain_knowledge was read from this file, which is reloaded once it changes
+    domain_knowledge_path: str = ""
     retrieve_top_k: int
     rerank_top_k: int
     mece_retrieval: bool = False
     max_retrievals: int
     max_plan_steps: int = 7
+    # Independent plan steps executed at the same time, 1 executes every step in order
+    max_parallel_steps: int = 1
     recur_summarize_instruction: str = ""
     postproc: str = "defaults.py"
     use_summarized_context: bool = False
@@ -81,6 +87,7 @@ def load_config(config_path: str) -> Config:
     # Expand domain knowledge file lazily if it points to a file.
     domain_path = Path(cfg.domain_knowledge)
     if domain_path.exists() and domain_path.is_file():
-        cfg.domain_knowledge = domain_path.read_text(encoding="utf-8")
+        cfg.domain_knowledge_path = str(domain_path)
+        cfg.domain_knowledge, _ = read_text_cached(cfg.domain_knowledge_path)
 
     return cfg
@@ -6,23 +6,31 @@ from __future__ import annotations
 
 import asyncio
 import os
-from typing import Any, List, Tuple
+from contextvars import ContextVar
+from typing import Any, List, Optional, Tuple
 
 from comps.cores.proto.api_protocol import ChatCompletionRequest
 from edgecraftrag.base import AgentType, CallbackType, CompType
-from edgecraftrag.components.agent import Agent, stream_writer
+from edgecraftrag.components.agent import Agent, get_writer, stream_buffer, stream_writer
 from langgraph.graph import END, START, StateGraph
 from pydantic import BaseModel, Field
 
 from .config import load_config
 from .logging_utils import format_terminal_str, log_status
+from .memo import RetrievalMemo, normalize_query, pipeline_scope
 from .postprocessing import postproc_answer as default_postproc_answer
 from .postprocessing import postproc_plan as default_postproc_plan
+from .postprocessing import postproc_plan_groups as default_postproc_plan_groups
 from .postprocessing import postproc_query as default_postproc_query
-from .utils import Role, import_module_from_path
+from .utils import Role, import_module_from_path, read_text_cached
 
 DEFAULT_CONFIG = "./edgecraftrag/components/agents/deep_search/cfgs/default.json"
 
+# (messages, conversation history) of a plan step executed concurrently with others, unset for sequential steps
+_step_context: ContextVar[Optional[Tuple[List[dict], List[dict]]]] = ContextVar(
+    "deep_search_step_context", default=None
+)
+
 
 class Retrieval(BaseModel):
     step: str
@@ -39,6 +47,8 @@ class DeepSearchState(BaseModel):
     answer: str
 
     plan: List[str] = Field(default_factory=list)
+    # Indexes of plan steps that are executed together, in plan order
+    step_groups: List[List[int]] = Field(default_factory=list)
     retrievals: List[Retrieval] = Field(default_factory=list)
     context_chunk_ids: List[str] = Field(default_factory=list)
     search_summaries: List[str] = Field(default_factory=list)
@@ -67,10 +77,15 @@ class DeepSearchAgent(Agent):
             self.cfg.max_retrievals = cfg["max_retrievals"]
         if "max_plan_steps" in cfg:
             self.cfg.max_plan_steps = cfg["max_plan_steps"]
+        if "max_parallel_steps" in cfg:
+            self.cfg.max_parallel_steps = cfg["max_parallel_steps"]
 
         self.graph = self._build_graph()
         self._messages: List[dict] = []
         self.conversation_history: List[dict] = []
+        # Retrieval and rerank results reused across plan steps and runs while the indexes are unchanged
+        self.memo = RetrievalMemo()
+        self.last_memo_stats: dict = {}
 
         postproc_module = None
         if self.cfg.postproc:
@@ -87,6 +102,7 @@ class DeepSearchAgent(Agent):
         self.postproc_query = getattr(postproc_module, "postproc_query", default_postproc_query)
         self.postproc_answer = getattr(postproc_module, "postproc_answer", default_postproc_answer)
         self.postproc_plan = getattr(postproc_module, "postproc_plan", default_postproc_plan)
+        self.postproc_plan_groups = getattr(postproc_module, "postproc_plan_groups", default_postproc_plan_groups)
 
     @classmethod
     def get_default_configs(cls):
@@ -97,6 +113,7 @@ class DeepSearchAgent(Agent):
             "mece_retrieval": cfg.mece_retrieval,
             "max_retrievals": cfg.max_retrievals,
             "max_plan_steps": cfg.max_plan_steps,
+            "max_parallel_steps": cfg.max_parallel_steps,
         }
 
     def update(self, cfg):
@@ -125,10 +142,25 @@ class DeepSearchAgent(Agent):
             self.cfg.max_plan_steps = mps
             self.configs["max_plan_steps"] = mps
 
+        mpar = cfg.get("max_parallel_steps", None)
+        if mpar and isinstance(mpar, int):
+            self.cfg.max_parallel_steps = mpar
+            self.configs["max_parallel_steps"] = mpar
+
+    def _get_messages(self) -> List[dict]:
+        step_context = _step_context.get()
+        return step_context[0] if step_context else self._messages
+
+    def _get_history(self) -> List[dict]:
+        step_context = _step_context.get()
+        return step_context[1] if step_context else self.conversation_history
+
     async def _build_init_messages(self, request: ChatCompletionRequest) -> List[dict]:
-        if os.path.isfile(self.cfg.domain_knowledge):
-            with open(self.cfg.domain_knowledge, "r", encoding="utf-8") as file:
-                self.cfg.domain_knowledge = file.read()
+        domain_knowledge = self.cfg.domain_knowledge
+        domain_knowledge_path = self.cfg.domain_knowledge_path or domain_knowledge
+        if os.path.isfile(domain_knowledge_path):
+            domain_knowledge, hit = read_text_cached(domain_knowledge_path)
+            self.memo.record("domain_knowledge", hit)
 
         experiences_block = ""
         experience_status = True if request.tool_choice == "auto" else False
@@ -176,7 +208,7 @@ class DeepSearchAgent(Agent):
                 "content": self.cfg.prompt_templates.system.format(
                     system_instruction=self.cfg.system_instruction,
                     query_instruction=self.cfg.query_instruction,
-                    domain_knowledge=self.cfg.domain_knowledge,
+                    domain_knowledge=domain_knowledge,
                     experiences=experiences_block,
                 ),
             }
@@ -188,10 +220,18 @@ class DeepSearchAgent(Agent):
         retrieval_query, rerank_query = self.postproc_query(state.query, state)
         mece_retrieve = mece_retrieve or self.cfg.mece_retrieval
         request = state.request
-        request.messages = retrieval_query
-        contexts = await self.run_pipeline_retrieve(request)
-        # Llamaindex NodeWithScore Structure
-        retrieved = contexts[CompType.RETRIEVER]
+        scope = pipeline_scope(self.get_bound_pipeline())
+        retrieval_key = (scope, normalize_query(retrieval_query), request.k) if scope else None
+        retrieved = self.memo.get("retrieval", retrieval_key) if retrieval_key else None
+        if retrieved is None:
+            request.messages = retrieval_query
+            contexts = await self.run_pipeline_retrieve(request)
+            # Llamaindex NodeWithScore Structure
+            retrieved = contexts[CompType.RETRIEVER]
+            if retrieval_key:
+                self.memo.put("retrieval", retrieval_key, retrieved)
+        else:
+            contexts = {CompType.RETRIEVER: retrieved}
 
         if mece_retrieve:
             new_retrieved = [node for node in retrieved if node.node_id not in state.context_chunk_ids]
@@ -202,10 +242,18 @@ class DeepSearchAgent(Agent):
 
         contexts[CompType.RETRIEVER] = new_retrieved
 
-        request = state.request
-        request.messages = rerank_query
-        contexts = await self.run_pipeline_rerank(request, contexts)
-        reranked = contexts[CompType.POSTPROCESSOR]
+        rerank_key = None
+        if scope:
+            candidate_ids = tuple(node.node_id for node in new_retrieved)
+            rerank_key = (scope, normalize_query(rerank_query), candidate_ids, request.top_n)
+        reranked = self.memo.get("rerank", rerank_key) if rerank_key else None
+        if reranked is None:
+            request = state.request
+            request.messages = rerank_query
+            contexts = await self.run_pipeline_rerank(request, contexts)
+            reranked = contexts[CompType.POSTPROCESSOR]
+            if rerank_key:
+                self.memo.put("rerank", rerank_key, reranked)
         reranked_chunk_ids = [node.node_id for node in reranked]
         return new_retrieved, reranked, state.context_chunk_ids + reranked_chunk_ids
 
@@ -247,8 +295,8 @@ class DeepSearchAgent(Agent):
                 "content": self.cfg.prompt_templates.continue_decision,
             },
         ]
-        self._messages.extend(messages)
-        self.conversation_history.extend(messages)
+        self._get_messages().extend(messages)
+        self._get_history().extend(messages)
         if state.num_retrievals >= self.cfg.max_retrievals:
             log_status(
                 "⚠️",
@@ -258,17 +306,19 @@ class DeepSearchAgent(Agent):
                     bold=True,
                 ),
             )
-            await stream_writer(f"\n\n⚠️ **Reached maximum retrievals: {self.cfg.max_retrievals}, stopping search**\n\n")
+            await stream_writer(
+                f"\n\n⚠️ **Reached maximum retrievals: {self.cfg.max_retrievals}, stopping search**\n\n"
+            )
             return "stop"
 
-        response = await self.llm_generate_astream_writer(state.request)
+        response = await self.llm_generate_astream_writer(state.request, messages=self._get_messages())
 
         message = {
             "role": Role.ASSISTANT.value,
             "content": response,
         }
-        self._messages.append(message)
-        self.conversation_history.append(message)
+        self._get_messages().append(message)
+        self._get_history().append(message)
         if response.upper().startswith("NO"):
             log_status(
                 "✅",
@@ -289,17 +339,17 @@ class DeepSearchAgent(Agent):
             "role": Role.SYSTEM.value,
             "content": self.cfg.prompt_templates.generate_query,
         }
-        self._messages.append(message)
-        self.conversation_history.append(message)
+        self._get_messages().append(message)
+        self._get_history().append(message)
 
-        response = await self.llm_generate_astream_writer(state.request)
+        response = await self.llm_generate_astream_writer(state.request, messages=self._get_messages())
 
         message = {
             "role": Role.ASSISTANT.value,
             "content": response,
         }
-        self._messages.append(message)
-        self.conversation_history.append(message)
+        self._get_messages().append(message)
+        self._get_history().append(message)
         return {"query": response}
 
     async def execute_next_step(self, state: DeepSearchState) -> None:
@@ -316,8 +366,8 @@ class DeepSearchAgent(Agent):
             "role": Role.SYSTEM.value,
             "content": f"Start to execute the step: {step}\n",
         }
-        self._messages.append(message)
-        self.conversation_history.append(message)
+        self._get_messages().append(message)
+        self._get_history().append(message)
 
     async def finish_search(self, state: DeepSearchState) -> dict:
         await stream_writer("</agent>")
@@ -328,8 +378,98 @@ class DeepSearchAgent(Agent):
             log_status("🏁", format_terminal_str("All planned steps completed", color="cyan", bold=True))
             await stream_writer('<agent title="All planned steps completed" tag="nofold"></agent>')
             return "stop"
+        if len(self._step_group(state)) > 1:
+            return "parallel"
         return "continue"
 
+    @staticmethod
+    def _step_group(state: DeepSearchState) -> List[int]:
+        for group in state.step_groups:
+            if state.step in group:
+                return [i for i in group if i >= state.step]
+        return [state.step]
+
+    async def _run_step_branch(
+        self, state: DeepSearchState, step: int, messages: List[dict], semaphore: asyncio.Semaphore
+    ) -> Tuple[dict, List[str], List[dict], List[dict]]:
+        # Runs in its own task, so the context variables set here are private to this step
+        async with semaphore:
+            output: List[str] = []
+            history: List[dict] = []
+            stream_buffer.set(output)
+            _step_context.set((messages, history))
+            branch_state = state.model_copy(
+                update={
+                    "query": "",
+                    "step": step,
+                    "num_retrievals": 0,
+                    "retrievals": [],
+                    "search_summaries": [],
+                    "request": state.request.model_copy(),
+                }
+            )
+            await self.execute_next_step(branch_state)
+            result = await self.search_graph.ainvoke(branch_state)
+            return result, output, messages, history
+
+    async def execute_parallel_steps(self, state: DeepSearchState) -> dict:
+        """Execute a group of independent plan steps concurrently, at most max_parallel_steps at a time.
+
+        Each step works on its own copy of the conversation. Outputs, retrievals and summaries are
+        merged in plan order once the whole group is done, so the result does not depend on which
+        step finished first.
+        """
+        group = self._step_group(state)
+        log_status(
+            "⚡",
+            format_terminal_str(
+                f"Executing steps {', '.join(str(i + 1) for i in group)} concurrently", color="green", bold=True
+            ),
+        )
+        semaphore = asyncio.Semaphore(max(1, self.cfg.max_parallel_steps))
+        base_messages = list(self._messages)
+        results = await asyncio.gather(
+            *[self._run_step_branch(state, step, list(base_messages), semaphore) for step in group]
+        )
+
+        writer = get_writer()
+        retrievals = list(state.retrievals)
+        search_summaries = list(state.search_summaries)
+        context_chunk_ids = list(state.context_chunk_ids)
+        seen_chunk_ids = set(context_chunk_ids)
+        new_messages = []
+        for result, output, messages, history in results:
+            for chunk in output:
+                writer(chunk)
+            for retrieval in result.get("retrievals", []):
+                if self.cfg.mece_retrieval:
+                    # Concurrent steps could not exclude each other's chunks, drop the ones an earlier step kept
+                    retrieval.reranked = [doc for doc in retrieval.reranked if doc.node_id not in seen_chunk_ids]
+                for doc in retrieval.reranked:
+                    if doc.node_id not in seen_chunk_ids:
+                        seen_chunk_ids.add(doc.node_id)
+                        context_chunk_ids.append(doc.node_id)
+                retrievals.append(retrieval)
+            summaries = result.get("search_summaries", [])
+            search_summaries.extend(summaries)
+            if summaries:
+                # summarize_search left the summary as the last message
+                new_messages.append(messages[-1])
+            else:
+                new_messages.extend(messages[len(base_messages) :])
+            self.conversation_history.extend(history)
+        if self.cfg.recur_summarize_instruction:
+            # Same prefix as summarize_search keeps, followed by the summary of every step in the group
+            base_messages = [base_messages[0], base_messages[1], base_messages[3]]
+        self._messages = base_messages + new_messages
+        return {
+            "step": group[-1] + 1,
+            "num_retrievals": 0,
+            "retrievals": retrievals,
+            "search_summaries": search_summaries,
+            "context_chunk_ids": context_chunk_ids,
+        }
+
     async def make_plan(self, state: DeepSearchState) -> dict:
         log_status("📋", format_terminal_str("Making a plan ...", color="cyan", bold=True))
         await stream_writer('<agent title="Making a plan">')
@@ -349,6 +489,7 @@ class DeepSearchAgent(Agent):
         response = await self.llm_generate(state.request, False)
 
         plan = self.postproc_plan(response, state, self.cfg)
+        step_groups = self.postproc_plan_groups(response, plan, self.cfg)
         num_plan_step = len(plan)
         for i, step in enumerate(plan):
             step_num_str = format_terminal_str(f"Step{i+1: >2d}:", color="green", bold=True)
@@ -368,7 +509,7 @@ class DeepSearchAgent(Agent):
         }
         self._messages.append(message)
         self.conversation_history.append(message)
-        return {"plan": plan, "step": 0, "num_retrievals": 0}
+        return {"plan": plan, "step_groups": step_groups, "step": 0, "num_retrievals": 0}
 
     async def summarize_search(self, state: DeepSearchState) -> dict:
         log_status("📝", format_terminal_str("Summarizing the search process ...", color="cyan", bold=True))
@@ -379,22 +520,23 @@ class DeepSearchAgent(Agent):
                 "content": self.cfg.recur_summarize_instruction,
             }
         ]
-        self._messages.extend(messages)
-        self.conversation_history.extend(messages)
+        step_messages = self._get_messages()
+        step_messages.extend(messages)
+        self._get_history().extend(messages)
 
-        response = await self.llm_generate_astream_writer(state.request)
+        response = await self.llm_generate_astream_writer(state.request, messages=step_messages)
 
         message = {
             "role": Role.ASSISTANT.value,
             "content": response,
         }
-        self.conversation_history.append(message)
-        self._messages = [
-            self._messages[0],
-            self._messages[1],
-            self._messages[3],
+        self._get_history().append(message)
+        step_messages[:] = [
+            step_messages[0],
+            step_messages[1],
+            step_messages[3],
         ]
-        self._messages.append(
+        step_messages.append(
             {
                 "role": Role.ASSISTANT.value,
                 "content": "The following is the summarized information from previous search steps:\n" + response,
@@ -462,6 +604,13 @@ class DeepSearchAgent(Agent):
             }
         )
         answer = self.postproc_answer(response, state)
+        self.last_memo_stats = self.memo.hit_rates()
+        if self.last_memo_stats:
+            rates = ", ".join(
+                f"{kind} {stats['hits']}/{stats['lookups']} ({stats['hit_rate']:.0%})"
+                for kind, stats in self.last_memo_stats.items()
+            )
+            log_status("📊", format_terminal_str(f"Memo cache hits: {rates}", color="cyan"))
         title_str = format_terminal_str("Final Answer:", color="blue", bold=True)
         log_status(
             "✅",
@@ -496,23 +645,27 @@ class DeepSearchAgent(Agent):
         else:
             search.add_edge("finish_search", END)
 
+        self.search_graph = search.compile()
+
         deep_search = StateGraph(DeepSearchState)
         deep_search.add_node("make_plan", self.make_plan)
         deep_search.add_node("execute_search_step", self.execute_next_step)
-        deep_search.add_node("search", search.compile())
+        deep_search.add_node("search", self.search_graph)
+        deep_search.add_node("execute_parallel_steps", self.execute_parallel_steps)
         deep_search.add_node("final_answer", self.generate_answer)
 
         deep_search.add_edge(START, "make_plan")
-        deep_search.add_edge("make_plan", "execute_search_step")
         deep_search.add_edge("execute_search_step", "search")
-        deep_search.add_conditional_edges(
-            "search",
-            self.check_execution,
-            {
-                "stop": "final_answer",
-                "continue": "execute_search_step",
-            },
-        )
+        for node in ("make_plan", "search", "execute_parallel_steps"):
+            deep_search.add_conditional_edges(
+                node,
+                self.check_execution,
+                {
+                    "stop": "final_answer",
+                    "continue": "execute_search_step",
+                    "parallel": "execute_parallel_steps",
+                },
+            )
         deep_search.add_edge("final_answer", END)
 
         return deep_search.compile()
@@ -615,6 +768,7 @@ class DeepSearchAgent(Agent):
                     retrievals=[],
                     request=request,
                 )
+                self.memo.reset_stats()
                 self._messages = await self._build_init_messages(request)
 
                 async def async_gen():
@@ -0,0 +1,79 @@
+# Copyright (C) 2025 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+"""Memoization of retrieval and rerank results for Mini Deep Search."""
+
+from __future__ import annotations
+
+import copy
+import os
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+DEFAULT_MEMO_SIZE = int(os.getenv("DEEPSEARCH_MEMO_SIZE", "256"))
+
+
+def normalize_query(query: str) -> str:
+    """Fold case, whitespace and surrounding quotes or punctuation, which do not change what is retrieved."""
+    return " ".join(str(query).lower().split()).strip("\"'`.?!:; ")
+
+
+def pipeline_scope(pl) -> Optional[Tuple]:
+    """Identify the retrievers, rerankers and index versions results depend on.
+
+    Returns None when a retriever's index has no version, e.g. kbadmin knowledge bases whose
+    content is managed outside this service, so their results are never memoized.
+    """
+    retrievers = []
+    for retriever in pl.retrievers:
+        version = getattr(getattr(retriever, "_index", None), "version", None)
+        if version is None:
+            return None
+        retrievers.append((id(retriever), getattr(retriever, "topk", None), version))
+    postprocessors = tuple(id(processor) for processor in pl.postprocessor or [])
+    return (pl.idx, pl.fusion_type, tuple(retrievers), postprocessors)
+
+
+class RetrievalMemo:
+    """LRU memo of node lists, shared by every run of an agent.
+
+    Keys carry the index versions, so entries of a changed knowledge base are never hit again and
+    age out. Node lists are copied in and out because rerankers update scores in place.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MEMO_SIZE):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[Tuple[str, Hashable], List[Any]] = OrderedDict()
+        self.hits: Dict[str, int] = {}
+        self.misses: Dict[str, int] = {}
+
+    def get(self, kind: str, key: Hashable) -> Optional[List[Any]]:
+        nodes = self._entries.get((kind, key))
+        self.record(kind, nodes is not None)
+        if nodes is None:
+            return None
+        self._entries.move_to_end((kind, key))
+        return [copy.copy(node) for node in nodes]
+
+    def put(self, kind: str, key: Hashable, nodes: List[Any]) -> None:
+        if self.max_entries <= 0:
+            return
+        self._entries[(kind, key)] = [copy.copy(node) for node in nodes]
+        self._entries.move_to_end((kind, key))
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def record(self, kind: str, hit: bool) -> None:
+        counts = self.hits if hit else self.misses
+        counts[kind] = counts.get(kind, 0) + 1
+
+    def reset_stats(self) -> None:
+        self.hits = {}
+        self.misses = {}
+
+    def hit_rates(self) -> Dict[str, Dict[str, Any]]:
+        rates = {}
+        for kind in sorted(set(self.hits) | set(self.misses)):
+            hits = self.hits.get(kind, 0)
+            total = hits + self.misses.get(kind, 0)
+            rates[kind] = {"hits": hits, "lookups": total, "hit_rate": hits / total if total else 0.0}
+        return rates
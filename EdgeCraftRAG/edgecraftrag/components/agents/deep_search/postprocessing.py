@@ -126,6 +126,31 @@ def postproc_plan(text: str, state, cfg) -> List[str]:  # type: ignore[valid-typ
     return _merge_plan_steps(plan, cfg.max_plan_steps)
 
 
+def postproc_plan_groups(text: str, plan: List[str], cfg) -> List[List[int]]:  # type: ignore[valid-type]
+    """Group the plan steps that can be executed concurrently, by step index.
+
+    A step written as ``{"step": ..., "independent": true}`` joins the group of the step before it.
+    Every step gets its own group when the marks cannot be matched to the final plan, e.g. after
+    steps were merged.
+    """
+    sequential = [[i] for i in range(len(plan))]
+    if cfg.max_parallel_steps <= 1:
+        return sequential
+    try:
+        raw_plan = json_repair.loads(text)
+    except Exception:  # pragma: no cover - defensive logging only
+        return sequential
+    if not isinstance(raw_plan, list) or len(raw_plan) != len(plan):
+        return sequential
+    groups: List[List[int]] = []
+    for i, step in enumerate(raw_plan):
+        if groups and isinstance(step, dict) and step.get("independent") is True:
+            groups[-1].append(i)
+        else:
+            groups.append([i])
+    return groups
+
+
 def postproc_query(text: str, state):  # type: ignore[valid-type]
     log_status("💡", f"{format_terminal_str('Query generated:', color='cyan', bold=True)} '{text}'")
     return text, text
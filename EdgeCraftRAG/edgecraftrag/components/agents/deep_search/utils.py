@@ -9,7 +9,8 @@ import os
 import re
 import sys
 from enum import Enum
-from typing import Optional
+from pathlib import Path
+from typing import Dict, Optional, Tuple
 
 
 class Role(str, Enum):
@@ -18,6 +19,21 @@ class Role(str, Enum):
     USER = "user"
 
 
+# path -> (mtime_ns, text)
+_text_file_cache: Dict[str, Tuple[int, str]] = {}
+
+
+def read_text_cached(file_path: str) -> Tuple[str, bool]:
+    """Return the text of a file and whether it was cached, the file is read again only once its mtime changed."""
+    mtime = os.stat(file_path).st_mtime_ns
+    cached = _text_file_cache.get(file_path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1], True
+    text = Path(file_path).read_text(encoding="utf-8")
+    _text_file_cache[file_path] = (mtime, text)
+    return text, False
+
+
 def import_module_from_path(file_path: str):
     """Import and return a Python module from the given path."""
     if not os.path.isfile(file_path):
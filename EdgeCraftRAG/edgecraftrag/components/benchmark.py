@@ -1,14 +1,90 @@
 # Copyright (C) 2024 Intel Corporation
 # SPDX-License-Identifier: Apache-2.0
 
+import bisect
+import math
 import os
 import threading
-from typing import Any, List, Optional
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
 
-import requests
 from edgecraftrag.base import BaseComponent, BenchType, CompType, InferenceType
-from prometheus_client.parser import text_string_to_metric_families
-from pydantic import BaseModel, Field, model_serializer
+from pydantic import model_serializer
+
+# Per-request records kept for the benchmark APIs, older requests are dropped first
+BENCHMARK_MAX_RECORDS = int(os.getenv("BENCHMARK_MAX_RECORDS", "1000"))
+
+# Upper bounds in seconds, the same for every stage so the histograms can be compared
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, math.inf)
+
+LATENCY_STAGES = (
+    CompType.NODEPARSER,
+    CompType.RETRIEVER,
+    CompType.POSTPROCESSOR,
+    CompType.QUERYSEARCH,
+    CompType.GENERATOR,
+)
+
+LLM_LATENCY_METRICS = ("first_token_latency", "other_tokens_avg_latency")
+
+
+def _label_value(value: str) -> str:
+    # Label values escape backslash, double quote and newline in the Prometheus text format
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class StreamingHistogram:
+    """Cumulative histogram over fixed buckets, memory does not grow with the number of observations.
+
+    Percentiles are interpolated linearly inside the bucket holding the requested rank, so they are
+    estimates whose precision is bounded by the bucket widths.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            if count and cumulative + count >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = min(self.buckets[i], self.max)
+                return lower + (upper - lower) * max(rank - cumulative, 0) / count
+            cumulative += count
+        return self.max
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+        }
+
+    def prometheus_lines(self, name: str, labels: str) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            le = "+Inf" if math.isinf(bound) else repr(bound)
+            lines.append(f'{name}_bucket{{{labels},le="{le}"}} {cumulative}')
+        lines.append(f"{name}_sum{{{labels}}} {self.sum}")
+        lines.append(f"{name}_count{{{labels}}} {self.count}")
+        return lines
 
 
 class Benchmark(BaseComponent):
@@ -16,19 +92,24 @@ class Benchmark(BaseComponent):
     def __init__(self, enable_benchmark, inference_type, tokenizer=None, bench_hook=None):
         super().__init__()
         self.enabled = enable_benchmark
-        self.vllm_metrics = {}
-        if inference_type == InferenceType.VLLM:
-            self.is_vllm = True
-            self.vllm_metrics = self.get_vllm_metrics()
-        else:
-            self.is_vllm = False
+        self.is_vllm = inference_type == InferenceType.VLLM
         self.tokenizer = tokenizer
         self.bench_hook = bench_hook
+        self.max_records = BENCHMARK_MAX_RECORDS
 
-        self.benchmark_data_list = {}
-        self.llm_data_list = {}
+        # Ring buffers keyed by request index, bounded by max_records
+        self.benchmark_data_list = OrderedDict()
+        self.llm_data_list = OrderedDict()
 
-        self._idx_lock = threading.Lock()
+        # Aggregates over every request since the benchmark was created, records evicted from the
+        # ring buffers are still counted here
+        self.stage_histograms = {stage.value: StreamingHistogram() for stage in LATENCY_STAGES}
+        self.llm_histograms = {metric: StreamingHistogram() for metric in LLM_LATENCY_METRICS}
+        self.request_count = 0
+        self.prompt_tokens_total = 0
+        self.completion_tokens_total = 0
+
+        self._lock = threading.Lock()
         self.last_idx = 0
         self.dict_idx = 0
 
@@ -52,6 +133,12 @@ class Benchmark(BaseComponent):
             input_token_size = -1
         return input_token_size
 
+    def _append_record(self, records: OrderedDict, idx, data) -> None:
+        records[idx] = data
+        records.move_to_end(idx)
+        while len(records) > self.max_records:
+            records.popitem(last=False)
+
     def init_benchmark_data(self):
         pipeline_comp = [
             CompType.NODEPARSER,
@@ -60,100 +147,160 @@ class Benchmark(BaseComponent):
             CompType.QUERYSEARCH,
             CompType.GENERATOR,
             BenchType.CHUNK_NUM,
+            BenchType.QUERYSEARCH_BREAKDOWN,
         ]
         if self.is_enabled():
-            with self._idx_lock:
-                self.last_idx += 1
-                idx = self.last_idx
             data = {}
-            data["idx"] = idx
             for comp in pipeline_comp:
                 data[comp] = ""
             data[CompType.NODEPARSER] = 0
             data[BenchType.CHUNK_NUM] = 0
-            self.benchmark_data_list[idx] = data
+            data[BenchType.QUERYSEARCH_BREAKDOWN] = {}
+            with self._lock:
+                self.last_idx += 1
+                idx = self.last_idx
+                data["idx"] = idx
+                self._append_record(self.benchmark_data_list, idx, data)
+                self.request_count += 1
             return idx
 
     def update_benchmark_data(self, idx, comp_type, data):
-        if self.is_enabled() and idx in self.benchmark_data_list and comp_type in self.benchmark_data_list[idx]:
-            self.benchmark_data_list[idx][comp_type] = data
+        if not self.is_enabled():
+            return
+        with self._lock:
+            record = self.benchmark_data_list.get(idx)
+            if record is None or comp_type not in record:
+                return
+            record[comp_type] = data
+            stage = getattr(comp_type, "value", comp_type)
+            if stage in self.stage_histograms and isinstance(data, (int, float)):
+                self.stage_histograms[stage].observe(data)
+            elif comp_type == BenchType.QUERYSEARCH_BREAKDOWN:
+                # Query search sub stages, each gets its own histogram
+                for sub_stage, seconds in data.items():
+                    name = f"{CompType.QUERYSEARCH.value}_{sub_stage}"
+                    self.stage_histograms.setdefault(name, StreamingHistogram()).observe(seconds)
 
     def get_benchmark_data(self, idx, comp_type):
-        if self.is_enabled() and idx in self.benchmark_data_list and comp_type in self.benchmark_data_list[idx]:
-            return self.benchmark_data_list[idx][comp_type]
-        else:
+        if not self.is_enabled():
             return None
+        with self._lock:
+            record = self.benchmark_data_list.get(idx)
+            if record is not None and comp_type in record:
+                return record[comp_type]
+        return None
 
-    def insert_llm_data(self, idx, input_token_size=-1):
-        if self.is_enabled():
-            if self.is_vllm:
-                metrics = self.get_vllm_metrics()
-            else:
-                bench_hook = self.bench_hook
-                if bench_hook:
-                    metrics = {}
-                    tm_list = bench_hook.get_time_list()
-                    tm_infer_list = bench_hook.get_time_infer_list()
-                    metrics["input_token_size"] = input_token_size
-                    metrics["output_token_size"] = len(tm_list)
-                    metrics["generation_time"] = sum(tm_list)
-                    metrics["first_token_latency"] = tm_list[0] if len(tm_list) > 0 else ""
-                    metrics["other_tokens_avg_latency"] = (
-                        sum(tm_list[1:]) / len(tm_list[1:]) if len(tm_list) > 1 else ""
-                    )
-                    bench_hook.clear_time_list()
-                    bench_hook.clear_time_infer_list()
-                else:
-                    metrics = None
-
-            self.llm_data_list[idx] = metrics
-
-    def get_vllm_metrics(self):
-        # self.vllm_metrics is the previous vllm metric
-        vllm_metrics = [
-            "vllm:prompt_tokens_total",
-            "vllm:generation_tokens_total",
-            "vllm:time_to_first_token_seconds_sum",
-            "vllm:time_per_output_token_seconds_sum",
-            "vllm:e2e_request_latency_seconds_sum",
-        ]
-        metrics = self.vllm_metrics.copy()
-        if metrics == {}:
-            for key in vllm_metrics:
-                metrics[key] = 0
-
-        llm_endpoint = os.getenv("vLLM_ENDPOINT", "http://localhost:8086")
-        response = requests.get(f"{llm_endpoint}/metrics", headers={"Content-Type": "application/json"})
-        if response.status_code == 200:
-            metrics_data = text_string_to_metric_families(response.text)
+    def insert_llm_data(self, idx, input_token_size=-1, usage=None, first_token_latency=None, generation_time=None):
+        """Record the LLM metrics of one request.
+
+        vLLM requests take their token counts from the usage of their own response, so concurrent
+        requests do not see each other's tokens. Local inference reads the timings of the bench hook.
+        """
+        if not self.is_enabled():
+            return
+        if self.is_vllm:
+            metrics = self._vllm_request_metrics(input_token_size, usage, first_token_latency, generation_time)
         else:
-            return {}
-
-        parsed_metrics = {}
-        for family in metrics_data:
-            for sample in family.samples:
-                parsed_metrics[sample.name] = sample
-
-        current_metrics = {}
-        for metric in vllm_metrics:
-            if metric in parsed_metrics:
-                parsed_value = parsed_metrics[metric].value
-                current_metrics[metric] = parsed_value
-                # save single request's metric to metrics by subtracting
-                metrics[metric] = parsed_value - metrics[metric]
-        # update self.vllm_metrics to current vllm request's metric
-        self.vllm_metrics = current_metrics
+            bench_hook = self.bench_hook
+            if bench_hook:
+                metrics = {}
+                tm_list = bench_hook.get_time_list()
+                tm_infer_list = bench_hook.get_time_infer_list()
+                metrics["input_token_size"] = input_token_size
+                metrics["output_token_size"] = len(tm_list)
+                metrics["generation_time"] = sum(tm_list)
+                metrics["first_token_latency"] = tm_list[0] if len(tm_list) > 0 else ""
+                metrics["other_tokens_avg_latency"] = sum(tm_list[1:]) / len(tm_list[1:]) if len(tm_list) > 1 else ""
+                bench_hook.clear_time_list()
+                bench_hook.clear_time_infer_list()
+            else:
+                metrics = None
+
+        with self._lock:
+            self._append_record(self.llm_data_list, idx, metrics)
+            if not metrics:
+                return
+            if isinstance(metrics["input_token_size"], int) and metrics["input_token_size"] > 0:
+                self.prompt_tokens_total += metrics["input_token_size"]
+            if isinstance(metrics["output_token_size"], int) and metrics["output_token_size"] > 0:
+                self.completion_tokens_total += metrics["output_token_size"]
+            for metric, histogram in self.llm_histograms.items():
+                if isinstance(metrics.get(metric), (int, float)):
+                    histogram.observe(metrics[metric])
+
+    @staticmethod
+    def _vllm_request_metrics(input_token_size, usage, first_token_latency, generation_time):
+        usage = usage or {}
+        prompt_tokens = usage.get("prompt_tokens")
+        completion_tokens = usage.get("completion_tokens")
+        metrics = {
+            "input_token_size": prompt_tokens if prompt_tokens is not None else input_token_size,
+            "output_token_size": completion_tokens if completion_tokens is not None else -1,
+            "generation_time": generation_time if generation_time is not None else "",
+            "first_token_latency": first_token_latency if first_token_latency is not None else "",
+            "other_tokens_avg_latency": "",
+        }
+        if (
+            generation_time is not None
+            and first_token_latency is not None
+            and completion_tokens is not None
+            and completion_tokens > 1
+        ):
+            metrics["other_tokens_avg_latency"] = (generation_time - first_token_latency) / (completion_tokens - 1)
         return metrics
 
+    def get_records(self) -> Dict[str, Dict]:
+        with self._lock:
+            return {"pipeline_bench": dict(self.benchmark_data_list), "llm_bench": dict(self.llm_data_list)}
+
+    def get_summary(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "requests": self.request_count,
+                "prompt_tokens_total": self.prompt_tokens_total,
+                "completion_tokens_total": self.completion_tokens_total,
+                "stages": {stage: h.summary() for stage, h in self.stage_histograms.items()},
+                "llm": {metric: h.summary() for metric, h in self.llm_histograms.items()},
+            }
+
+    def prometheus_text(self, pipeline: str = "") -> str:
+        """Aggregates in the Prometheus text exposition format."""
+        base_labels = f'pipeline="{_label_value(pipeline)}"'
+        lines = [
+            "# HELP edgecraftrag_requests_total Requests recorded by the benchmark.",
+            "# TYPE edgecraftrag_requests_total counter",
+        ]
+        with self._lock:
+            lines.append(f"edgecraftrag_requests_total{{{base_labels}}} {self.request_count}")
+            lines += [
+                "# HELP edgecraftrag_llm_tokens_total Tokens reported by the LLM, per request usage.",
+                "# TYPE edgecraftrag_llm_tokens_total counter",
+                f'edgecraftrag_llm_tokens_total{{{base_labels},type="prompt"}} {self.prompt_tokens_total}',
+                f'edgecraftrag_llm_tokens_total{{{base_labels},type="completion"}} {self.completion_tokens_total}',
+                "# HELP edgecraftrag_stage_latency_seconds Latency of each pipeline stage.",
+                "# TYPE edgecraftrag_stage_latency_seconds histogram",
+            ]
+            for stage, histogram in self.stage_histograms.items():
+                lines += histogram.prometheus_lines(
+                    "edgecraftrag_stage_latency_seconds", f'{base_labels},stage="{_label_value(stage)}"'
+                )
+            for metric, histogram in self.llm_histograms.items():
+                name = f"edgecraftrag_llm_{metric}_seconds"
+                lines += [f"# HELP {name} LLM {metric.replace('_', ' ')}.", f"# TYPE {name} histogram"]
+                lines += histogram.prometheus_lines(name, base_labels)
+        return "\n".join(lines) + "\n"
+
     @model_serializer
     def ser_model(self):
         if self.enabled:
+            with self._lock:
+                last_benchmark_data = self.benchmark_data_list.get(self.dict_idx)
+                llm_metrics = self.llm_data_list.get(self.dict_idx)
             set = {
                 "Benchmark enabled": self.enabled,
-                "last_benchmark_data": (
-                    self.benchmark_data_list[self.dict_idx] if self.dict_idx in self.benchmark_data_list else None
-                ),
-                "llm_metrics": self.llm_data_list[self.dict_idx] if self.dict_idx in self.llm_data_list else None,
+                "last_benchmark_data": last_benchmark_data,
+                "llm_metrics": llm_metrics,
+                "summary": self.get_summary(),
             }
         else:
             set = {
@@ -0,0 +1,216 @@
+# Copyright (C) 2025 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+import heapq
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional
+
+from edgecraftrag.env import BM25_INDEX_DIR
+from llama_index.core.schema import BaseNode, NodeWithScore
+from llama_index.core.storage.docstore.utils import doc_to_json, json_to_doc
+from nltk.stem.snowball import SnowballStemmer
+
+# CJK characters are indexed one by one, any other run of Unicode word characters is a word
+_TOKEN_PATTERN = re.compile(r"[\u4e00-\u9fff]|[^\W\u4e00-\u9fff]+")
+_STOPWORDS = frozenset("a an and are as at be by for from in is it of on or that the this to was with".split())
+_stemmer = SnowballStemmer("english")
+
+
+@lru_cache(maxsize=100000)
+def _stem(token: str) -> str:
+    # Same english snowball stemming as the BM25 retriever this index replaced, other scripts pass through
+    return _stemmer.stem(token)
+
+
+def tokenize(text: str) -> List[str]:
+    return [_stem(tok) for tok in _TOKEN_PATTERN.findall(text.lower()) if tok not in _STOPWORDS]
+
+
+class BM25Index:
+    """Okapi BM25 inverted index that is updated node by node and persisted per knowledge base.
+
+    Nodes are stored together with their postings so the index can serve any vector store
+    backend (including Milvus, whose nodes never reach the llama-index docstore). They are persisted
+    as one SQLite row per node, so an update writes only the nodes it adds or removes.
+    """
+
+    def __init__(self, kb_name: str, k1: float = 1.5, b: float = 0.75, index_dir: str = BM25_INDEX_DIR):
+        self.kb_name = kb_name
+        self.k1 = k1
+        self.b = b
+        self.index_path = os.path.join(index_dir, f"{kb_name}.db")
+        self._lock = threading.RLock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._doc_lens: Dict[str, int] = {}
+        self._total_len = 0
+        self._nodes: Dict[str, BaseNode] = {}
+        self._ref_doc_map: Dict[str, List[str]] = {}
+        self.load()
+
+    def __len__(self) -> int:
+        return len(self._nodes)
+
+    def _add_node(self, node: BaseNode) -> None:
+        node_id = node.node_id
+        if node_id in self._nodes:
+            self._remove_node(node_id)
+        term_freqs = Counter(tokenize(node.get_content()))
+        for term, freq in term_freqs.items():
+            self._postings.setdefault(term, {})[node_id] = freq
+        doc_len = sum(term_freqs.values())
+        self._doc_lens[node_id] = doc_len
+        self._total_len += doc_len
+        self._nodes[node_id] = node
+        if node.ref_doc_id:
+            self._ref_doc_map.setdefault(node.ref_doc_id, []).append(node_id)
+
+    def _remove_node(self, node_id: str) -> None:
+        node = self._nodes.pop(node_id, None)
+        if node is None:
+            return
+        for term in set(tokenize(node.get_content())):
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            postings.pop(node_id, None)
+            if not postings:
+                del self._postings[term]
+        self._total_len -= self._doc_lens.pop(node_id, 0)
+        if node.ref_doc_id in self._ref_doc_map:
+            node_ids = self._ref_doc_map[node.ref_doc_id]
+            if node_id in node_ids:
+                node_ids.remove(node_id)
+            if not node_ids:
+                del self._ref_doc_map[node.ref_doc_id]
+
+    def add_nodes(self, nodes: Iterable[BaseNode], persist: bool = True) -> None:
+        with self._lock:
+            nodes = list(nodes)
+            for node in nodes:
+                self._add_node(node)
+            if persist:
+                self._persist_nodes(nodes)
+
+    def delete_nodes(self, node_ids: Iterable[str], persist: bool = True) -> None:
+        with self._lock:
+            node_ids = [node_id for node_id in node_ids if node_id in self._nodes]
+            for node_id in node_ids:
+                self._remove_node(node_id)
+            if persist:
+                self._unpersist_nodes(node_ids)
+
+    def delete_ref_docs(self, ref_doc_ids: Iterable[str], persist: bool = True) -> None:
+        with self._lock:
+            node_ids = [node_id for ref_doc_id in ref_doc_ids for node_id in self._ref_doc_map.get(ref_doc_id, [])]
+            self.delete_nodes(node_ids, persist=persist)
+
+    def rebuild(self, nodes: Iterable[BaseNode]) -> None:
+        with self._lock:
+            self.clear(persist=False)
+            self.add_nodes(nodes, persist=False)
+            self.save()
+
+    def clear(self, persist: bool = True) -> None:
+        with self._lock:
+            self._postings = {}
+            self._doc_lens = {}
+            self._total_len = 0
+            self._nodes = {}
+            self._ref_doc_map = {}
+            if persist:
+                self.save()
+
+    def retrieve(self, query: str, top_k: int) -> List[NodeWithScore]:
+        with self._lock:
+            num_docs = len(self._nodes)
+            if num_docs == 0 or top_k <= 0:
+                return []
+            avg_len = self._total_len / num_docs if self._total_len else 1.0
+            scores: Dict[str, float] = {}
+            for term in set(tokenize(query)):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                df = len(postings)
+                idf = math.log(1 + (num_docs - df + 0.5) / (df + 0.5))
+                for node_id, freq in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * self._doc_lens[node_id] / avg_len)
+                    scores[node_id] = scores.get(node_id, 0.0) + idf * freq * (self.k1 + 1) / (freq + norm)
+            top = heapq.nlargest(min(top_k, len(scores)), scores.items(), key=lambda item: item[1])
+            return [NodeWithScore(node=self._nodes[node_id], score=score) for node_id, score in top]
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+            conn = sqlite3.connect(self.index_path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            conn.execute("CREATE TABLE IF NOT EXISTS nodes (node_id TEXT PRIMARY KEY, node TEXT NOT NULL)")
+            self._conn = conn
+        return self._conn
+
+    def _persist_nodes(self, nodes: List[BaseNode]) -> None:
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO nodes (node_id, node) VALUES (?, ?)",
+                [(node.node_id, json.dumps(doc_to_json(node), ensure_ascii=False)) for node in nodes],
+            )
+
+    def _unpersist_nodes(self, node_ids: List[str]) -> None:
+        conn = self._connect()
+        with conn:
+            conn.executemany("DELETE FROM nodes WHERE node_id = ?", [(node_id,) for node_id in node_ids])
+
+    def save(self) -> None:
+        """Rewrite the whole persisted index, incremental updates only write the nodes they touch."""
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute("DELETE FROM nodes")
+                conn.executemany(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", [("k1", self.k1), ("b", self.b)]
+                )
+                conn.executemany(
+                    "INSERT INTO nodes (node_id, node) VALUES (?, ?)",
+                    [
+                        (node_id, json.dumps(doc_to_json(node), ensure_ascii=False))
+                        for node_id, node in self._nodes.items()
+                    ],
+                )
+
+    def load(self) -> bool:
+        if not os.path.isfile(self.index_path):
+            return False
+        try:
+            conn = self._connect()
+            meta = dict(conn.execute("SELECT key, value FROM meta").fetchall())
+            nodes = [json_to_doc(json.loads(row[0])) for row in conn.execute("SELECT node FROM nodes")]
+        except (sqlite3.Error, ValueError) as e:
+            print(f"Load BM25 index {self.index_path} failed: {e}")
+            return False
+        with self._lock:
+            self.k1 = float(meta.get("k1", self.k1))
+            self.b = float(meta.get("b", self.b))
+            self.clear(persist=False)
+            self.add_nodes(nodes, persist=False)
+        return True
+
+    def remove_persisted(self) -> None:
+        with self._lock:
+            self.clear(persist=False)
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+            for path in (self.index_path, self.index_path + "-wal", self.index_path + "-shm"):
+                if os.path.exists(path):
+                    os.remove(path)
@@ -1,8 +1,12 @@
 # Copyright (C) 2024 Intel Corporation
 # SPDX-License-Identifier: Apache-2.0
 
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import groupby
 from pathlib import Path
-from typing import Any, List, Optional
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 
 from edgecraftrag.base import BaseComponent, CompType, FileType
 from llama_index.core.schema import Document
@@ -13,8 +17,15 @@ class File(BaseComponent):
     file_path: str = Field(default="")
     comp_subtype: str = Field(default="")
     documents: List[Document] = Field(default=[])
+    docs_count: int = Field(default=0)
 
-    def __init__(self, file_name: Optional[str] = None, file_path: Optional[str] = None, content: Optional[str] = None):
+    def __init__(
+        self,
+        file_name: Optional[str] = None,
+        file_path: Optional[str] = None,
+        content: Optional[str] = None,
+        documents: Optional[List[Document]] = None,
+    ):
         super().__init__(comp_type=CompType.FILE)
 
         if not file_name and not file_path:
@@ -27,10 +38,36 @@ class File(BaseComponent):
             self.name = _path.name
         self.file_path = _path
         self.comp_subtype = FileType.TEXT
-        if _path and _path.exists():
+        if documents is not None:
+            # Already loaded, e.g. by iter_file_documents
+            self.documents.extend(documents)
+        elif _path and _path.exists():
             self.documents.extend(convert_file_to_documents(_path))
         if content:
             self.documents.extend(convert_text_to_documents(content))
+        self.docs_count = len(self.documents)
+        # Ids of released documents, given back to them when they are read again
+        self._doc_ids: List[str] = []
+        self._released = False
+
+    def get_documents(self) -> List[Document]:
+        """The file's documents, read again from disk (and not kept) once they were released."""
+        if not self._released:
+            return self.documents
+        documents = convert_file_to_documents(self.file_path)
+        if self._doc_ids and len(documents) == len(self._doc_ids):
+            # Same ids as the records the knowledge bases keep for the file
+            for doc, doc_id in zip(documents, self._doc_ids):
+                doc.id_ = doc_id
+        self.docs_count = len(documents)
+        return documents
+
+    def release_documents(self) -> None:
+        # Only a file on disk can be read again, documents of text content are kept
+        if self.file_path and not self._released:
+            self._doc_ids = [doc.doc_id for doc in self.documents]
+            self.documents = []
+            self._released = True
 
     def run(self, **kwargs) -> Any:
         pass
@@ -42,7 +79,7 @@ class File(BaseComponent):
             "file_id": self.idx,
             "file_type": self.comp_subtype,
             "file_path": str(self.file_path),
-            "docs_count": len(self.documents),
+            "docs_count": self.docs_count,
         }
         return set
 
@@ -51,14 +88,89 @@ def convert_text_to_documents(text) -> List[Document]:
     return [Document(text=text, metadata={"file_name": "text"})]
 
 
+SUPPORTED_EXTS = [".pdf", ".txt", ".doc", ".docx", ".pptx", ".ppt", ".csv", ".md", ".html", ".rst", ".epub"]
+
+# suffix -> reader instance, created once and shared by every load of that file type
+_file_readers: Dict[str, Any] = {}
+_file_readers_lock = threading.Lock()
+
+
+def _file_extractor(suffix: str) -> Dict[str, Any]:
+    from llama_index.core import SimpleDirectoryReader
+
+    with _file_readers_lock:
+        if suffix not in _file_readers:
+            reader_cls = SimpleDirectoryReader.supported_suffix_fn().get(suffix)
+            # None: no dedicated reader, the file is read as plain text
+            _file_readers[suffix] = reader_cls() if reader_cls else None
+        reader = _file_readers[suffix]
+    return {suffix: reader} if reader else {}
+
+
+def _load_batch(file_paths: List[Path]) -> List[Tuple[Path, List[Document]]]:
+    from llama_index.core import SimpleDirectoryReader
+
+    # Removed since they were listed, the reader refuses missing files
+    file_paths = [file_path for file_path in file_paths if file_path.is_file()]
+    if not file_paths:
+        return []
+    # One reader for the whole batch, all files share the suffix and so the file extractor
+    reader = SimpleDirectoryReader(input_files=file_paths, file_extractor=_file_extractor(file_paths[0].suffix.lower()))
+    results = []
+    for input_file in reader.input_files:
+        docs = SimpleDirectoryReader.load_file(
+            input_file=input_file,
+            file_metadata=reader.file_metadata,
+            file_extractor=reader.file_extractor,
+            encoding=reader.encoding,
+            errors=reader.errors,
+            fs=reader.fs,
+        )
+        results.append((input_file, reader._exclude_metadata(docs)))
+    return results
+
+
+def iter_file_documents(
+    file_paths: Iterable, batch_size: int = 16, executor: Optional[ThreadPoolExecutor] = None, max_workers: int = 4
+) -> Iterator[Tuple[Path, List[Document]]]:
+    """Load files in batches grouped by type, yielding (file_path, documents) batch by batch.
+
+    Batches run on the executor (or a pool of max_workers threads) and at most two per worker are in
+    flight, so only a bounded part of the corpus is held at once whatever the number of files.
+    """
+    paths = sorted((Path(file_path) for file_path in file_paths), key=lambda path: path.suffix.lower())
+    batches = []
+    for _, group in groupby(paths, key=lambda path: path.suffix.lower()):
+        group = list(group)
+        batches.extend(group[i : i + batch_size] for i in range(0, len(group), batch_size))
+    if not batches:
+        return
+
+    own_executor = executor is None
+    executor = executor or ThreadPoolExecutor(max_workers=max_workers)
+    max_in_flight = 2 * max(1, getattr(executor, "_max_workers", max_workers))
+    pending = deque()
+    try:
+        for batch in batches:
+            if len(pending) >= max_in_flight:
+                yield from pending.popleft().result()
+            pending.append(executor.submit(_load_batch, batch))
+        while pending:
+            yield from pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+        if own_executor:
+            executor.shutdown(wait=False)
+
+
 def convert_file_to_documents(file_path) -> List[Document]:
     from llama_index.core import SimpleDirectoryReader
 
-    supported_exts = [".pdf", ".txt", ".doc", ".docx", ".pptx", ".ppt", ".csv", ".md", ".html", ".rst", ".epub"]
     if file_path.is_dir():
-        docs = SimpleDirectoryReader(input_dir=file_path, recursive=True, required_exts=supported_exts).load_data()
+        docs = SimpleDirectoryReader(input_dir=file_path, recursive=True, required_exts=SUPPORTED_EXTS).load_data()
     elif file_path.is_file():
-        docs = SimpleDirectoryReader(input_files=[file_path], required_exts=supported_exts).load_data()
+        docs = [doc for _, file_docs in _load_batch([file_path]) for doc in file_docs]
     else:
         docs = []
 
@@ -0,0 +1,170 @@
+# Copyright (C) 2025 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+import asyncio
+import os
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+
+import httpx
+
+
+class BatchingEmbeddingClient:
+    """Client for an OpenAI compatible embeddings endpoint that batches concurrent queries.
+
+    Queries arriving within batch_window seconds of the first pending one, up to max_batch_size,
+    are sent as a single request with a list input. If a batched request fails its queries are
+    sent one by one, and batching is turned off for good when the server rejects list inputs.
+    Connections are pooled and kept alive between requests.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        model: str,
+        batch_window: float = 0.005,
+        max_batch_size: int = 32,
+        batching: bool = True,
+        pool_size: int = 20,
+        timeout: float = 60.0,
+    ):
+        self.url = url
+        self.model = model
+        self.batch_window = batch_window
+        self.max_batch_size = max_batch_size
+        self.batching = batching
+        self.limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        self.timeout = timeout
+        self.http_client = httpx.Client(limits=self.limits, timeout=timeout)
+        self.stats = {"requests": 0, "queries": 0, "batched_requests": 0, "fallback_requests": 0}
+        # Async state, bound to the event loop of the first caller
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._async_client: Optional[httpx.AsyncClient] = None
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._send_tasks: Set[asyncio.Task] = set()
+
+    def _payload(self, texts: List[str]) -> Dict:
+        # A single query is sent as a plain string, as servers without list support expect
+        return {"model": self.model, "input": texts if len(texts) > 1 else texts[0]}
+
+    @staticmethod
+    def _embeddings(body: Dict, count: int) -> List[List[float]]:
+        data = sorted(body["data"], key=lambda item: item.get("index", 0))
+        if len(data) != count:
+            raise ValueError(f"Expected {count} embeddings, got {len(data)}")
+        return [item["embedding"] for item in data]
+
+    def embed_sync(self, text: str) -> List[float]:
+        """Embed one query with a blocking request, for callers outside the event loop."""
+        response = self.http_client.post(self.url, json=self._payload([text]))
+        response.raise_for_status()
+        self.stats["requests"] += 1
+        self.stats["queries"] += 1
+        return self._embeddings(response.json(), 1)[0]
+
+    def _bind_loop(self) -> asyncio.AbstractEventLoop:
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._async_client = httpx.AsyncClient(limits=self.limits, timeout=self.timeout)
+            self._pending = []
+            self._flush_handle = None
+        return loop
+
+    async def _post(self, texts: List[str]) -> List[List[float]]:
+        response = await self._async_client.post(self.url, json=self._payload(texts))
+        response.raise_for_status()
+        self.stats["requests"] += 1
+        self.stats["queries"] += len(texts)
+        return self._embeddings(response.json(), len(texts))
+
+    async def embed(self, text: str) -> List[float]:
+        loop = self._bind_loop()
+        if not self.batching or self.max_batch_size <= 1:
+            return (await self._post([text]))[0]
+        future = loop.create_future()
+        self._pending.append((text, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.batch_window, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        # Callers that timed out meanwhile are not sent
+        batch = [(text, future) for text, future in batch if not future.done()]
+        if batch:
+            task = self._loop.create_task(self._send(batch))
+            self._send_tasks.add(task)
+            task.add_done_callback(self._send_tasks.discard)
+
+    async def _send(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        texts = [text for text, _ in batch]
+        try:
+            results = await self._post(texts)
+            if len(batch) > 1:
+                self.stats["batched_requests"] += 1
+        except Exception as e:
+            if len(batch) == 1:
+                results = [e]
+            else:
+                print(f"Batched embedding request to {self.url} failed, sending {len(batch)} queries one by one: {e}")
+                self.stats["fallback_requests"] += len(batch)
+                singles = await asyncio.gather(*[self._post([text]) for text in texts], return_exceptions=True)
+                results = [res if isinstance(res, BaseException) else res[0] for res in singles]
+                rejected = isinstance(e, httpx.HTTPStatusError) and 400 <= e.response.status_code < 500
+                if rejected and not any(isinstance(res, BaseException) for res in singles):
+                    # Every query is accepted on its own, so the server refuses list input, not one bad query
+                    self.batching = False
+                    print(f"Embedding server {self.url} rejects batched requests, batching disabled")
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def get_metrics(self) -> Dict:
+        return dict(self.stats, batching=self.batching, pending=len(self._pending))
+
+
+class EmbeddingClientRegistry:
+    """Process-wide embedding clients, one per (endpoint, model) so concurrent queries can share batches."""
+
+    def __init__(self):
+        self.batch_window = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "5")) / 1000
+        self.max_batch_size = int(os.getenv("EMBEDDING_MAX_BATCH_SIZE", "32"))
+        self.batching = os.getenv("EMBEDDING_BATCHING", "True").lower() == "true"
+        self.pool_size = int(os.getenv("EMBEDDING_POOL_SIZE", "20"))
+        self._clients: Dict[Tuple[str, str], BatchingEmbeddingClient] = {}
+        self._lock = threading.Lock()
+
+    def get_client(self, url: str, model: str) -> BatchingEmbeddingClient:
+        key = (url, model)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = BatchingEmbeddingClient(
+                    url,
+                    model,
+                    batch_window=self.batch_window,
+                    max_batch_size=self.max_batch_size,
+                    batching=self.batching,
+                    pool_size=self.pool_size,
+                )
+                self._clients[key] = client
+            return client
+
+    def get_metrics(self) -> Dict:
+        with self._lock:
+            clients = dict(self._clients)
+        return {f"{url}|{model}": client.get_metrics() for (url, model), client in clients.items()}
+
+
+embedding_client_registry = EmbeddingClientRegistry()
@@ -0,0 +1,146 @@
+# Copyright (C) 2025 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+import heapq
+import math
+import os
+import threading
+from typing import Callable, Dict, Iterable, List, Optional
+
+import numpy
+from edgecraftrag.components.bm25 import tokenize
+from llama_index.core.base.embeddings.base import BaseEmbedding
+
+
+class ExperienceIndex:
+    """In-memory index over experience questions, used to shortlist candidates before LLM matching.
+
+    The experience knowledge base keeps it up to date on every write. Question embeddings are
+    cached by text, so only new or edited questions are embedded. Without an embedding model the
+    shortlist falls back to lexical overlap.
+    """
+
+    def __init__(self, top_k: Optional[int] = None):
+        # 0 disables the prefilter and every experience is scored by the LLM
+        self.top_k = top_k if top_k is not None else int(os.getenv("EXPERIENCE_PREFILTER_TOPK", "5"))
+        self._lock = threading.RLock()
+        self._experiences: Dict[str, Dict] = {}
+        self._loader: Optional[Callable[[], List[Dict]]] = None
+        self._loaded = False
+        self._embed_model_key = None
+        self._embeddings: Dict[str, numpy.ndarray] = {}
+        self._matrix: Optional[numpy.ndarray] = None
+        self._matrix_ids: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self._experiences)
+
+    @property
+    def attached(self) -> bool:
+        return self._loader is not None
+
+    def attach(self, loader: Callable[[], List[Dict]]) -> None:
+        # The loader is called once, on first use, to seed the index from storage
+        with self._lock:
+            self._loader = loader
+            self._loaded = False
+
+    def ensure_loaded(self) -> None:
+        with self._lock:
+            if self._loaded or self._loader is None:
+                return
+            self.rebuild(self._loader())
+
+    def rebuild(self, experiences: Iterable[Dict]) -> None:
+        with self._lock:
+            self._experiences = {}
+            self._loaded = True
+            self.upsert(experiences)
+            questions = {exp["question"] for exp in self._experiences.values()}
+            self._embeddings = {q: v for q, v in self._embeddings.items() if q in questions}
+
+    def upsert(self, experiences: Iterable[Dict]) -> None:
+        with self._lock:
+            for exp in experiences:
+                if exp.get("idx") and exp.get("question"):
+                    self._experiences[exp["idx"]] = exp
+            self._matrix = None
+
+    def delete(self, exp_idx: str) -> None:
+        with self._lock:
+            if self._experiences.pop(exp_idx, None) is not None:
+                self._matrix = None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._experiences = {}
+            self._embeddings = {}
+            self._matrix = None
+            self._loaded = True
+
+    def _set_embed_model(self, embed_model: BaseEmbedding) -> None:
+        key = (type(embed_model).__name__, getattr(embed_model, "model_name", None), id(embed_model))
+        if key != self._embed_model_key:
+            self._embed_model_key = key
+            self._embeddings = {}
+            self._matrix = None
+
+    def _build_matrix(self, embed_model: BaseEmbedding) -> None:
+        missing = list({exp["question"] for exp in self._experiences.values()} - self._embeddings.keys())
+        if missing:
+            vectors = embed_model.get_text_embedding_batch(missing)
+            for question, vector in zip(missing, vectors):
+                vector = numpy.asarray(vector, dtype=numpy.float32)
+                norm = numpy.linalg.norm(vector)
+                self._embeddings[question] = vector / norm if norm else vector
+        self._matrix_ids = list(self._experiences.keys())
+        self._matrix = numpy.stack([self._embeddings[self._experiences[idx]["question"]] for idx in self._matrix_ids])
+
+    def _embedding_scores(self, query: str, embed_model: BaseEmbedding) -> Dict[str, float]:
+        self._set_embed_model(embed_model)
+        if self._matrix is None:
+            self._build_matrix(embed_model)
+        query_vector = numpy.asarray(embed_model.get_query_embedding(query), dtype=numpy.float32)
+        norm = numpy.linalg.norm(query_vector)
+        if norm:
+            query_vector = query_vector / norm
+        return dict(zip(self._matrix_ids, (self._matrix @ query_vector).tolist()))
+
+    def _lexical_scores(self, query: str) -> Dict[str, float]:
+        query_terms = set(tokenize(query))
+        scores = {}
+        for idx, exp in self._experiences.items():
+            terms = set(tokenize(exp["question"]))
+            scores[idx] = len(query_terms & terms) / math.sqrt(len(terms)) if terms else 0.0
+        return scores
+
+    def candidates(
+        self, query: str, embed_model: Optional[BaseEmbedding] = None, top_k: Optional[int] = None
+    ) -> List[Dict]:
+        top_k = self.top_k if top_k is None else top_k
+        with self._lock:
+            if top_k <= 0 or len(self._experiences) <= top_k:
+                return list(self._experiences.values())
+            scores = None
+            if isinstance(embed_model, BaseEmbedding):
+                try:
+                    scores = self._embedding_scores(query, embed_model)
+                except Exception as e:
+                    print(f"Experience embedding prefilter failed, falling back to lexical match: {e}")
+                    self._matrix = None
+            if scores is None:
+                scores = self._lexical_scores(query)
+            ranked = heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+            return [self._experiences[idx] for idx, _ in ranked]
+
+
+def get_embed_model(kbs) -> Optional[BaseEmbedding]:
+    # Experiences have no indexer of their own, reuse the embedding model of an active knowledge base
+    for kb in kbs or []:
+        model = getattr(kb.indexer, "model", None)
+        if isinstance(model, BaseEmbedding):
+            return model
+    return None
+
+
+experience_index = ExperienceIndex()
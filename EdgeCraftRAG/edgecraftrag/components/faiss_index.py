@@ -0,0 +1,196 @@
+# Copyright (C) 2025 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+import dataclasses
+import math
+import time
+from typing import Any, Dict, List, Optional, Set
+
+import faiss
+import numpy
+from edgecraftrag.base import FaissIndexType
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores.types import VectorStoreQuery, VectorStoreQueryResult
+from llama_index.vector_stores.faiss import FaissVectorStore
+
+FAISS_DEFAULT_PARAMS = {
+    # IVF / IVF-PQ: number of coarse clusters and how many of them are scanned per query
+    "nlist": 100,
+    "nprobe": 8,
+    # HNSW: graph degree, build-time and search-time candidate list sizes
+    "hnsw_m": 32,
+    "ef_construction": 200,
+    "ef_search": 64,
+    # IVF-PQ: number of sub-quantizers and bits per code
+    "pq_m": 48,
+    "pq_nbits": 8,
+    # IVF / IVF-PQ: vectors are kept in a flat index until the corpus reaches min_train_size, an index
+    # trained with reduced nlist / PQ codes is retrained once the corpus grows retrain_growth times
+    "min_train_size": 1000,
+    "retrain_growth": 2.0,
+}
+
+
+def get_faiss_params(params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    if hasattr(params, "model_dump"):
+        # FaissParamsIn from a request, already validated
+        params = params.model_dump(exclude_none=True)
+    merged = dict(FAISS_DEFAULT_PARAMS)
+    merged.update({k: v for k, v in (params or {}).items() if v is not None})
+    return merged
+
+
+def _pq_m(d: int, pq_m: int) -> int:
+    # The vector dimension must be a multiple of the number of sub-quantizers
+    for m in range(min(pq_m, d), 0, -1):
+        if d % m == 0:
+            return m
+    return 1
+
+
+def build_faiss_index(d: int, index_type: str, params: Dict[str, Any], num_train: Optional[int] = None) -> faiss.Index:
+    """Create an empty index, IVF based types still need to be trained before vectors are added.
+
+    When the number of training vectors is known, nlist and the PQ code size are capped so that
+    small corpora can still be trained.
+    """
+    nlist = params["nlist"]
+    nbits = params["pq_nbits"]
+    if num_train is not None:
+        nlist = max(1, min(nlist, num_train))
+        nbits = max(1, min(nbits, int(math.log2(max(num_train, 2)))))
+    match index_type:
+        case FaissIndexType.FLAT:
+            index = faiss.IndexFlatL2(d)
+        case FaissIndexType.IVF:
+            index = faiss.IndexIVFFlat(faiss.IndexFlatL2(d), d, nlist)
+        case FaissIndexType.IVFPQ:
+            index = faiss.IndexIVFPQ(faiss.IndexFlatL2(d), d, nlist, _pq_m(d, params["pq_m"]), nbits)
+        case FaissIndexType.HNSW:
+            index = faiss.IndexHNSWFlat(d, params["hnsw_m"])
+            index.hnsw.efConstruction = params["ef_construction"]
+        case _:
+            raise ValueError(f"FAISS index type {index_type} not supported")
+    set_search_params(index, params)
+    return index
+
+
+def train_faiss_index(index: faiss.Index, index_type: str, vectors: numpy.ndarray, params: Dict[str, Any]):
+    """Train an IVF based index on the given vectors, returns the trained index.
+
+    The index is rebuilt with smaller nlist / PQ codes if there are too few vectors to train it as configured.
+    """
+    if index.is_trained:
+        return index
+    if index.ntotal:
+        raise ValueError("Cannot train a FAISS index that already holds vectors")
+    index = build_faiss_index(index.d, index_type, params, num_train=len(vectors))
+    index.train(numpy.ascontiguousarray(vectors, dtype=numpy.float32))
+    return index
+
+
+def set_search_params(index: faiss.Index, params: Dict[str, Any]) -> None:
+    if isinstance(index, faiss.IndexIVF):
+        index.nprobe = min(params["nprobe"], index.nlist)
+    elif isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = params["ef_search"]
+
+
+class FaissDeltaVectorStore(FaissVectorStore):
+    """FaissVectorStore that supports deleting nodes.
+
+    FAISS ids are positions, and removing vectors would shift the positions the index struct maps to
+    node ids. Deleted positions are therefore tombstoned and filtered out of query results, until the
+    owner rebuilds the index once tombstones_ratio grows too large.
+    """
+
+    _positions: Dict[str, int] = PrivateAttr(default_factory=dict)
+    _deleted: Set[str] = PrivateAttr(default_factory=set)
+
+    def add(self, nodes: List[BaseNode], **add_kwargs: Any) -> List[str]:
+        new_ids = super().add(nodes, **add_kwargs)
+        for node, new_id in zip(nodes, new_ids):
+            self._positions[node.node_id] = int(new_id)
+        return new_ids
+
+    def delete_nodes(self, node_ids: Optional[List[str]] = None, filters=None, **delete_kwargs: Any) -> List[str]:
+        """Tombstone the given nodes, returns the FAISS ids that were deleted."""
+        if filters is not None:
+            raise ValueError("Metadata filters not implemented for Faiss yet.")
+        deleted = []
+        for node_id in node_ids or []:
+            position = self._positions.pop(node_id, None)
+            if position is not None:
+                deleted.append(str(position))
+        self._deleted.update(deleted)
+        return deleted
+
+    @property
+    def live_count(self) -> int:
+        return self._faiss_index.ntotal - len(self._deleted)
+
+    @property
+    def tombstones_ratio(self) -> float:
+        ntotal = self._faiss_index.ntotal
+        return len(self._deleted) / ntotal if ntotal else 0.0
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        if not self._deleted:
+            return super().query(query, **kwargs)
+        top_k = query.similarity_top_k
+        # Ask for enough extra results to make up for tombstoned ones
+        query = dataclasses.replace(
+            query, similarity_top_k=min(top_k + len(self._deleted), max(self._faiss_index.ntotal, 1))
+        )
+        result = super().query(query, **kwargs)
+        kept = [(sim, idx) for sim, idx in zip(result.similarities, result.ids) if idx not in self._deleted][:top_k]
+        return VectorStoreQueryResult(similarities=[sim for sim, _ in kept], ids=[idx for _, idx in kept])
+
+
+def recall_latency_report(
+    vectors: numpy.ndarray,
+    params: Optional[Dict[str, Any]] = None,
+    index_types: Optional[List[str]] = None,
+    top_k: int = 10,
+    num_queries: int = 100,
+    seed: int = 0,
+) -> Dict[str, Any]:
+    """Compare approximate index types against the exact flat index on the same corpus.
+
+    Queries are sampled from the corpus, recall@k is measured against the flat index results.
+    """
+    vectors = numpy.ascontiguousarray(vectors, dtype=numpy.float32)
+    if vectors.ndim != 2 or len(vectors) == 0:
+        raise ValueError("No vectors to build the report from")
+    params = get_faiss_params(params)
+    index_types = index_types or [t.value for t in FaissIndexType]
+    rng = numpy.random.default_rng(seed)
+    queries = vectors[rng.choice(len(vectors), size=min(num_queries, len(vectors)), replace=False)]
+    top_k = min(top_k, len(vectors))
+
+    def run(index_type):
+        start = time.perf_counter()
+        index = build_faiss_index(vectors.shape[1], index_type, params)
+        index = train_faiss_index(index, index_type, vectors, params)
+        index.add(vectors)
+        build_time = time.perf_counter() - start
+        ids = []
+        start = time.perf_counter()
+        # One query at a time, as they arrive from the retriever
+        for query in queries:
+            ids.append(index.search(query[None, :], top_k)[1][0])
+        search_time = time.perf_counter() - start
+        return numpy.stack(ids), build_time, search_time
+
+    exact_ids, _, _ = run(FaissIndexType.FLAT)
+    report = {"num_vectors": len(vectors), "dim": vectors.shape[1], "top_k": top_k, "params": params, "results": {}}
+    for index_type in index_types:
+        ids, build_time, search_time = run(index_type)
+        hits = sum(len(set(approx) & set(exact)) for approx, exact in zip(ids.tolist(), exact_ids.tolist()))
+        report["results"][index_type] = {
+            f"recall@{top_k}": hits / (len(queries) * top_k),
+            "build_time_s": build_time,
+            "avg_query_latency_ms": search_time / len(queries) * 1000,
+        }
+    return report
@@ -0,0 +1,124 @@
+# Copyright (C) 2025 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Optional, Tuple
+
+
+class GenerationQueueFull(Exception):
+    pass
+
+
+class GenerationScheduler:
+    """Admits generation requests to one local model in arrival order.
+
+    At most max_concurrency requests generate at the same time (1 for models that keep a single
+    infer request), up to max_queue more wait for a slot and further requests are rejected
+    immediately instead of waiting without bound.
+    """
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int, wait_window: int = 1000):
+        self.name = name
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self._active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._wait_times: Deque[float] = deque(maxlen=wait_window)
+        self.admitted = 0
+        self.rejected = 0
+        self.max_queue_depth = 0
+
+    @asynccontextmanager
+    async def slot(self):
+        await self._acquire()
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def _acquire(self) -> None:
+        start = time.perf_counter()
+        if self._active < self.max_concurrency and not self._waiters:
+            self._active += 1
+        else:
+            if len(self._waiters) >= self.max_queue:
+                self.rejected += 1
+                raise GenerationQueueFull(
+                    f"Server busy: {len(self._waiters)} requests are already waiting for model {self.name}"
+                )
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            self.max_queue_depth = max(self.max_queue_depth, len(self._waiters))
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    # The slot was handed over just before the cancellation, pass it on
+                    self._release()
+                elif waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                raise
+        self.admitted += 1
+        self._wait_times.append(time.perf_counter() - start)
+
+    def _release(self) -> None:
+        # Hand the slot directly to the oldest waiter so later arrivals cannot overtake it
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._active -= 1
+
+    def get_metrics(self) -> Dict:
+        wait_times = sorted(self._wait_times)
+
+        def percentile(p):
+            return wait_times[min(len(wait_times) - 1, int(p * len(wait_times)))] * 1000 if wait_times else 0.0
+
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "active": self._active,
+            "queue_depth": len(self._waiters),
+            "max_queue_depth": self.max_queue_depth,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "wait_ms_avg": sum(wait_times) / len(wait_times) * 1000 if wait_times else 0.0,
+            "wait_ms_p50": percentile(0.5),
+            "wait_ms_p95": percentile(0.95),
+            "wait_ms_max": wait_times[-1] * 1000 if wait_times else 0.0,
+        }
+
+
+class GenerationSchedulerRegistry:
+    """One scheduler per local model, shared by every generator that uses the model."""
+
+    def __init__(self):
+        self.max_concurrency = int(os.getenv("LOCAL_LLM_MAX_CONCURRENCY", "1"))
+        self.max_queue = int(os.getenv("LOCAL_LLM_MAX_QUEUE", "32"))
+        self._schedulers: Dict[Tuple[Optional[str], Optional[str]], GenerationScheduler] = {}
+        self._lock = threading.Lock()
+
+    def get(self, llm) -> GenerationScheduler:
+        key = (getattr(llm, "model_path", None), getattr(llm, "device_map", None))
+        with self._lock:
+            scheduler = self._schedulers.get(key)
+            if scheduler is None:
+                name = getattr(llm, "model_id", None) or str(key[0])
+                scheduler = GenerationScheduler(name, self.max_concurrency, self.max_queue)
+                self._schedulers[key] = scheduler
+            return scheduler
+
+    def get_metrics(self) -> Dict:
+        with self._lock:
+            schedulers = list(self._schedulers.items())
+        return {f"{scheduler.name}|{key[1]}": scheduler.get_metrics() for key, scheduler in schedulers}
+
+
+generation_schedulers = GenerationSchedulerRegistry()
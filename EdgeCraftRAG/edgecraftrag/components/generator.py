@@ -5,44 +5,41 @@ import asyncio
 import json
 import os
 import time
-import urllib.request
 from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlparse
 
 from comps.cores.proto.api_protocol import ChatCompletionRequest
 from edgecraftrag.base import BaseComponent, CompType, GeneratorType, InferenceType, NodeParserType
+from edgecraftrag.components.generation_scheduler import GenerationQueueFull, generation_schedulers
+from edgecraftrag.components.link_validator import link_validator
+from edgecraftrag.components.vllm_client import vllm_client_registry
 from edgecraftrag.utils import get_prompt_template
 from fastapi.responses import StreamingResponse
-from llama_index.llms.openai_like import OpenAILike
 from pydantic import model_serializer
 from unstructured.staging.base import elements_from_base64_gzipped_json
 
 
-def extract_urls(text):
+async def extract_urls(text):
     urls = []
     words = text.split()
     for word in words:
         parsed_url = urlparse(word)
         if parsed_url.scheme and parsed_url.netloc:
-            url = parsed_url.geturl()
-            try:
-                response = urllib.request.urlopen(url)
-                if response.status == 200:
-                    urls.append(url)
-            except (urllib.error.URLError, urllib.error.HTTPError, Exception):
-                pass
-    return urls
+            urls.append(parsed_url.geturl())
+    return await link_validator.filter_reachable(urls)
 
 
-def extract_unstructured_eles(retrieved_nodes=[], text_gen_context=""):
+async def extract_unstructured_eles(retrieved_nodes=[], text_gen_context=""):
     IMAGE_NUMBER = 2
     image_count = 0
     link_urls = []
     image_paths = []
     reference_docs = set()
+    has_relevant_node = False
     for node in retrieved_nodes:
         if node.score < 0.5:
             continue
+        has_relevant_node = True
         metadata = node.node.metadata
         # extract referenced docs
         if "file_name" in metadata:
@@ -67,8 +64,9 @@ def extract_unstructured_eles(retrieved_nodes=[], text_gen_context=""):
                 if element.metadata.image_path:
                     image_paths.append(element.metadata.image_path)
                     image_count += 1
-        # extract hyperlinks in chunk
-        link_urls.extend(extract_urls(text_gen_context))
+    # extract hyperlinks in context, the context is shared by all nodes so it is checked once
+    if has_relevant_node:
+        link_urls.extend(await extract_urls(text_gen_context))
     unstructured_str = ""
     if reference_docs:
         unstructured_str += "\n\n --- \n\n### Document Source:\n"
@@ -77,6 +75,12 @@ def extract_unstructured_eles(retrieved_nodes=[], text_gen_context=""):
     return unstructured_str
 
 
+async def resolve_llm(llm_ref):
+    # Reloading an evicted model takes long, model handles do it off the event loop
+    aresolve = getattr(llm_ref, "aresolve", None)
+    return await aresolve() if aresolve else llm_ref()
+
+
 def build_stream_response(status=None, content=None, error=None):
     response = {"status": status, "contentType": "text"}
     if content is not None:
@@ -86,35 +90,76 @@ def build_stream_response(status=None, content=None, error=None):
     return response
 
 
-async def local_stream_generator(lock, llm, prompt_str, unstructured_str):
-    async with lock:
-        response = await llm.astream_complete(prompt_str)
-        try:
-            async for r in response:
-                yield r.delta or ""
-                await asyncio.sleep(0)
-            if unstructured_str:
-                yield unstructured_str
-        except Exception as e:
-            start_idx = str(e).find("message") + len("message")
-            result_error = str(e)[start_idx:]
-            yield f"code:0000{result_error}"
+def with_local_generate_kwargs(llm, chat_request):
+    """Shallow copy of the local model carrying the request's sampling parameters.
+
+    The copy shares the compiled model and tokenizer, so concurrent requests admitted by the
+    scheduler do not overwrite each other's parameters on the shared model.
+    """
+    return llm.model_copy(
+        update={
+            "generate_kwargs": dict(
+                temperature=chat_request.temperature,
+                do_sample=chat_request.temperature > 0.0,
+                top_p=chat_request.top_p,
+                top_k=chat_request.top_k,
+                typical_p=chat_request.typical_p,
+                repetition_penalty=chat_request.repetition_penalty,
+            ),
+            "max_new_tokens": chat_request.max_tokens,
+        }
+    )
+
+
+async def local_stream_generator(llm, chat_request, prompt_str, unstructured_str):
+    try:
+        async with generation_schedulers.get(llm).slot():
+            response = await with_local_generate_kwargs(llm, chat_request).astream_complete(prompt_str)
+            try:
+                async for r in response:
+                    yield r.delta or ""
+                    await asyncio.sleep(0)
+                if unstructured_str:
+                    yield unstructured_str
+            except Exception as e:
+                start_idx = str(e).find("message") + len("message")
+                result_error = str(e)[start_idx:]
+                yield f"code:0000{result_error}"
+    except GenerationQueueFull as e:
+        yield f"code:0000{e}"
+
+
+async def local_complete(llm, chat_request, prompt_str):
+    async with generation_schedulers.get(llm).slot():
+        return await asyncio.to_thread(with_local_generate_kwargs(llm, chat_request).complete, prompt_str)
 
 
 async def stream_generator(llm, prompt_str, unstructured_str, benchmark=None, benchmark_index=None):
     enable_benchmark = benchmark.is_enabled() if benchmark else False
     start_time = time.perf_counter() if enable_benchmark else None
+    first_token_latency = None
+    usage = None
     response = await llm.astream_complete(prompt_str)
     try:
         async for r in response:
+            if enable_benchmark:
+                if first_token_latency is None and r.delta:
+                    first_token_latency = time.perf_counter() - start_time
+                # Token counts of this request, sent with the last chunk when the usage is requested
+                if r.additional_kwargs:
+                    usage = r.additional_kwargs
             yield r.delta or ""
             await asyncio.sleep(0)
+        if enable_benchmark:
+            generation_time = time.perf_counter() - start_time
         if unstructured_str:
             yield unstructured_str
             await asyncio.sleep(0)
         if enable_benchmark:
-            benchmark.update_benchmark_data(benchmark_index, CompType.GENERATOR, time.perf_counter() - start_time)
-            benchmark.insert_llm_data(benchmark_index)
+            benchmark.update_benchmark_data(benchmark_index, CompType.GENERATOR, generation_time)
+            benchmark.insert_llm_data(
+                benchmark_index, usage=usage, first_token_latency=first_token_latency, generation_time=generation_time
+            )
 
     except asyncio.CancelledError as e:
         response.aclose()
@@ -195,8 +240,6 @@ class QnAGenerator(BaseComponent):
         )
 
         self.llm = llm_model
-        if self.inference_type == InferenceType.LOCAL:
-            self.lock = asyncio.Lock()
         if self.inference_type == InferenceType.VLLM:
             self.vllm_name = llm_model().model_id
             if vllm_endpoint == "":
@@ -288,35 +331,26 @@ class QnAGenerator(BaseComponent):
         return text_gen_context, prompt_str
 
     async def run(self, chat_request, retrieved_nodes, node_parser_type, **kwargs):
-        if self.llm() is None:
+        llm = await resolve_llm(self.llm)
+        if llm is None:
             # This could happen when User delete all LLMs through RESTful API
             raise ValueError("No LLM available, please load LLM")
         # query transformation
         sub_questions = kwargs.get("sub_questions", None)
         text_gen_context, prompt_str = self.query_transform(chat_request, retrieved_nodes, sub_questions=sub_questions)
-        generate_kwargs = dict(
-            temperature=chat_request.temperature,
-            do_sample=chat_request.temperature > 0.0,
-            top_p=chat_request.top_p,
-            top_k=chat_request.top_k,
-            typical_p=chat_request.typical_p,
-            repetition_penalty=chat_request.repetition_penalty,
-        )
-        self.llm().generate_kwargs = generate_kwargs
-        self.llm().max_new_tokens = chat_request.max_tokens
         unstructured_str = ""
         if node_parser_type == NodeParserType.UNSTRUCTURED or node_parser_type == NodeParserType.SIMPLE:
-            unstructured_str = extract_unstructured_eles(retrieved_nodes, text_gen_context)
+            unstructured_str = await extract_unstructured_eles(retrieved_nodes, text_gen_context)
         if chat_request.stream:
             # Asynchronous generator
             async def generator():
-                async for chunk in local_stream_generator(self.lock, self.llm(), prompt_str, unstructured_str):
+                async for chunk in local_stream_generator(llm, chat_request, prompt_str, unstructured_str):
                     yield chunk or ""
                     await asyncio.sleep(0)
 
             return generator()
         else:
-            result = self.llm().complete(prompt_str)
+            result = await local_complete(llm, chat_request, prompt_str)
             return result
 
     async def run_vllm(self, chat_request, retrieved_nodes, node_parser_type, **kwargs):
@@ -325,20 +359,24 @@ class QnAGenerator(BaseComponent):
         benchmark = kwargs.get("benchmark", None)
         benchmark_index = kwargs.get("benchmark_index", None)
         text_gen_context, prompt_str = self.query_transform(chat_request, retrieved_nodes, sub_questions=sub_questions)
-        llm = OpenAILike(
-            api_key="fake",
+        additional_kwargs = {}
+        if chat_request.stream and benchmark and benchmark.is_enabled():
+            # vLLM then appends a chunk carrying the usage of this request
+            additional_kwargs["stream_options"] = {"include_usage": True}
+        llm = vllm_client_registry.create_llm(
             api_base=self.vllm_endpoint + "/v1",
-            max_tokens=chat_request.max_tokens,
             model=self.vllm_name,
+            max_tokens=chat_request.max_tokens,
             top_p=chat_request.top_p,
             top_k=chat_request.top_k,
             temperature=chat_request.temperature,
             streaming=chat_request.stream,
             repetition_penalty=chat_request.repetition_penalty,
+            additional_kwargs=additional_kwargs,
         )
         unstructured_str = ""
         if node_parser_type == NodeParserType.UNSTRUCTURED or node_parser_type == NodeParserType.SIMPLE:
-            unstructured_str = extract_unstructured_eles(retrieved_nodes, text_gen_context)
+            unstructured_str = await extract_unstructured_eles(retrieved_nodes, text_gen_context)
         if chat_request.stream:
 
             # Asynchronous generator
@@ -358,7 +396,7 @@ class QnAGenerator(BaseComponent):
             "idx": self.idx,
             "generator_type": self.comp_subtype,
             "inference_type": self.inference_type,
-            "model": self.llm(),
+            "model": self.llm.peek() if hasattr(self.llm, "peek") else self.llm(),
             "vllm_endpoint": self.vllm_endpoint,
         }
         return set
@@ -393,8 +431,6 @@ class FreeChatGenerator(BaseComponent):
                 self.model_path = llm_instance.model_path
 
         self.llm = llm_model
-        if self.inference_type == InferenceType.LOCAL:
-            self.lock = asyncio.Lock()
         if self.inference_type == InferenceType.VLLM:
             self.vllm_name = llm_model().model_id
             if vllm_endpoint == "":
@@ -411,39 +447,29 @@ class FreeChatGenerator(BaseComponent):
         return response
 
     async def run_local(self, chat_request, retrieved_nodes, node_parser_type, **kwargs):
-        if self.llm() is None:
+        llm = await resolve_llm(self.llm)
+        if llm is None:
             # This could happen when User delete all LLMs through RESTful API
             raise ValueError("No LLM available, please load LLM")
-        generate_kwargs = dict(
-            temperature=chat_request.temperature,
-            do_sample=chat_request.temperature > 0.0,
-            top_p=chat_request.top_p,
-            top_k=chat_request.top_k,
-            typical_p=chat_request.typical_p,
-            repetition_penalty=chat_request.repetition_penalty,
-        )
-        self.llm().generate_kwargs = generate_kwargs
-        self.llm().max_new_tokens = chat_request.max_tokens
         prompt_str = chatcompletion_to_chatml(chat_request)
         if chat_request.stream:
 
             # Asynchronous generator
             async def generator():
-                async for chunk in local_stream_generator(self.lock, self.llm(), prompt_str, ""):
+                async for chunk in local_stream_generator(llm, chat_request, prompt_str, ""):
                     yield chunk or ""
                     await asyncio.sleep(0)
 
             return generator()
         else:
-            result = self.llm().complete(prompt_str)
+            result = await local_complete(llm, chat_request, prompt_str)
             return result
 
     async def run_vllm(self, chat_request, retrieved_nodes, node_parser_type, **kwargs):
-        llm = OpenAILike(
-            api_key="fake",
+        llm = vllm_client_registry.create_llm(
             api_base=self.vllm_endpoint + "/v1",
-            max_tokens=chat_request.max_tokens,
             model=self.vllm_name,
+            max_tokens=chat_request.max_tokens,
             top_p=chat_request.top_p,
             top_k=chat_request.top_k,
             temperature=chat_request.temperature,
@@ -471,7 +497,7 @@ class FreeChatGenerator(BaseComponent):
             "idx": self.idx,
             "generator_type": self.comp_subtype,
             "inference_type": self.inference_type,
-            "model": self.llm(),
+            "model": self.llm.peek() if hasattr(self.llm, "peek") else self.llm(),
             "vllm_endpoint": self.vllm_endpoint,
         }
         return set
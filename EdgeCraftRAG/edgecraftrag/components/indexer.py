@@ -1,34 +1,55 @@
 # Copyright (C) 2024 Intel Corporation
 # SPDX-License-Identifier: Apache-2.0
 
-from typing import Any
+import os
+from typing import Any, Dict, Optional
 
-import faiss
-from edgecraftrag.base import BaseComponent, CompType, IndexerType
+import numpy
+from edgecraftrag.base import BaseComponent, CompType, FaissIndexType, IndexerType
+from edgecraftrag.components.faiss_index import (
+    FaissDeltaVectorStore,
+    build_faiss_index,
+    get_faiss_params,
+    recall_latency_report,
+    train_faiss_index,
+)
+from edgecraftrag.components.kbs_rev_map import kbs_rev_map
 from edgecraftrag.context import ctx
 from langchain_milvus import Milvus
 from langchain_openai import OpenAIEmbeddings
 from llama_index.core import StorageContext, VectorStoreIndex
-from llama_index.vector_stores.faiss import FaissVectorStore
+from llama_index.core.indices.utils import embed_nodes
 from llama_index.vector_stores.milvus import MilvusVectorStore
 from pydantic import model_serializer
-from pymilvus import Collection, MilvusException, connections, utility
 
 
 class VectorIndexer(BaseComponent, VectorStoreIndex):
-    def __init__(self, embed_model, vector_type, vector_url="http://localhost:19530", kb_name="default_kb"):
+    def __init__(
+        self,
+        embed_model,
+        vector_type,
+        vector_url="http://localhost:19530",
+        kb_name="default_kb",
+        faiss_index_type: Optional[str] = None,
+        faiss_params: Optional[Dict[str, Any]] = None,
+    ):
         BaseComponent.__init__(
             self,
             comp_type=CompType.INDEXER,
             comp_subtype=vector_type,
         )
         self.model = embed_model
+        self.faiss_index_type = FaissIndexType(faiss_index_type or FaissIndexType.FLAT)
+        self.faiss_params = get_faiss_params(faiss_params)
+        self.faiss_index = None
         if not embed_model:
             # Settings.embed_model should be set to None when embed_model is None to avoid 'no oneapi key' error
             from llama_index.core import Settings
 
             Settings.embed_model = None
         self.vector_url = vector_url
+        # Bumped whenever nodes are added or removed, retrievers built from the index are cached per version
+        self.version = 0
         self._initialize_indexer(embed_model, vector_type, vector_url, kb_name)
 
     def _initialize_indexer(self, embed_model, vector_type, vector_url, kb_name):
@@ -45,8 +66,14 @@ class VectorIndexer(BaseComponent, VectorStoreIndex):
             case IndexerType.DEFAULT_VECTOR:
                 VectorStoreIndex.__init__(self, embed_model=embed_model, nodes=[])
             case IndexerType.FAISS_VECTOR:
-                faiss_index = faiss.IndexFlatL2(self.d)
-                faiss_store = StorageContext.from_defaults(vector_store=FaissVectorStore(faiss_index=faiss_index))
+                # IVF based indexes start flat and are trained once there are enough vectors, see insert_nodes
+                index_type = FaissIndexType.FLAT if self._is_ivf() else self.faiss_index_type
+                self.faiss_index = build_faiss_index(self.d, index_type, self.faiss_params)
+                # Number of vectors the IVF index was trained on, 0 while it is still flat
+                self.faiss_trained_on = 0
+                faiss_store = StorageContext.from_defaults(
+                    vector_store=FaissDeltaVectorStore(faiss_index=self.faiss_index)
+                )
                 VectorStoreIndex.__init__(self, embed_model=embed_model, nodes=[], storage_context=faiss_store)
             case IndexerType.MILVUS_VECTOR:
                 milvus_vector_store = MilvusVectorStore(
@@ -57,6 +84,126 @@ class VectorIndexer(BaseComponent, VectorStoreIndex):
                 )
                 milvus_store = StorageContext.from_defaults(vector_store=milvus_vector_store)
                 VectorStoreIndex.__init__(self, embed_model=embed_model, nodes=[], storage_context=milvus_store)
+        self.version += 1
+
+    def _is_ivf(self) -> bool:
+        return self.comp_subtype == IndexerType.FAISS_VECTOR and self.faiss_index_type in (
+            FaissIndexType.IVF,
+            FaissIndexType.IVFPQ,
+        )
+
+    def insert_nodes(self, nodes, **insert_kwargs):
+        if self._is_ivf() and not self.faiss_trained_on:
+            if self.faiss_index.ntotal + len(nodes) >= self.faiss_params["min_train_size"]:
+                nodes = self.train_faiss_index(nodes)
+        ret = VectorStoreIndex.insert_nodes(self, nodes, **insert_kwargs)
+        self.version += 1
+        return ret
+
+    def delete_nodes(self, node_ids, delete_from_docstore: bool = True, **delete_kwargs):
+        """Delete nodes by id from the vector store, the index struct and the docstore, without scanning them."""
+        node_ids = list(node_ids)
+        if not node_ids:
+            return
+        match self.comp_subtype:
+            case IndexerType.FAISS_VECTOR:
+                for faiss_id in self.vector_store.delete_nodes(node_ids):
+                    self._index_struct.nodes_dict.pop(faiss_id, None)
+            case IndexerType.DEFAULT_VECTOR:
+                # SimpleVectorStore.delete_nodes walks every stored embedding, pop the ids directly
+                data = self.vector_store.data
+                for node_id in node_ids:
+                    data.embedding_dict.pop(node_id, None)
+                    data.text_id_to_ref_doc_id.pop(node_id, None)
+                    data.metadata_dict.pop(node_id, None)
+                    self._index_struct.nodes_dict.pop(node_id, None)
+            case IndexerType.MILVUS_VECTOR:
+                # Deleted by primary key
+                self.vector_store.delete_nodes(node_ids)
+        if delete_from_docstore and not self.vector_store.stores_text:
+            for node_id in node_ids:
+                self.docstore.delete_document(node_id, raise_error=False)
+        self.storage_context.index_store.add_index_struct(self._index_struct)
+        self.version += 1
+
+    def needs_rebuild(self) -> bool:
+        # Too many FAISS tombstones slow queries down, rebuilding reuses the cached embeddings
+        if self.comp_subtype != IndexerType.FAISS_VECTOR:
+            return False
+        return self.vector_store.tombstones_ratio > float(os.getenv("FAISS_MAX_TOMBSTONES_RATIO", "0.3"))
+
+    def needs_retrain(self) -> bool:
+        """Whether an IVF index trained with reduced nlist / PQ codes has outgrown its training set."""
+        if not self._is_ivf() or not self.faiss_trained_on:
+            return False
+        index = self.faiss_index
+        capped = index.nlist < self.faiss_params["nlist"]
+        if self.faiss_index_type == FaissIndexType.IVFPQ:
+            capped = capped or index.pq.nbits < self.faiss_params["pq_nbits"]
+        return capped and self.vector_store.live_count >= self.faiss_params["retrain_growth"] * self.faiss_trained_on
+
+    def train_faiss_index(self, nodes):
+        """Train the IVF index on the vectors already stored and the embeddings of nodes.
+
+        Stored vectors are moved to the trained index in the same order, so their FAISS ids do not change.
+        Returns copies of nodes carrying their embeddings, reused by the following insert so nodes are
+        embedded only once.
+        """
+        embedded_nodes = self._embedded(nodes)
+        stored = self.faiss_index.reconstruct_n(0, self.faiss_index.ntotal) if self.faiss_index.ntotal else None
+        new_vectors = numpy.array([node.embedding for node in embedded_nodes], dtype=numpy.float32).reshape(-1, self.d)
+        vectors = numpy.vstack([stored, new_vectors]) if stored is not None else new_vectors
+        if not len(vectors):
+            return embedded_nodes
+        index = build_faiss_index(self.d, self.faiss_index_type, self.faiss_params)
+        # nlist and the PQ code size are reduced if there are too few vectors to train as configured
+        index = train_faiss_index(index, self.faiss_index_type, vectors, self.faiss_params)
+        if stored is not None:
+            index.add(stored)
+        self.faiss_index = index
+        self.vector_store._faiss_index = index
+        self.faiss_trained_on = len(vectors)
+        print(f"Trained FAISS {self.faiss_index_type} index with nlist {index.nlist} on {len(vectors)} vectors")
+        return embedded_nodes
+
+    def retrain_faiss_index(self, nodes, kb_name="default_kb"):
+        """Rebuild the FAISS index from nodes, IVF based types are trained on all of them whatever their number."""
+        self.reinitialize_indexer(kb_name)
+        if self._is_ivf() and nodes:
+            nodes = self.train_faiss_index(nodes)
+        if nodes:
+            self.insert_nodes(nodes)
+
+    def get_faiss_status(self) -> Dict[str, Any]:
+        index = self.faiss_index
+        return {
+            "faiss_index_type": self.faiss_index_type,
+            "index_class": type(index).__name__,
+            "ntotal": index.ntotal,
+            "live_vectors": self.vector_store.live_count,
+            "trained_on": self.faiss_trained_on,
+            "nlist": getattr(index, "nlist", None),
+            "needs_retrain": self.needs_retrain(),
+        }
+
+    def _embedded(self, nodes):
+        # Nodes carrying an embedding already, e.g. from the reload manifest, are not embedded again
+        missing = [node for node in nodes if node.embedding is None]
+        id_to_embed_map = embed_nodes(missing, self._embed_model) if missing else {}
+        embedded_nodes = []
+        for node in nodes:
+            embedded_node = node.model_copy()
+            if node.embedding is None:
+                embedded_node.embedding = id_to_embed_map[node.node_id]
+            embedded_nodes.append(embedded_node)
+        return embedded_nodes
+
+    def get_recall_latency_report(self, nodes, top_k: int = 10, num_queries: int = 100) -> Dict[str, Any]:
+        """Pass nodes carrying their cached embeddings, only nodes without one are embedded."""
+        if not self.model:
+            raise ValueError("Recall report requires an embedding model")
+        vectors = numpy.array([node.embedding for node in self._embedded(nodes)], dtype=numpy.float32)
+        return recall_latency_report(vectors, self.faiss_params, top_k=top_k, num_queries=num_queries)
 
     def reinitialize_indexer(self, kb_name="default_kb"):
         self._initialize_indexer(self.model, self.comp_subtype, self.vector_url, kb_name)
@@ -76,6 +223,9 @@ class VectorIndexer(BaseComponent, VectorStoreIndex):
     @model_serializer
     def ser_model(self):
         set = {"idx": self.idx, "indexer_type": self.comp_subtype, "model": self.model}
+        if self.comp_subtype == IndexerType.FAISS_VECTOR:
+            set["faiss_index_type"] = self.faiss_index_type
+            set["faiss_params"] = self.faiss_params
         return set
 
 
@@ -102,10 +252,7 @@ class KBADMINIndexer(BaseComponent):
         )
 
     def config_kbadmin_milvus(self, knowledge_name):
-        collection_name = knowledge_name
-        if not kbs_rev_maps:
-            get_kbs_info(self.CONNECTION_ARGS)
-        collection_name = kbs_rev_maps[collection_name]
+        collection_name = kbs_rev_map.get_collection(self.CONNECTION_ARGS, knowledge_name)
         self.vector_db = Milvus(
             self.embedding,
             connection_args=self.CONNECTION_ARGS,
@@ -119,6 +266,12 @@ class KBADMINIndexer(BaseComponent):
     def insert_nodes(self, nodes):
         return None
 
+    def delete_nodes(self, node_ids):
+        return None
+
+    def needs_rebuild(self) -> bool:
+        return False
+
     def _index_struct(self, nodes):
         return None
 
@@ -141,68 +294,3 @@ class KBADMINIndexer(BaseComponent):
             "vector_url": self.vector_url,
         }
         return set
-
-
-# global kbs maps.
-global kbs_rev_maps
-kbs_rev_maps = {}
-
-
-def get_kbs_info(CONNECTION_ARGS):
-    alias = "default"
-    try:
-        connections.connect("default", **CONNECTION_ARGS)
-        collections = utility.list_collections()
-        all_kb_infos = {}
-        new_infos = {}
-        for kb in collections:
-            collection = Collection(kb)
-            collection.load()
-            try:
-                if any(field.name == "kb_id" for field in collection.schema.fields):
-                    docs = collection.query(
-                        expr="pk != 0",
-                        output_fields=["kb_name", "kb_id", "docnm_kwd"],
-                        timeout=10,
-                    )
-                else:
-                    docs = collection.query(
-                        expr="pk != 0",
-                        output_fields=["filename"],
-                        timeout=10,
-                    )
-                collection.release()
-            except MilvusException as e:
-                continue
-            this_kbinfo = {}
-            for doc in docs:
-                try:
-                    if "kb_name" in doc:
-                        if not this_kbinfo:
-                            this_kbinfo["name"] = doc["kb_name"]
-                            this_kbinfo["uuid"] = doc["kb_id"]
-                            this_kbinfo["files"] = set([doc["docnm_kwd"]])
-                        else:
-                            this_kbinfo["files"].add(doc["docnm_kwd"])
-                    else:
-                        if not this_kbinfo:
-                            this_kbinfo["name"] = kb
-                            this_kbinfo["uuid"] = ""
-                            this_kbinfo["files"] = set([doc["filename"]])
-                        else:
-                            this_kbinfo["files"].add(doc["filename"])
-                except KeyError:
-                    this_kbinfo = None
-                    break
-            if this_kbinfo:
-                unique_files = list(this_kbinfo["files"])
-                this_kbinfo["files"] = unique_files
-                new_infos[kb] = this_kbinfo
-        all_kb_infos.update(new_infos)
-        kbs_rev_maps.clear()
-        for kb_id in all_kb_infos:
-            kbs_rev_maps[all_kb_infos[kb_id]["name"]] = kb_id
-        return kbs_rev_maps
-    finally:
-        if connections.has_connection(alias):
-            connections.disconnect(alias)
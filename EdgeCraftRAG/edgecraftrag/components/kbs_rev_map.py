@@ -0,0 +1,147 @@
+# Copyright (C) 2025 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+import os
+import threading
+from typing import Dict, List, Optional, Set, Union
+
+from edgecraftrag.env import KBS_REV_MAP_FILE
+from pymilvus import Collection, MilvusException, connections, utility
+from pymilvus.client.types import LoadState
+
+
+class KbsRevMap:
+    """kbadmin knowledge base name -> Milvus collection, per Milvus server, persisted as JSON.
+
+    Each collection is probed once, with a single row query, when it first shows up in the collection
+    list. Known collections are only queried again when asked to, so refreshing costs one list_collections
+    call plus one small query per new collection, whatever the size of the corpus.
+    """
+
+    def __init__(self, map_file: str = KBS_REV_MAP_FILE):
+        self.map_file = map_file
+        self._lock = threading.RLock()
+        # uri -> collection -> {"name", "uuid"}, collections that are not kbadmin knowledge bases map to None
+        self._collections: Dict[str, Dict[str, Optional[Dict[str, str]]]] = {}
+        self._rev_maps: Dict[str, Dict[str, str]] = {}
+        self.load()
+
+    def _rebuild_rev_map(self, uri: str) -> None:
+        self._rev_maps[uri] = {
+            info["name"]: collection for collection, info in self._collections.get(uri, {}).items() if info
+        }
+
+    def _probe(self, collection_name: str, alias: str):
+        collection = Collection(collection_name, using=alias)
+        field_names = {field.name for field in collection.schema.fields}
+        has_kb_id = {"kb_id", "kb_name"} <= field_names
+        if "pk" not in field_names or not (has_kb_id or "filename" in field_names):
+            # Not a kbadmin knowledge base, decided from the schema alone so query failures are never cached
+            return None
+        # A collection dropped and created again under the same name gets a new id
+        collection_id = str(collection.describe()["collection_id"])
+        was_loaded = utility.load_state(collection_name, using=alias) == LoadState.Loaded
+        if not was_loaded:
+            collection.load()
+        try:
+            output_fields = ["kb_name", "kb_id"] if has_kb_id else ["filename"]
+            docs = collection.query(expr="pk != 0", output_fields=output_fields, limit=1, timeout=10)
+        finally:
+            if not was_loaded:
+                collection.release()
+        if not docs:
+            # Empty for now, probed again on the next refresh
+            return False
+        if has_kb_id:
+            return {"name": docs[0]["kb_name"], "uuid": docs[0]["kb_id"], "collection_id": collection_id}
+        return {"name": collection_name, "uuid": "", "collection_id": collection_id}
+
+    def refresh(self, connection_args: Dict, reprobe: Union[bool, Set[str]] = False) -> Dict[str, str]:
+        """Sync with the collection list of the server, only new collections are queried.
+
+        reprobe queries the given known collections again (True for all of them), picking up knowledge
+        bases renamed in or recreated under a collection that is already cached.
+        """
+        uri = connection_args.get("uri", "")
+        alias = "default"
+        with self._lock:
+            try:
+                connections.connect(alias, **connection_args)
+                collections = set(utility.list_collections(using=alias))
+                known = self._collections.setdefault(uri, {})
+                changed = False
+                for collection_name in list(known):
+                    if collection_name not in collections:
+                        del known[collection_name]
+                        changed = True
+                stale = collections & known.keys() if reprobe is True else collections & set(reprobe or ())
+                for collection_name in sorted((collections - known.keys()) | stale):
+                    try:
+                        info = self._probe(collection_name, alias)
+                    except MilvusException as e:
+                        # Not cached, the collection is probed again on the next refresh
+                        print(f"Probe collection {collection_name} failed: {e}")
+                        if known.pop(collection_name, None) is not None:
+                            changed = True
+                        continue
+                    if info is False:
+                        if known.pop(collection_name, None) is not None:
+                            changed = True
+                        continue
+                    if known.get(collection_name, False) != info:
+                        known[collection_name] = info
+                        changed = True
+                if changed or uri not in self._rev_maps:
+                    self._rebuild_rev_map(uri)
+                    self.save()
+                return self._rev_maps[uri]
+            finally:
+                if connections.has_connection(alias):
+                    connections.disconnect(alias)
+
+    def get_collection(self, connection_args: Dict, kb_name: str) -> str:
+        uri = connection_args.get("uri", "")
+        with self._lock:
+            collection = self._rev_maps.get(uri, {}).get(kb_name)
+        if collection is not None:
+            # Check the cached collection still holds the knowledge base, it may have been renamed or recreated
+            collection = self.refresh(connection_args, reprobe={collection}).get(kb_name)
+        if collection is None:
+            # Unknown name, the knowledge base may have been created or renamed since the last refresh
+            collection = self.refresh(connection_args, reprobe=True).get(kb_name)
+        if collection is None:
+            raise KeyError(kb_name)
+        return collection
+
+    def list_names(
+        self, connection_args: Dict, offset: int = 0, limit: Optional[int] = None, reprobe: bool = False
+    ) -> List[str]:
+        names = sorted(self.refresh(connection_args, reprobe=reprobe).keys())
+        return names[offset : offset + limit if limit is not None else None]
+
+    def save(self) -> None:
+        with self._lock:
+            os.makedirs(os.path.dirname(self.map_file), exist_ok=True)
+            tmp_path = self.map_file + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._collections, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.map_file)
+
+    def load(self) -> bool:
+        if not os.path.isfile(self.map_file):
+            return False
+        try:
+            with open(self.map_file, "r", encoding="utf-8") as f:
+                collections = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Load kbs reverse map {self.map_file} failed: {e}")
+            return False
+        with self._lock:
+            self._collections = collections
+            for uri in collections:
+                self._rebuild_rev_map(uri)
+        return True
+
+
+kbs_rev_map = KbsRevMap()
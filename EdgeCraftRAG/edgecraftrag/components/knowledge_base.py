@@ -1,18 +1,24 @@
 # Copyright (C) 2024 Intel Corporation
 # SPDX-License-Identifier: Apache-2.0
 
+import asyncio
 import json
 import os
 import time
 import uuid
-from typing import Any, Dict, List, Optional, Union
+from typing import Any, Dict, List, Optional, Set, Tuple, Union
 
 from edgecraftrag.base import BaseComponent, BenchType, CompType
+from edgecraftrag.components.bm25 import BM25Index
+from edgecraftrag.components.experience_index import experience_index
+from edgecraftrag.components.local_store import local_store
+from edgecraftrag.components.reload_manifest import ReloadManifest
 from edgecraftrag.config_repository import (
     MilvusConfigRepository,
     MilvusDocumentRecordRepository,
 )
-from edgecraftrag.env import DOCUMENT_DATA_FILE, EXPERIENCE_FILE
+from edgecraftrag.env import EXPERIENCE_FILE
+from llama_index.core.base.embeddings.base import BaseEmbedding
 from llama_index.core.schema import Document
 from pydantic import Field, model_serializer
 
@@ -63,7 +69,17 @@ class Knowledge(BaseComponent):
 
         self.experience_repo = MilvusConfigRepository.create_connection("experience_data", 1)
         self.document_record_repo = MilvusDocumentRecordRepository.create_connection("document_records", 1)
-        self.nodes = []
+        # node_id -> node, in insertion order, so a file's nodes are removed without rebuilding the list
+        self.nodes: Dict[str, Any] = {}
+        # file_id -> ids of the nodes parsed from the file, so a file's nodes are removed without a scan
+        self.file_node_ids: Dict[str, Set[str]] = {}
+        # BM25 index is kept in sync with the indexer and persisted, so BM25 retrieval never rebuilds it
+        self.bm25_index = BM25Index(self.name)
+        # Hashes of file contents and parser config, with the nodes and embeddings built from them
+        self.reload_manifest = ReloadManifest(self.name)
+        if self.comp_type == "experience":
+            # query_search shortlists experiences from this index instead of re-reading them per query
+            experience_index.attach(self.get_all_experience)
         self._origin_json = origin_json
 
     @property
@@ -111,6 +127,8 @@ class Knowledge(BaseComponent):
         if file_path in self.all_document_maps:
             file_id = self.all_document_maps[file_path]
             removed_doc_ids = self._remove_document_records_by_file_id(file_id)
+            self.bm25_index.delete_ref_docs(removed_doc_ids)
+            self.reload_manifest.remove_file(file_path)
             del self.all_document_maps[file_path]
         if file_path in self.file_paths:
             self.file_paths.remove(file_path)
@@ -126,25 +144,17 @@ class Knowledge(BaseComponent):
         if self.experience_repo:
             return [item["config_json"] for item in self.experience_repo.get_configs()]
         else:
+            # Experiences are kept in the local store, the path is still listed for the UI
             if EXPERIENCE_FILE not in self.file_paths:
                 self.file_paths.append(EXPERIENCE_FILE)
-            if not os.path.isfile(self.file_paths[0]):
-                self.ensure_file_exists(self.file_paths[0])
-            with open(self.file_paths[0], "r", encoding="utf-8") as f:
-                return json.load(f)
-
-    def _write_experience_file(self, data: List[Dict]) -> None:
-        if self.experience_repo:
-            return True
-        else:
-            with open(self.file_paths[0], "w", encoding="utf-8") as f:
-                json.dump(data, f, ensure_ascii=False, indent=4)
-            return True
+            return local_store.get_experiences()
 
     def get_all_experience(self) -> List[Dict]:
         return self._read_experience_file()
 
     def get_experience_by_id_or_question(self, req: str) -> Optional[Dict]:
+        if not self.experience_repo:
+            return local_store.get_experience(idx=req.idx, question=req.question)
         for item in self.get_all_experience():
             if item.get("idx") == req.idx or item.get("question") == req.question:
                 return item
@@ -189,56 +199,53 @@ class Knowledge(BaseComponent):
                     success = self.experience_repo.add_config_by_idx(exp_idx, new_item)
                     if success:
                         result.append(new_item)
+            experience_index.upsert(result)
             return result
         else:
-            all_exp = self._read_experience_file()
+            # Experiences written earlier in the same batch are looked up here as well
+            written: Dict[str, Dict] = {}
+            written_by_question: Dict[str, Dict] = {}
             for exp in experiences:
                 question = exp.get("question")
                 if not question:
                     raise ValueError("Each experience must have a 'question'")
                 content = exp.get("content", [])
                 exp_idx = exp.get("idx") or str(uuid.uuid4())
-                existing_idx = None
-                existing_item = None
-                for i, item in enumerate(all_exp):
-                    if item.get("idx") == exp_idx:
-                        existing_idx = i
-                        existing_item = item
-                        break
-                if existing_idx is None:
-                    for i, item in enumerate(all_exp):
-                        if item.get("question") == question:
-                            existing_idx = i
-                            existing_item = item
-                            break
-                if existing_idx is not None:
+                existing_item = written.get(exp_idx) or written_by_question.get(question)
+                if existing_item is None:
+                    existing_item = local_store.get_experience(idx=exp_idx, question=question)
+                if existing_item is not None:
                     if flag:
                         existing_item["content"].extend([c for c in content if c not in existing_item["content"]])
-                        existing_item["question"] = question
                     else:
                         existing_item["content"] = content
-                        existing_item["question"] = question
-                    all_exp[existing_idx] = existing_item
-                    result.append(existing_item)
+                    if written_by_question.get(existing_item["question"]) is existing_item:
+                        del written_by_question[existing_item["question"]]
+                    existing_item["question"] = question
+                    written[existing_item["idx"]] = existing_item
+                    written_by_question[question] = existing_item
                 else:
                     new_item = {
                         "idx": exp_idx,
                         "question": question,
                         "content": content,
                     }
-                    all_exp.append(new_item)
-                    result.append(new_item)
-            self._write_experience_file(all_exp)
+                    written[exp_idx] = new_item
+                    written_by_question[question] = new_item
+            result = list(written.values())
+            local_store.upsert_experiences(result)
+            experience_index.upsert(result)
             return result
 
     def delete_experience(self, exp_idx: str) -> bool:
         if self.experience_repo:
-            return self.experience_repo.delete_config_by_idx(exp_idx)
+            success = self.experience_repo.delete_config_by_idx(exp_idx)
+            if success:
+                experience_index.delete(exp_idx)
+            return success
         else:
-            all_exp = self._read_experience_file()
-            remaining = [item for item in all_exp if item.get("idx") != exp_idx]
-            if len(remaining) != len(all_exp):
-                self._write_experience_file(remaining)
+            if local_store.delete_experience(exp_idx):
+                experience_index.delete(exp_idx)
                 return True
             return False
 
@@ -246,12 +253,14 @@ class Knowledge(BaseComponent):
         if self.experience_repo:
             try:
                 self.experience_repo.clear_all_config()
+                experience_index.clear()
                 return True
             except Exception as e:
                 print(f"Clear Milvus experiences failed: {e}")
                 return False
         else:
-            self._write_experience_file([])
+            local_store.clear_experiences()
+            experience_index.clear()
             return True
 
     def update_experience(self, exp_idx: str, new_question: str, new_content: List[str]) -> Optional[Dict]:
@@ -262,14 +271,14 @@ class Knowledge(BaseComponent):
         }
         if self.experience_repo:
             success = self.experience_repo.update_config_by_idx(exp_idx, updated_item)
-            return updated_item if success else None
+            if not success:
+                return None
+            experience_index.upsert([updated_item])
+            return updated_item
         else:
-            all_exp = self._read_experience_file()
-            for i, item in enumerate(all_exp):
-                if item.get("idx") == exp_idx:
-                    all_exp[i] = updated_item
-                    self._write_experience_file(all_exp)
-                    return updated_item
+            if local_store.update_experience(updated_item):
+                experience_index.upsert([updated_item])
+                return updated_item
             return None
 
     def add_experiences_from_file(self, file_path: str, flag: bool = False) -> List[Dict]:
@@ -300,67 +309,50 @@ class Knowledge(BaseComponent):
         if records and self.document_record_repo:
             self.document_record_repo.save_records(records)
         elif records:
-            if not os.path.isfile(DOCUMENT_DATA_FILE):
-                self.ensure_file_exists(DOCUMENT_DATA_FILE)
-            if os.path.exists(DOCUMENT_DATA_FILE):
-                with open(DOCUMENT_DATA_FILE, "r", encoding="utf-8") as f:
-                    existing_data = json.load(f)
-            else:
-                existing_data = []
-            existing_data.extend(records)
-            with open(DOCUMENT_DATA_FILE, "w", encoding="utf-8") as f:
-                json.dump(existing_data, f, ensure_ascii=False, indent=4)
+            local_store.add_document_records(records)
 
     def _remove_document_records_by_file_id(self, file_id: str) -> List[Dict[str, str]]:
         deleted_records = []
         if self.document_record_repo:
             deleted_records = self.document_record_repo.delete_records_by_file_id(file_id)
         else:
-            if os.path.exists(DOCUMENT_DATA_FILE):
-                with open(DOCUMENT_DATA_FILE, "r", encoding="utf-8") as f:
-                    all_document_data = json.load(f)
-                deleted_records = [item.get("doc_id") for item in all_document_data if item.get("file_id") == file_id]
-                result_documents = [item for item in all_document_data if item.get("file_id") != file_id]
-                if len(deleted_records) > 0:
-                    with open(DOCUMENT_DATA_FILE, "w", encoding="utf-8") as f:
-                        json.dump(result_documents, f, ensure_ascii=False, indent=4)
+            deleted_records = local_store.delete_document_records(file_id)
         return deleted_records
 
     def clear_documents(self):
         for file_id in self.all_document_maps.values():
             self._remove_document_records_by_file_id(file_id)
+        self.bm25_index.remove_persisted()
+        self.reload_manifest.remove_persisted()
         return True
 
-    # Make sure the folder and its files exist
-    def ensure_file_exists(self, file_paths):
-        dir_path = os.path.dirname(file_paths)
-        os.makedirs(dir_path, exist_ok=True)
-        if not os.path.exists(file_paths):
-            with open(file_paths, "w", encoding="utf-8") as f:
-                json.dump([], f, ensure_ascii=False, indent=4)
-
     # Calculate the number of files or experience
     def calculate_totals(self):
         if self.comp_type == "knowledge":
             total = len(self.file_paths)
         elif self.comp_type == "experience":
-            total = len(self.get_all_experience())
+            total = len(self.get_all_experience()) if self.experience_repo else local_store.count_experiences()
         else:
             total = None
         return total
 
     def update_nodes(self, nodes: List[Document]):
-        self.nodes = nodes
+        self.nodes = {node.node_id: node for node in nodes}
+        self.file_node_ids = {}
 
     def add_nodes(self, nodes: List[Document]):
-        self.nodes.extend(nodes)
+        self.nodes.update((node.node_id, node) for node in nodes)
+
+    def get_nodes(self) -> List[Any]:
+        return list(self.nodes.values())
 
     async def run_node_parser(self, docs: List[Document]) -> Any:
         start = 0
         if self.enable_benchmark:
             benchmark_index = self.benchmark.init_benchmark_data()
             start = time.perf_counter()
-        nodes = self.node_parser.run(docs=docs)
+        # Parsing is CPU bound (and may wait on worker processes), keep it off the event loop
+        nodes = await asyncio.to_thread(self.node_parser.run, docs=docs)
         if self.enable_benchmark:
             benchmark_data = (
                 self.benchmark.get_benchmark_data(benchmark_index, CompType.NODEPARSER) + time.perf_counter() - start
@@ -372,13 +364,68 @@ class Knowledge(BaseComponent):
         self.add_nodes(nodes)
         return nodes
 
+    def get_cached_nodes(self, file_path: str) -> Tuple[Optional[List[Any]], Optional[str]]:
+        return self.reload_manifest.get_nodes(file_path, self.node_parser)
+
+    def cache_nodes(self, file_path: str, nodes: List[Any], content_hash: Optional[str] = None) -> None:
+        self.reload_manifest.set_nodes(file_path, self.node_parser, nodes, content_hash)
+
+    def _with_cached_embeddings(self, nodes, prune: bool = False):
+        model = getattr(self.indexer, "model", None)
+        if not isinstance(model, BaseEmbedding):
+            return nodes
+        return self.reload_manifest.with_embeddings(nodes, model, prune=prune)
+
     async def update_nodes_to_indexer(self) -> Any:
         if self.indexer is not None:
-            self.indexer.insert_nodes(self.nodes)
+            nodes = self.get_nodes()
+            self.indexer.insert_nodes(self._with_cached_embeddings(nodes, prune=True))
+            self.bm25_index.rebuild(nodes)
+            self.reload_manifest.save()
 
     async def add_nodes_to_indexer(self, nodes) -> Any:
         if self.indexer is not None:
-            self.indexer.insert_nodes(nodes)
+            self.indexer.insert_nodes(self._with_cached_embeddings(nodes))
+            self.bm25_index.add_nodes(nodes)
+            self.reload_manifest.save()
+            if getattr(self.indexer, "needs_retrain", None) and self.indexer.needs_retrain():
+                self.retrain_indexer()
+
+    def get_embedded_nodes(self) -> List[Any]:
+        """Every node with its embedding, from the reload manifest so only nodes not seen before are embedded."""
+        return self._with_cached_embeddings(self.get_nodes())
+
+    def retrain_indexer(self) -> None:
+        """Rebuild and retrain the FAISS index on every node, embeddings come from the reload manifest."""
+        self.indexer.retrain_faiss_index(self.get_embedded_nodes(), self.name)
+
+    def track_file_nodes(self, file_path: str, nodes: List[Any]) -> None:
+        file_id = self.all_document_maps.get(file_path)
+        if file_id is not None:
+            self.file_node_ids.setdefault(file_id, set()).update(node.node_id for node in nodes)
+
+    def has_file_nodes(self, file_id: str) -> bool:
+        return file_id in self.file_node_ids
+
+    # Delta operations, only the nodes of one file go through the indexer
+    async def insert_file_nodes(self, file_path: str, nodes: List[Any]) -> Any:
+        # run_node_parser has already added the nodes to self.nodes
+        self.track_file_nodes(file_path, nodes)
+        await self.add_nodes_to_indexer(nodes)
+
+    async def delete_file_nodes(self, file_id: str) -> Set[str]:
+        node_ids = self.file_node_ids.pop(file_id, set())
+        if not node_ids:
+            return node_ids
+        for node_id in node_ids:
+            self.nodes.pop(node_id, None)
+        if self.indexer is not None:
+            self.indexer.delete_nodes(node_ids)
+            self.bm25_index.delete_nodes(node_ids)
+            if self.indexer.needs_rebuild():
+                self.indexer.reinitialize_indexer(self.name)
+                await self.update_nodes_to_indexer()
+        return node_ids
 
     def run(self, **kwargs) -> Any:
         pass
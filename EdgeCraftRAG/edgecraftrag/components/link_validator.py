@@ -0,0 +1,109 @@
+# Copyright (C) 2025 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+import asyncio
+import os
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+import aiohttp
+
+# validate: check unknown links before answering
+# cached: answer from the cache, unknown links are kept and checked in the background for later requests
+# off: no network access, every well-formed link is kept
+LINK_VALIDATION_MODES = ("validate", "cached", "off")
+
+
+class LinkValidator:
+    """Checks link reachability with bounded concurrency and a TTL cache of results."""
+
+    def __init__(
+        self,
+        mode: Optional[str] = None,
+        timeout: Optional[float] = None,
+        ttl: Optional[float] = None,
+        max_concurrency: Optional[int] = None,
+        max_cache_size: int = 4096,
+    ):
+        self.mode = mode or os.getenv("LINK_VALIDATION_MODE", "validate")
+        if self.mode not in LINK_VALIDATION_MODES:
+            raise ValueError(f"Link validation mode {self.mode} not supported")
+        self.timeout = timeout or float(os.getenv("LINK_VALIDATION_TIMEOUT", "2"))
+        self.ttl = ttl or float(os.getenv("LINK_VALIDATION_TTL", "3600"))
+        self.max_concurrency = max_concurrency or int(os.getenv("LINK_VALIDATION_CONCURRENCY", "8"))
+        self.max_cache_size = max_cache_size
+        # url -> (reachable, expiry time)
+        self._cache: Dict[str, Tuple[bool, float]] = {}
+        self._pending: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def _get_cached(self, url: str) -> Optional[bool]:
+        entry = self._cache.get(url)
+        if entry and entry[1] > time.monotonic():
+            return entry[0]
+        return None
+
+    def _set_cached(self, url: str, reachable: bool) -> None:
+        now = time.monotonic()
+        if len(self._cache) >= self.max_cache_size:
+            self._cache = {k: v for k, v in self._cache.items() if v[1] > now}
+            if len(self._cache) >= self.max_cache_size:
+                self._cache.pop(next(iter(self._cache)))
+        self._cache[url] = (reachable, now + self.ttl)
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self._session
+
+    async def _check(self, url: str) -> bool:
+        async with self._semaphore:
+            try:
+                session = self._get_session()
+                async with session.head(url, allow_redirects=True) as response:
+                    status = response.status
+                if status in (405, 501):
+                    # Some servers do not implement HEAD
+                    async with session.get(url, allow_redirects=True) as response:
+                        status = response.status
+                reachable = status == 200
+            except Exception:
+                reachable = False
+        self._set_cached(url, reachable)
+        self._pending.discard(url)
+        return reachable
+
+    def _check_in_background(self, url: str) -> None:
+        if url in self._pending:
+            return
+        self._pending.add(url)
+        task = asyncio.create_task(self._check(url))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def filter_reachable(self, urls: List[str]) -> List[str]:
+        urls = list(dict.fromkeys(urls))
+        if self.mode == "off":
+            return urls
+        results = {}
+        unknown = []
+        for url in urls:
+            cached = self._get_cached(url)
+            if cached is None:
+                unknown.append(url)
+            else:
+                results[url] = cached
+        if self.mode == "validate":
+            checked = await asyncio.gather(*[self._check(url) for url in unknown])
+            results.update(zip(unknown, checked))
+        else:
+            for url in unknown:
+                # Not known to be broken yet, dropped only once a check has failed
+                results[url] = True
+                self._check_in_background(url)
+        return [url for url in urls if results.get(url)]
+
+
+link_validator = LinkValidator()
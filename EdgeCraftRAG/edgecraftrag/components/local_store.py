@@ -0,0 +1,207 @@
+# Copyright (C) 2025 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+import os
+import sqlite3
+import threading
+from typing import Dict, List, Optional
+
+from edgecraftrag.env import DOCUMENT_DATA_FILE, EXPERIENCE_FILE, LOCAL_STORE_FILE
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS experiences (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    idx TEXT NOT NULL UNIQUE,
+    question TEXT NOT NULL,
+    content TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS experiences_question ON experiences (question);
+CREATE TABLE IF NOT EXISTS document_records (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    file_id TEXT NOT NULL,
+    file_path TEXT,
+    doc_id TEXT,
+    metadata TEXT
+);
+CREATE INDEX IF NOT EXISTS document_records_file_id ON document_records (file_id);
+"""
+
+
+class LocalStore:
+    """SQLite store for experiences and document records, used when no metadata database is configured.
+
+    Rows are indexed by experience idx, question and file id, and every write is a small transaction
+    instead of rewriting a JSON file. The JSON files written by earlier versions are imported once,
+    the first time the store is opened.
+    """
+
+    def __init__(
+        self,
+        db_path: str = LOCAL_STORE_FILE,
+        experience_file: str = EXPERIENCE_FILE,
+        document_data_file: str = DOCUMENT_DATA_FILE,
+    ):
+        self.db_path = db_path
+        self.experience_file = experience_file
+        self.document_data_file = document_data_file
+        self._lock = threading.RLock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        with self._lock:
+            if self._conn is None:
+                os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+                conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+                conn.row_factory = sqlite3.Row
+                # WAL: readers do not block the writer, NORMAL sync is durable across application crashes
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+                conn.executescript(_SCHEMA)
+                self._conn = conn
+                self._migrate()
+            return self._conn
+
+    def _transaction(self):
+        conn = self._connect()
+        return _Transaction(conn, self._lock)
+
+    def _query(self, sql: str, params=()) -> List[sqlite3.Row]:
+        # One connection is shared by all threads, a read must not run inside another thread's transaction
+        conn = self._connect()
+        with self._lock:
+            return conn.execute(sql, params).fetchall()
+
+    def _migrate(self) -> None:
+        conn = self._conn
+        migrations = (
+            ("experiences_json", self.experience_file, self._import_experiences),
+            ("document_records_json", self.document_data_file, self._import_document_records),
+        )
+        for key, path, import_fn in migrations:
+            if conn.execute("SELECT 1 FROM meta WHERE key = ?", (key,)).fetchone():
+                continue
+            with _Transaction(conn, self._lock):
+                if os.path.isfile(path):
+                    try:
+                        with open(path, "r", encoding="utf-8") as f:
+                            data = json.load(f)
+                        count = import_fn(data if isinstance(data, list) else [])
+                        print(f"Imported {count} rows from {path} into {self.db_path}")
+                    except (OSError, ValueError) as e:
+                        print(f"Import {path} failed, starting empty: {e}")
+                conn.execute("INSERT INTO meta (key, value) VALUES (?, ?)", (key, path))
+
+    def _import_experiences(self, data: List[Dict]) -> int:
+        rows = [
+            (item["idx"], item["question"], json.dumps(item.get("content", []), ensure_ascii=False))
+            for item in data
+            if item.get("idx") and item.get("question")
+        ]
+        self._conn.executemany(
+            "INSERT INTO experiences (idx, question, content) VALUES (?, ?, ?) ON CONFLICT (idx) DO NOTHING", rows
+        )
+        return len(rows)
+
+    def _import_document_records(self, data: List[Dict]) -> int:
+        self._insert_document_records(data)
+        return len(data)
+
+    # Experiences
+    @staticmethod
+    def _experience(row) -> Dict:
+        return {"idx": row["idx"], "question": row["question"], "content": json.loads(row["content"])}
+
+    def get_experiences(self) -> List[Dict]:
+        rows = self._query("SELECT idx, question, content FROM experiences ORDER BY seq")
+        return [self._experience(row) for row in rows]
+
+    def count_experiences(self) -> int:
+        return self._query("SELECT COUNT(*) FROM experiences")[0][0]
+
+    def get_experience(self, idx: Optional[str] = None, question: Optional[str] = None) -> Optional[Dict]:
+        rows = []
+        if idx:
+            rows = self._query("SELECT idx, question, content FROM experiences WHERE idx = ?", (idx,))
+        if not rows and question:
+            rows = self._query(
+                "SELECT idx, question, content FROM experiences WHERE question = ? ORDER BY seq LIMIT 1", (question,)
+            )
+        return self._experience(rows[0]) if rows else None
+
+    def upsert_experiences(self, experiences: List[Dict]) -> None:
+        with self._transaction() as conn:
+            conn.executemany(
+                "INSERT INTO experiences (idx, question, content) VALUES (?, ?, ?) "
+                "ON CONFLICT (idx) DO UPDATE SET question = excluded.question, content = excluded.content",
+                [(exp["idx"], exp["question"], json.dumps(exp["content"], ensure_ascii=False)) for exp in experiences],
+            )
+
+    def update_experience(self, experience: Dict) -> bool:
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE experiences SET question = ?, content = ? WHERE idx = ?",
+                (experience["question"], json.dumps(experience["content"], ensure_ascii=False), experience["idx"]),
+            )
+            return cursor.rowcount > 0
+
+    def delete_experience(self, idx: str) -> bool:
+        with self._transaction() as conn:
+            return conn.execute("DELETE FROM experiences WHERE idx = ?", (idx,)).rowcount > 0
+
+    def clear_experiences(self) -> None:
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM experiences")
+
+    # Document records
+    def _insert_document_records(self, records: List[Dict]) -> None:
+        self._conn.executemany(
+            "INSERT INTO document_records (file_id, file_path, doc_id, metadata) VALUES (?, ?, ?, ?)",
+            [
+                (
+                    rec.get("file_id"),
+                    rec.get("file_path"),
+                    rec.get("doc_id"),
+                    json.dumps(rec.get("metadata", {}), ensure_ascii=False, default=str),
+                )
+                for rec in records
+            ],
+        )
+
+    def add_document_records(self, records: List[Dict]) -> None:
+        with self._transaction():
+            self._insert_document_records(records)
+
+    def delete_document_records(self, file_id: str) -> List[str]:
+        with self._transaction() as conn:
+            rows = conn.execute("SELECT doc_id FROM document_records WHERE file_id = ?", (file_id,)).fetchall()
+            conn.execute("DELETE FROM document_records WHERE file_id = ?", (file_id,))
+        return [row["doc_id"] for row in rows]
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class _Transaction:
+    def __init__(self, conn: sqlite3.Connection, lock: threading.RLock):
+        self.conn = conn
+        self.lock = lock
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.lock.acquire()
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            self.lock.release()
+        return False
+
+
+local_store = LocalStore()
@@ -1,8 +1,17 @@
 # Copyright (C) 2024 Intel Corporation
 # SPDX-License-Identifier: Apache-2.0
 
-from typing import Any
-
+import atexit
+import multiprocessing
+import os
+import queue
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, Optional, Tuple
+
+import psutil
 from edgecraftrag.base import BaseComponent, CompType, NodeParserType
 from edgecraftrag.utils import IMG_OUTPUT_DIR, DocxParagraphPicturePartitioner
 from llama_index.core.node_parser import HierarchicalNodeParser, SentenceSplitter, SentenceWindowNodeParser
@@ -88,6 +97,69 @@ class SWindowNodeParser(BaseComponent, SentenceWindowNodeParser):
         return set
 
 
+# Set in each pool worker, the worker reports (pid, task id) on it whenever it starts a task
+_started_tasks = None
+
+
+def _init_parse_worker(started_tasks=None):
+    global _started_tasks
+    _started_tasks = started_tasks
+    register_picture_partitioner(DocxParagraphPicturePartitioner)
+
+
+def _run_pool_task(task_id: int, *args) -> List:
+    if _started_tasks is not None:
+        _started_tasks.put((os.getpid(), task_id))
+    return _parse_task(*args)
+
+
+def _resident_memory(pid: int) -> int:
+    # OCR and layout models may run in child processes of the worker, they count toward its memory
+    try:
+        process = psutil.Process(pid)
+        rss = process.memory_info().rss
+        for child in process.children(recursive=True):
+            try:
+                rss += child.memory_info().rss
+            except psutil.Error:
+                pass
+        return rss
+    except psutil.Error:
+        return 0
+
+
+def _parse_task(
+    file_path: str, page_range: Optional[Tuple[int, int]], unstructured_kwargs: Dict, document_kwargs: Dict
+) -> List:
+    """Parse a whole file, or pages [start, end) of a PDF."""
+    reader = UnstructuredReader(excluded_metadata_keys=["fake"])
+    if page_range is None:
+        return reader.load_data(
+            file=file_path,
+            unstructured_kwargs=unstructured_kwargs,
+            split_documents=True,
+            document_kwargs=document_kwargs,
+        )
+    from pypdf import PdfReader, PdfWriter
+
+    start, end = page_range
+    writer = PdfWriter()
+    for page in PdfReader(file_path).pages[start:end]:
+        writer.add_page(page)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        part_path = os.path.join(tmp_dir, os.path.basename(file_path))
+        with open(part_path, "wb") as f:
+            writer.write(f)
+        # Keep the original file name and page numbers in the element metadata
+        part_kwargs = dict(unstructured_kwargs, metadata_filename=file_path, starting_page_number=start + 1)
+        return reader.load_data(
+            file=part_path,
+            unstructured_kwargs=part_kwargs,
+            split_documents=True,
+            document_kwargs=document_kwargs,
+        )
+
+
 class UnstructedNodeParser(BaseComponent, UnstructuredReader):
     """UnstructedNodeParser is a component that processes unstructured data.
 
@@ -124,38 +196,198 @@ class UnstructedNodeParser(BaseComponent, UnstructuredReader):
         self._extract_images_in_pdf = True
         self._image_output_dir = IMG_OUTPUT_DIR
         self._image_language = ["eng", "chi_sim", "chi"]
+        # Process pool ingestion, 1 worker parses in-process one file at a time
+        self._num_workers = int(os.getenv("UNSTRUCTURED_PARSE_WORKERS", "1"))
+        self._worker_memory_mb = int(os.getenv("UNSTRUCTURED_WORKER_MEMORY_MB", "0"))
+        # PDFs longer than this are split into page ranges parsed by different workers, 0 disables splitting
+        self._pdf_pages_per_task = int(os.getenv("UNSTRUCTURED_PDF_PAGES_PER_TASK", "20"))
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._started_tasks = None
+        self._atexit_registered = False
+        self.last_parse_report: Optional[Dict[str, Any]] = None
+
+    def _unstructured_kwargs(self) -> Dict[str, Any]:
+        return {
+            "strategy": "hi_res",
+            "extract_images_in_pdf": self._extract_images_in_pdf,
+            "extract_image_block_types": ["Image"],
+            "extract_image_block_output_dir": self._image_output_dir,
+            "languages": self._image_language,
+            "chunking_strategy": "basic",
+            "overlap_all": True,
+            "max_characters": self.chunk_size,
+            "overlap": self.chunk_overlap,
+        }
+
+    def _effective_workers(self) -> int:
+        workers = self._num_workers
+        if workers > 1 and self._worker_memory_mb > 0:
+            # Do not start more workers than the free memory can hold at their cap
+            available_mb = psutil.virtual_memory().available // (1024 * 1024)
+            workers = min(workers, available_mb // self._worker_memory_mb)
+        return max(1, workers)
+
+    def _get_pool(self, workers: int) -> ProcessPoolExecutor:
+        if self._pool is None or self._pool._max_workers != workers:
+            self._shutdown_pool()
+            # spawn: the server process holds threads and OpenVINO state that must not be forked
+            mp_context = multiprocessing.get_context("spawn")
+            if self._started_tasks is None:
+                self._started_tasks = mp_context.Queue()
+            self._pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=mp_context,
+                initializer=_init_parse_worker,
+                initargs=(self._started_tasks,),
+            )
+            if not self._atexit_registered:
+                atexit.register(self._shutdown_pool)
+                self._atexit_registered = True
+        return self._pool
+
+    def _shutdown_pool(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+    def _kill_oversized_workers(self, pool: ProcessPoolExecutor) -> List[int]:
+        """Kill workers whose resident memory exceeds the cap, returns their pids."""
+        limit = self._worker_memory_mb * 1024 * 1024
+        killed = []
+        for process in list((pool._processes or {}).values()):
+            rss = _resident_memory(process.pid)
+            if rss > limit:
+                print(f"Parsing worker {process.pid} uses {rss // (1024 * 1024)} MB, over the cap, recycling it")
+                process.kill()
+                killed.append(process.pid)
+        return killed
+
+    def _drain_started_tasks(self, running: Dict[int, int]) -> None:
+        # pid -> task id the worker started last, a worker runs one task at a time
+        while True:
+            try:
+                pid, task_id = self._started_tasks.get_nowait()
+            except queue.Empty:
+                return
+            running[pid] = task_id
+
+    def _run_in_pool(self, workers: int, tasks: List, unstructured_kwargs: Dict, document_kwargs: Dict) -> List:
+        """Run tasks on the worker pool, results are in task order whichever worker finishes first.
+
+        With UNSTRUCTURED_WORKER_MEMORY_MB set, worker memory is checked every second and a worker over the
+        cap is killed. The pool is then recreated and the unfinished tasks are resubmitted, a task that
+        fails this way more than twice makes the parse fail. Only the tasks that were running on the killed
+        (or crashed) worker count an attempt, the others are just resubmitted.
+        """
+        results: List[Optional[List]] = [None] * len(tasks)
+        attempts = [0] * len(tasks)
+        remaining = list(range(len(tasks)))
+        running: Dict[int, int] = {}
+        while remaining:
+            pool = self._get_pool(workers)
+            futures = {
+                pool.submit(_run_pool_task, i, *tasks[i], unstructured_kwargs, document_kwargs): i for i in remaining
+            }
+            pending = set(futures)
+            broken = False
+            killed: List[int] = []
+            while pending:
+                done, pending = wait(pending, timeout=1.0, return_when=FIRST_COMPLETED)
+                # Drained on every tick as well, so the queue never fills up
+                self._drain_started_tasks(running)
+                for future in done:
+                    try:
+                        results[futures[future]] = future.result()
+                    except BrokenProcessPool:
+                        broken = True
+                if pending and not broken and self._worker_memory_mb > 0:
+                    # The pool breaks, the pending futures then complete with BrokenProcessPool
+                    killed = self._kill_oversized_workers(pool)
+                    broken = bool(killed)
+            remaining = [i for i in remaining if results[i] is None]
+            if broken:
+                self._drain_started_tasks(running)
+                self._shutdown_pool()
+                charged = {running[pid] for pid in killed if pid in running}
+                if not charged:
+                    # A worker crashed on its own, which one is unknown, charge every task that had started
+                    charged = set(running.values())
+                for i in remaining:
+                    if i in charged:
+                        attempts[i] += 1
+                running.clear()
+                if any(attempts[i] > 2 for i in remaining):
+                    raise RuntimeError(
+                        "A document parsing worker died, lower UNSTRUCTURED_PARSE_WORKERS or raise UNSTRUCTURED_WORKER_MEMORY_MB"
+                    )
+        return results
+
+    def _plan_tasks(self, file_paths: List[str], split_pdfs: bool) -> List[Tuple[str, Optional[Tuple[int, int]]]]:
+        tasks = []
+        for file_path in file_paths:
+            num_pages = 0
+            if split_pdfs and self._pdf_pages_per_task > 0 and file_path.lower().endswith(".pdf"):
+                try:
+                    from pypdf import PdfReader
+
+                    num_pages = len(PdfReader(file_path).pages)
+                except Exception as e:
+                    print(f"Cannot read page count of {file_path}, parsing it as a whole: {e}")
+            if num_pages > self._pdf_pages_per_task:
+                for start in range(0, num_pages, self._pdf_pages_per_task):
+                    tasks.append((file_path, (start, min(start + self._pdf_pages_per_task, num_pages))))
+            else:
+                tasks.append((file_path, None))
+        return tasks
+
+    def parse_files(self, file_paths: List[str]) -> List:
+        start_time = time.perf_counter()
+        unstructured_kwargs = self._unstructured_kwargs()
+        document_kwargs = {
+            "excluded_embed_metadata_keys": self._excluded_embed_metadata_keys,
+            "excluded_llm_metadata_keys": self._excluded_llm_metadata_keys,
+        }
+        workers = self._effective_workers()
+        tasks = self._plan_tasks(file_paths, split_pdfs=workers > 1)
+        if workers <= 1 or len(tasks) <= 1:
+            register_picture_partitioner(DocxParagraphPicturePartitioner)
+            results = [_parse_task(path, pages, unstructured_kwargs, document_kwargs) for path, pages in tasks]
+        else:
+            results = self._run_in_pool(workers, tasks, unstructured_kwargs, document_kwargs)
+
+        nodelist = []
+        sequence_offsets: Dict[str, int] = {}
+        for (file_path, page_range), nodes in zip(tasks, results):
+            if page_range is not None:
+                # Page ranges number their elements from 0, continue the numbering of the file
+                offset = sequence_offsets.get(file_path, 0)
+                for node in nodes:
+                    node.metadata["sequence_number"] = node.metadata.get("sequence_number", 0) + offset
+                sequence_offsets[file_path] = offset + len(nodes)
+            nodelist += nodes
+
+        elapsed = time.perf_counter() - start_time
+        num_pages = len({(node.metadata.get("filename"), node.metadata.get("page_number")) for node in nodelist})
+        self.last_parse_report = {
+            "files": len(file_paths),
+            "tasks": len(tasks),
+            "workers": workers,
+            "pages": num_pages,
+            "nodes": len(nodelist),
+            "seconds": elapsed,
+            "pages_per_s": num_pages / elapsed if elapsed else 0.0,
+            "nodes_per_s": len(nodelist) / elapsed if elapsed else 0.0,
+        }
+        print(f"Unstructured parsing report: {self.last_parse_report}")
+        return nodelist
 
     def run(self, **kwargs) -> Any:
         for k, v in kwargs.items():
             if k == "docs":
-                register_picture_partitioner(DocxParagraphPicturePartitioner)
-                nodelist = []
-                processed_paths = set()
-                for document in v:
-                    if "file_path" in document.metadata and document.metadata["file_path"] not in processed_paths:
-                        file_path = document.metadata["file_path"]
-                        nodes = self.load_data(
-                            file=file_path,
-                            unstructured_kwargs={
-                                "strategy": "hi_res",
-                                "extract_images_in_pdf": self._extract_images_in_pdf,
-                                "extract_image_block_types": ["Image"],
-                                "extract_image_block_output_dir": self._image_output_dir,
-                                "languages": self._image_language,
-                                "chunking_strategy": "basic",
-                                "overlap_all": True,
-                                "max_characters": self.chunk_size,
-                                "overlap": self.chunk_overlap,
-                            },
-                            split_documents=True,
-                            document_kwargs={
-                                "excluded_embed_metadata_keys": self._excluded_embed_metadata_keys,
-                                "excluded_llm_metadata_keys": self._excluded_llm_metadata_keys,
-                            },
-                        )
-                        nodelist += nodes
-                        processed_paths.add(file_path)
-                return nodelist
+                file_paths = list(
+                    dict.fromkeys(document.metadata["file_path"] for document in v if "file_path" in document.metadata)
+                )
+                return self.parse_files(file_paths)
 
         return None
 
@@ -4,20 +4,23 @@
 import asyncio
 import json
 import os
+import threading
 import time
-from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Callable, List, Optional
 
 from comps.cores.proto.api_protocol import ChatCompletionRequest
 from edgecraftrag.base import (
     BaseComponent,
+    BenchType,
     CallbackType,
     CompType,
+    FusionType,
     GeneratorType,
     InferenceType,
     NodeParserType,
     RetrieverType,
 )
+from edgecraftrag.components.experience_index import get_embed_model
 from edgecraftrag.components.generator import clone_generator
 from edgecraftrag.components.postprocessor import RerankProcessor
 from edgecraftrag.components.query_preprocess import query_search
@@ -26,6 +29,7 @@ from edgecraftrag.components.retriever import (
     KBadminRetriever,
     SimpleBM25Retriever,
     VectorSimRetriever,
+    fuse_retrieval_results,
 )
 from edgecraftrag.env import SEARCH_CONFIG_PATH, SEARCH_DIR
 from fastapi.responses import StreamingResponse
@@ -72,6 +76,8 @@ class Pipeline(BaseComponent):
         self._origin_json = origin_json if origin_json is not None else "{}"
         self.retriever_type = ""
         self.retrieve_topk = 0
+        self.fusion_type = FusionType.CONCAT
+        self.retrieve_timeout = float(os.getenv("RETRIEVE_TIMEOUT", "30"))
         self.retrievers = []
 
     # TODO: consider race condition
@@ -151,7 +157,8 @@ class Pipeline(BaseComponent):
                 if isinstance(llm, str):
                     return llm == model_id
                 else:
-                    return llm().model_id == model_id
+                    # Model handles know their id without resolving (and possibly reloading) the model
+                    return (getattr(llm, "model_id", None) or llm().model_id) == model_id
         return False
 
     def get_generator(self, generator_type: str) -> Optional[BaseComponent]:
@@ -161,9 +168,15 @@ class Pipeline(BaseComponent):
                     return gen
         return None
 
-    def update_retriever_config(self, retriever_type: str, retrieve_topk: int):
+    def update_retriever_config(
+        self, retriever_type: str, retrieve_topk: int, fusion_type: str = None, retrieve_timeout: float = None
+    ):
         self.retriever_type = retriever_type
         self.retrieve_topk = retrieve_topk
+        if fusion_type is not None:
+            self.fusion_type = FusionType(fusion_type)
+        if retrieve_timeout is not None:
+            self.retrieve_timeout = retrieve_timeout
 
     def update_retriever_list(self, active_kbs):
         self.clear_retrievers()
@@ -182,7 +195,9 @@ class Pipeline(BaseComponent):
                         case RetrieverType.AUTOMERGE:
                             retriever = AutoMergeRetriever(indexer, similarity_top_k=similarity_top_k)
                         case RetrieverType.BM25:
-                            retriever = SimpleBM25Retriever(indexer, similarity_top_k=similarity_top_k)
+                            retriever = SimpleBM25Retriever(
+                                indexer, active_kb.bm25_index, similarity_top_k=similarity_top_k
+                            )
                         case _:
                             raise ValueError(f"Retriever type {self.retriever_type} not supported")
                 if retriever:
@@ -203,7 +218,7 @@ class Pipeline(BaseComponent):
                         case RetrieverType.AUTOMERGE:
                             retriever = AutoMergeRetriever(indexer, similarity_top_k=similarity_top_k)
                         case RetrieverType.BM25:
-                            retriever = SimpleBM25Retriever(indexer, similarity_top_k=similarity_top_k)
+                            retriever = SimpleBM25Retriever(indexer, kb.bm25_index, similarity_top_k=similarity_top_k)
                         case _:
                             raise ValueError(f"Retriever type {self.retriever_type} not supported")
                 break
@@ -231,6 +246,36 @@ class Pipeline(BaseComponent):
         return False
 
 
+async def run_retrievers(pl: Pipeline, query: str, top_k: Optional[int]) -> List:
+    # Every active knowledge base has its own retriever, run them concurrently off the
+    # event loop so the latency is bounded by the slowest one instead of their sum
+    async def run_with_timeout(retriever):
+        if hasattr(retriever, "arun"):
+            # Natively async retrievers, e.g. batched remote embedding
+            return await asyncio.wait_for(retriever.arun(query=query, top_k=top_k), timeout=pl.retrieve_timeout)
+        # wait_for only cancels the await, the worker thread keeps running and holds the retriever's
+        # run lock until its search returns. The flag makes a run that has not started yet skip the search,
+        # so timed out queries do not pile up behind a slow one.
+        cancelled = threading.Event()
+        run = asyncio.to_thread(retriever.run, query=query, top_k=top_k, cancelled=cancelled)
+        try:
+            return await asyncio.wait_for(run, timeout=pl.retrieve_timeout)
+        except asyncio.TimeoutError:
+            cancelled.set()
+            raise
+
+    results = await asyncio.gather(*[run_with_timeout(r) for r in pl.retrievers], return_exceptions=True)
+    retri_lists = []
+    for retriever, res in zip(pl.retrievers, results):
+        if isinstance(res, asyncio.TimeoutError):
+            print(f"Retriever {retriever.idx} timed out after {pl.retrieve_timeout}s, its results are skipped")
+            continue
+        if isinstance(res, BaseException):
+            raise res
+        retri_lists.append(res or [])
+    return fuse_retrieval_results(retri_lists, pl.fusion_type)
+
+
 async def run_retrieve(pl: Pipeline, chat_request: ChatCompletionRequest) -> Any:
     query = chat_request.messages
     top_k = None if chat_request.k == ChatCompletionRequest.model_fields["k"].default else chat_request.k
@@ -239,9 +284,7 @@ async def run_retrieve(pl: Pipeline, chat_request: ChatCompletionRequest) -> Any
     if pl.enable_benchmark:
         benchmark_index = pl.benchmark.init_benchmark_data()
         start = time.perf_counter()
-    retri_res = []
-    for retriever in pl.retrievers:
-        retri_res.extend(retriever.run(query=query, top_k=top_k))
+    retri_res = await run_retrievers(pl, query, top_k)
     if pl.enable_benchmark:
         pl.benchmark.update_benchmark_data(benchmark_index, CompType.RETRIEVER, time.perf_counter() - start)
     contexts[CompType.RETRIEVER] = retri_res
@@ -275,9 +318,7 @@ async def run_retrieve_postprocess(pl: Pipeline, chat_request: ChatCompletionReq
     if pl.enable_benchmark:
         benchmark_index = pl.benchmark.init_benchmark_data()
         start = time.perf_counter()
-    retri_res = []
-    for retriever in pl.retrievers:
-        retri_res.extend(retriever.run(query=query, top_k=top_k))
+    retri_res = await run_retrievers(pl, query, top_k)
     if pl.enable_benchmark:
         pl.benchmark.update_benchmark_data(benchmark_index, CompType.RETRIEVER, time.perf_counter() - start)
     contexts[CompType.RETRIEVER] = retri_res
@@ -294,20 +335,15 @@ async def run_retrieve_postprocess(pl: Pipeline, chat_request: ChatCompletionReq
     return contexts
 
 
-async def run_query_search(pl: Pipeline, chat_request: ChatCompletionRequest) -> Any:
+async def run_query_search(pl: Pipeline, chat_request: ChatCompletionRequest, benchmark_index=None) -> Any:
     query = chat_request.messages
-
-    def run_async_query_search():
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            return loop.run_until_complete(query_search(query, SEARCH_CONFIG_PATH, SEARCH_DIR, pl))
-        finally:
-            loop.close()
-
-    with ThreadPoolExecutor(max_workers=1) as executor:
-        future = executor.submit(run_async_query_search)
-        top1_issue, sub_questionss_result = future.result()
+    embed_model = get_embed_model(chat_request.user)
+    timings = {}
+    top1_issue, sub_questionss_result = await query_search(
+        query, SEARCH_CONFIG_PATH, SEARCH_DIR, pl, embed_model, timings=timings
+    )
+    if pl.enable_benchmark and benchmark_index is not None:
+        pl.benchmark.update_benchmark_data(benchmark_index, BenchType.QUERYSEARCH_BREAKDOWN, timings)
     if sub_questionss_result:
         query = query + sub_questionss_result
     return query, sub_questionss_result
@@ -350,7 +386,7 @@ async def run_pipeline(
         if pl.enable_benchmark:
             start = time.perf_counter()
         if target_generator.inference_type == InferenceType.VLLM and experience_status:
-            query, sub_questionss_result = await run_query_search(pl, chat_request)
+            query, sub_questionss_result = await run_query_search(pl, chat_request, benchmark_index)
         if pl.enable_benchmark:
             pl.benchmark.update_benchmark_data(benchmark_index, CompType.QUERYSEARCH, time.perf_counter() - start)
             start = time.perf_counter()
@@ -359,9 +395,7 @@ async def run_pipeline(
             if chat_request.k == pl.retrievers[0].topk or chat_request.k != 0 or chat_request.k is None
             else chat_request.k
         )
-        retri_res = []
-        for retriever in pl.retrievers:
-            retri_res.extend(retriever.run(query=query, top_k=top_k))
+        retri_res = await run_retrievers(pl, query, top_k)
         if pl.enable_benchmark:
             pl.benchmark.update_benchmark_data(benchmark_index, CompType.RETRIEVER, time.perf_counter() - start)
             start = time.perf_counter()
@@ -403,7 +437,8 @@ async def run_pipeline(
         raise ValueError("LLM inference_type not supported")
     if not isinstance(ret, StreamingResponse) and pl.enable_benchmark:
         pl.benchmark.update_benchmark_data(benchmark_index, CompType.GENERATOR, time.perf_counter() - start)
-        pl.benchmark.insert_llm_data(benchmark_index, input_token_size)
+        usage = getattr(ret, "additional_kwargs", None)
+        pl.benchmark.insert_llm_data(benchmark_index, input_token_size, usage=usage)
     return ret, contexts
 
 
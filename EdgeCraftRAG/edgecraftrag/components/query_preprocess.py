@@ -4,11 +4,14 @@
 import asyncio
 import json
 import os
+import time
 from abc import ABC
+from typing import Dict, Optional
 
-import aiohttp
 import numpy
 from edgecraftrag.base import GeneratorType
+from edgecraftrag.components.experience_index import experience_index
+from edgecraftrag.components.vllm_client import vllm_client_registry
 from edgecraftrag.config_repository import MilvusConfigRepository
 from omegaconf import OmegaConf
 
@@ -90,6 +93,7 @@ class LogitsEstimatorJSON(LogitsEstimator):
         scores_weight=None,
         temperature=1.0,
         API_BASE=None,
+        http_client=None,
         **kwargs,
     ):
         """Initialize the LLM-based relevance estimator."""
@@ -109,6 +113,8 @@ class LogitsEstimatorJSON(LogitsEstimator):
         self.json_key = json_key
         self.json_levels = json_levels
         self.API_BASE = API_BASE
+        # Shared async HTTP client, connections to the vLLM endpoint are reused across requests
+        self.http_client = http_client
 
         # dynamically set scores_weight, use default if not provided
         if scores_weight is None:
@@ -131,10 +137,9 @@ class LogitsEstimatorJSON(LogitsEstimator):
             "logprobs": 15,
         }
 
-        async with aiohttp.ClientSession() as session:
-            async with session.post(self.API_BASE, headers=headers, json=payload) as response:
-                response.raise_for_status()
-                results = await response.json()
+        response = await self.http_client.post(self.API_BASE, headers=headers, json=payload, timeout=300)
+        response.raise_for_status()
+        results = response.json()
 
         output_texts = results["choices"][0]["text"]
         output_logits = results["choices"][0]["logprobs"]["top_logprobs"][0]
@@ -208,21 +213,43 @@ def read_json_files(file_path: str) -> dict:
     return experience_lists
 
 
-async def query_search(user_input, SEARCH_CONFIG_PATH, SEARCH_DIR, pl):
+def shortlist_experiences(user_input, SEARCH_DIR, embed_model=None):
+    if experience_index.attached:
+        experience_index.ensure_loaded()
+    else:
+        # No experience knowledge base registered, fall back to the search file
+        experience_index.rebuild(read_json_files(SEARCH_DIR))
+    return experience_index.candidates(user_input, embed_model)
+
+
+async def query_search(
+    user_input, SEARCH_CONFIG_PATH, SEARCH_DIR, pl, embed_model=None, timings: Optional[Dict[str, float]] = None
+):
+    """Match user_input against the experience base and return the best issue with its sub questions.
+
+    If timings is given, the seconds spent shortlisting, loading the matcher config and scoring
+    candidates with the LLM are recorded into it.
+    """
     top1_issue = None
     sub_questions_result = None
+    timings = timings if timings is not None else {}
 
     generator = pl.get_generator(GeneratorType.CHATQNA)
     model_id = generator.model_id
     vllm_endpoint = generator.vllm_endpoint
 
-    maintenance_data = read_json_files(SEARCH_DIR)
+    # Only the top-k closest experiences are scored by the LLM, so cost does not grow with the experience base
+    start = time.perf_counter()
+    maintenance_data = await asyncio.to_thread(shortlist_experiences, user_input, SEARCH_DIR, embed_model)
+    timings["shortlist"] = time.perf_counter() - start
     issues = []
     for i in range(len(maintenance_data)):
         issues.append(maintenance_data[i]["question"])
     if not issues:
         return top1_issue, sub_questions_result
 
+    start = time.perf_counter()
+
     cfg = {}
     if not os.path.exists(SEARCH_CONFIG_PATH):
         cfg["query_matcher"] = {
@@ -237,7 +264,10 @@ async def query_search(user_input, SEARCH_CONFIG_PATH, SEARCH_DIR, pl):
         cfg = OmegaConf.load(SEARCH_CONFIG_PATH)
     cfg["query_matcher"]["model_id"] = model_id
     cfg["query_matcher"]["API_BASE"] = os.path.join(vllm_endpoint, "v1/completions")
-    query_matcher = LogitsEstimatorJSON(**cfg["query_matcher"])
+    # Same pool as the generator's requests to this endpoint
+    http_client = vllm_client_registry.get_client(vllm_endpoint + "/v1", model_id).async_http_client
+    query_matcher = LogitsEstimatorJSON(**cfg["query_matcher"], http_client=http_client)
+    timings["config"] = time.perf_counter() - start
     semaphore = asyncio.Semaphore(200)
 
     async def limited_compute_score(query_matcher, user_input, issue):
@@ -245,7 +275,9 @@ async def query_search(user_input, SEARCH_CONFIG_PATH, SEARCH_DIR, pl):
             return await query_matcher.compute_score((user_input, issue))
 
     tasks = [limited_compute_score(query_matcher, user_input, issue) for issue in issues]
+    start = time.perf_counter()
     scores = await asyncio.gather(*tasks)
+    timings["scoring"] = time.perf_counter() - start
     match_scores = list(zip(issues, scores))
     match_scores.sort(key=lambda x: x[1], reverse=True)
 
@@ -0,0 +1,280 @@
+# Copyright (C) 2025 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy
+from edgecraftrag.env import RELOAD_MANIFEST_DIR
+from llama_index.core.indices.utils import embed_nodes
+from llama_index.core.schema import BaseNode, MetadataMode
+from llama_index.core.storage.docstore.utils import doc_to_json, json_to_doc
+
+# Node parser attributes that change the produced nodes, the serialized form of some parsers omits them
+_PARSER_CONFIG_ATTRS = ("chunk_size", "chunk_overlap", "chunk_sizes", "window_size")
+
+
+def parser_config_hash(node_parser) -> str:
+    config = {"type": type(node_parser).__name__}
+    for attr in _PARSER_CONFIG_ATTRS:
+        config[attr] = getattr(node_parser, attr, None)
+    return hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def embed_model_key(embed_model) -> str:
+    # The device does not change the vectors, the model and its weight format do
+    attrs = [type(embed_model).__name__]
+    attrs += [str(getattr(embed_model, attr, None)) for attr in ("model_id", "model_path", "weight", "api_base")]
+    return "|".join(attrs)
+
+
+def _text_hash(node: BaseNode) -> str:
+    # Same text the embedding model sees, metadata included
+    return hashlib.sha256(node.get_content(metadata_mode=MetadataMode.EMBED).encode("utf-8")).hexdigest()
+
+
+class ReloadManifest:
+    """Content and config hashes of a knowledge base's files, with the nodes and embeddings derived from them.
+
+    A reload reparses only files whose content or node parser config changed, and embeds only nodes
+    whose text or embedding model changed. Everything is persisted in one SQLite database per knowledge
+    base: a row per file holding its parsed nodes, and a row per embedded text holding its vector, so
+    updates only write the rows they touch.
+    """
+
+    def __init__(self, kb_name: str, manifest_dir: str = RELOAD_MANIFEST_DIR):
+        self.kb_name = kb_name
+        self.db_path = os.path.join(manifest_dir, f"{kb_name}.db")
+        self._lock = threading.RLock()
+        self._conn: Optional[sqlite3.Connection] = None
+        # file_path -> {"content_hash", "parser_hash", "signature" (paths, mtimes, sizes)}, nodes stay on disk
+        self._files: Dict[str, Dict[str, Any]] = {}
+        self._embed_key: Optional[str] = None
+        # float32 vectors, a list of Python floats would take about eight times the memory
+        self._embeddings: Dict[str, numpy.ndarray] = {}
+        # Changes not written yet, flushed by save
+        self._new_embeddings: Set[str] = set()
+        self._dropped_embeddings: Set[str] = set()
+        self._embed_key_changed = False
+        self._touched_files: Set[str] = set()
+        # file_path -> (stat signature, content hash) of the last hashing, recorded by set_nodes
+        self._hashed: Dict[str, Tuple[List, str]] = {}
+        self.load()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS files (file_path TEXT PRIMARY KEY, content_hash TEXT NOT NULL, "
+                "parser_hash TEXT NOT NULL, signature TEXT, nodes TEXT NOT NULL)"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS embeddings (text_hash TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+            self._conn = conn
+        return self._conn
+
+    def content_hash(self, file_path: str) -> Optional[str]:
+        """sha256 of the file (or of every file below a directory), rehashed only when size or mtime changed."""
+        paths = (
+            sorted(os.path.join(root, f) for root, _, files in os.walk(file_path) for f in files)
+            if os.path.isdir(file_path)
+            else [file_path]
+        )
+        try:
+            stats = [(path, os.stat(path)) for path in paths]
+        except OSError:
+            return None
+        signature = [[path, st.st_mtime_ns, st.st_size] for path, st in stats]
+        with self._lock:
+            entry = self._files.get(file_path)
+            if entry and entry.get("signature") == signature:
+                return entry["content_hash"]
+        digest = hashlib.sha256()
+        for path, _ in stats:
+            digest.update(path.encode("utf-8"))
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(block)
+        content_hash = digest.hexdigest()
+        with self._lock:
+            self._hashed[file_path] = (signature, content_hash)
+            entry = self._files.get(file_path)
+            if entry and entry["content_hash"] == content_hash:
+                # Touched but unchanged, remember the new signature to skip hashing next time
+                entry["signature"] = signature
+                self._touched_files.add(file_path)
+        return content_hash
+
+    def get_nodes(self, file_path: str, node_parser) -> Tuple[Optional[List[BaseNode]], Optional[str]]:
+        """Return the cached nodes of a file if neither its content nor the parser config changed.
+
+        The content hash is returned as well so a miss can be recorded with set_nodes without rehashing.
+        """
+        content_hash = self.content_hash(file_path)
+        with self._lock:
+            entry = self._files.get(file_path)
+            if (
+                content_hash is not None
+                and entry is not None
+                and entry["content_hash"] == content_hash
+                and entry["parser_hash"] == parser_config_hash(node_parser)
+            ):
+                row = self._connect().execute("SELECT nodes FROM files WHERE file_path = ?", (file_path,)).fetchone()
+                if row is not None:
+                    return [json_to_doc(node_json) for node_json in json.loads(row[0])], content_hash
+        return None, content_hash
+
+    def set_nodes(self, file_path: str, node_parser, nodes: List[BaseNode], content_hash: Optional[str] = None) -> None:
+        content_hash = content_hash or self.content_hash(file_path)
+        if content_hash is None:
+            return
+        nodes_json = json.dumps([doc_to_json(node) for node in nodes], ensure_ascii=False)
+        with self._lock:
+            signature, hashed = self._hashed.pop(file_path, (None, None))
+            if hashed != content_hash:
+                signature = self._files.get(file_path, {}).get("signature")
+            entry = {
+                "content_hash": content_hash,
+                "parser_hash": parser_config_hash(node_parser),
+                "signature": signature,
+            }
+            conn = self._connect()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO files (file_path, content_hash, parser_hash, signature, nodes) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (file_path, content_hash, entry["parser_hash"], json.dumps(signature), nodes_json),
+                )
+            self._files[file_path] = entry
+            self._touched_files.discard(file_path)
+
+    def remove_file(self, file_path: str) -> None:
+        with self._lock:
+            if self._files.pop(file_path, None) is not None:
+                self._touched_files.discard(file_path)
+                conn = self._connect()
+                with conn:
+                    conn.execute("DELETE FROM files WHERE file_path = ?", (file_path,))
+
+    def with_embeddings(self, nodes: List[BaseNode], embed_model, prune: bool = False) -> List[BaseNode]:
+        """Return copies of nodes carrying their embeddings, only nodes not seen before are embedded.
+
+        With prune, embeddings of texts that are not among nodes are dropped from the cache.
+        """
+        key = embed_model_key(embed_model)
+        hashes = [_text_hash(node) for node in nodes]
+        with self._lock:
+            if key != self._embed_key:
+                self._embed_key = key
+                self._embeddings = {}
+                self._new_embeddings = set()
+                self._dropped_embeddings = set()
+                self._embed_key_changed = True
+            missing = {}
+            for node, h in zip(nodes, hashes):
+                if h not in self._embeddings and h not in missing:
+                    missing[h] = node
+        id_to_embed_map = embed_nodes(list(missing.values()), embed_model) if missing else {}
+        embedded_nodes = []
+        with self._lock:
+            for h, node in missing.items():
+                self._embeddings[h] = numpy.asarray(id_to_embed_map[node.node_id], dtype=numpy.float32)
+                self._new_embeddings.add(h)
+                self._dropped_embeddings.discard(h)
+            for node, h in zip(nodes, hashes):
+                embedded_node = node.model_copy()
+                embedded_node.embedding = self._embeddings[h].tolist()
+                embedded_nodes.append(embedded_node)
+            if prune:
+                used = set(hashes)
+                if len(used) != len(self._embeddings):
+                    for h in [h for h in self._embeddings if h not in used]:
+                        del self._embeddings[h]
+                        self._new_embeddings.discard(h)
+                        self._dropped_embeddings.add(h)
+        print(f"Knowledge base {self.kb_name}: embedded {len(missing)} of {len(nodes)} nodes, reused the rest")
+        return embedded_nodes
+
+    def save(self) -> None:
+        """Write the pending changes: new and pruned embeddings, and refreshed file signatures.
+
+        File nodes are written by set_nodes and remove_file as they change.
+        """
+        with self._lock:
+            if not (self._embed_key_changed or self._new_embeddings or self._dropped_embeddings or self._touched_files):
+                return
+            conn = self._connect()
+            with conn:
+                if self._embed_key_changed:
+                    conn.execute("DELETE FROM embeddings")
+                    conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('embed_key', ?)", (self._embed_key,))
+                conn.executemany("DELETE FROM embeddings WHERE text_hash = ?", [(h,) for h in self._dropped_embeddings])
+                conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (text_hash, vector) VALUES (?, ?)",
+                    [(h, self._embeddings[h].tobytes()) for h in self._new_embeddings],
+                )
+                conn.executemany(
+                    "UPDATE files SET signature = ? WHERE file_path = ?",
+                    [(json.dumps(self._files[path]["signature"]), path) for path in self._touched_files],
+                )
+            self._embed_key_changed = False
+            self._new_embeddings = set()
+            self._dropped_embeddings = set()
+            self._touched_files = set()
+
+    def load(self) -> bool:
+        if not os.path.isfile(self.db_path):
+            return False
+        try:
+            conn = self._connect()
+            meta = dict(conn.execute("SELECT key, value FROM meta").fetchall())
+            files = {
+                path: {
+                    "content_hash": content_hash,
+                    "parser_hash": parser_hash,
+                    "signature": json.loads(signature) if signature else None,
+                }
+                for path, content_hash, parser_hash, signature in conn.execute(
+                    "SELECT file_path, content_hash, parser_hash, signature FROM files"
+                )
+            }
+            embeddings = {
+                h: numpy.frombuffer(vector, dtype=numpy.float32)
+                for h, vector in conn.execute("SELECT text_hash, vector FROM embeddings")
+            }
+        except (sqlite3.Error, ValueError) as e:
+            print(f"Load reload manifest {self.db_path} failed: {e}")
+            return False
+        with self._lock:
+            self._files = files
+            self._embed_key = meta.get("embed_key")
+            self._embeddings = embeddings
+            self._new_embeddings = set()
+            self._dropped_embeddings = set()
+            self._embed_key_changed = False
+            self._touched_files = set()
+        return True
+
+    def remove_persisted(self) -> None:
+        with self._lock:
+            self._files = {}
+            self._embed_key = None
+            self._embeddings = {}
+            self._new_embeddings = set()
+            self._dropped_embeddings = set()
+            self._embed_key_changed = False
+            self._touched_files = set()
+            self._hashed = {}
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+            for path in (self.db_path, self.db_path + "-wal", self.db_path + "-shm"):
+                if os.path.exists(path):
+                    os.remove(path)
@@ -1,18 +1,27 @@
 # Copyright (C) 2024 Intel Corporation
 # SPDX-License-Identifier: Apache-2.0
 
+import asyncio
+import threading
+import time
 import warnings
-from typing import Any, List, Optional, cast
+from typing import Any, Dict, List, Optional
 
-import requests
-from edgecraftrag.base import BaseComponent, CompType, RetrieverType
+from edgecraftrag.base import BaseComponent, CompType, FusionType, RetrieverType
+from edgecraftrag.components.embedding_client import embedding_client_registry
 from llama_index.core.indices.vector_store.retrievers import VectorIndexRetriever
 from llama_index.core.retrievers import AutoMergingRetriever
-from llama_index.core.schema import BaseNode, Document, NodeWithScore
-from llama_index.retrievers.bm25 import BM25Retriever
+from llama_index.core.schema import Document, NodeWithScore
 from pydantic import model_serializer
 
 
+def _is_cancelled(kwargs) -> bool:
+    # Set by run_retrievers once the caller gave up, a run still queued on _run_lock then returns at once.
+    # A search that already started cannot be interrupted and runs to completion.
+    cancelled = kwargs.get("cancelled")
+    return cancelled is not None and cancelled.is_set()
+
+
 class VectorSimRetriever(BaseComponent, VectorIndexRetriever):
 
     def __init__(self, indexer, **kwargs):
@@ -37,13 +46,22 @@ class VectorSimRetriever(BaseComponent, VectorIndexRetriever):
         # ids to be retrieved which means the target nodes to be
         # retrieved are freezed to the time of the retriever's creation.
         self._node_ids = None
+        # Retrievers may run concurrently in worker threads, top_k is per call state
+        self._run_lock = threading.Lock()
 
     def run(self, **kwargs) -> Any:
         for k, v in kwargs.items():
             if k == "query":
                 top_k = kwargs["top_k"] if kwargs["top_k"] else self.topk
-                self.similarity_top_k = top_k
-                return self.retrieve(v)
+                with self._run_lock:
+                    if _is_cancelled(kwargs):
+                        return None
+                    if self._vector_store is not self._index.vector_store:
+                        # The indexer was reinitialized (rebuild or retrain), follow its new stores
+                        self._vector_store = self._index.vector_store
+                        self._docstore = self._index.docstore
+                    self.similarity_top_k = top_k
+                    return self.retrieve(v)
 
         return None
 
@@ -68,24 +86,68 @@ class AutoMergeRetriever(BaseComponent, AutoMergingRetriever):
         self._index = indexer
         self.topk = kwargs["similarity_top_k"]
 
+        vector_retriever = indexer.as_retriever(**kwargs)
         AutoMergingRetriever.__init__(
             self,
-            vector_retriever=indexer.as_retriever(**kwargs),
+            vector_retriever=vector_retriever,
             storage_context=indexer._storage_context,
             object_map=indexer._object_map,
             callback_manager=indexer._callback_manager,
         )
+        # Vector retrievers by top_k, valid for one version of the index
+        self._retriever_version = indexer.version
+        self._vector_retrievers = {self.topk: vector_retriever}
+        self._run_lock = threading.Lock()
+
+    def _get_vector_retriever(self, top_k):
+        # The vector retriever snapshots the node ids of the index, rebuild it only once nodes were added or removed
+        version = self._index.version
+        if version != self._retriever_version:
+            self._vector_retrievers = {}
+            self._retriever_version = version
+            # reinitialize_indexer replaces the storage context that parent nodes are read from
+            self._storage_context = self._index._storage_context
+        retriever = self._vector_retrievers.get(top_k)
+        if retriever is None:
+            retriever = self._index.as_retriever(similarity_top_k=top_k)
+            self._vector_retrievers[top_k] = retriever
+        return retriever
 
     def run(self, **kwargs) -> Any:
         for k, v in kwargs.items():
             if k == "query":
                 top_k = kwargs["top_k"] if kwargs["top_k"] else self.topk
-                # vector_retriever needs to be updated
-                self._vector_retriever = self._index.as_retriever(similarity_top_k=top_k)
-                return self.retrieve(v)
+                with self._run_lock:
+                    if _is_cancelled(kwargs):
+                        return None
+                    self._vector_retriever = self._get_vector_retriever(top_k)
+                    return self.retrieve(v)
 
         return None
 
+    def get_construction_overhead_report(self, num_queries: int = 100, top_k: Optional[int] = None) -> Dict[str, Any]:
+        """Time the per-query retriever setup on the indexed corpus, rebuilt every query versus cached.
+
+        Only the setup is measured, the vector search and the merge of parent nodes are the same in both cases.
+        """
+        top_k = top_k or self.topk
+        with self._run_lock:
+            start = time.perf_counter()
+            for _ in range(num_queries):
+                self._index.as_retriever(similarity_top_k=top_k)
+            uncached_time = time.perf_counter() - start
+            start = time.perf_counter()
+            for _ in range(num_queries):
+                self._get_vector_retriever(top_k)
+            cached_time = time.perf_counter() - start
+        return {
+            "num_nodes": len(self._index.index_struct.nodes_dict),
+            "top_k": top_k,
+            "num_queries": num_queries,
+            "uncached_avg_ms": uncached_time / num_queries * 1000,
+            "cached_avg_ms": cached_time / num_queries * 1000,
+        }
+
     @model_serializer
     def ser_model(self):
         set = {
@@ -97,30 +159,26 @@ class AutoMergeRetriever(BaseComponent, AutoMergingRetriever):
 
 
 class SimpleBM25Retriever(BaseComponent):
-    # The nodes parameter in BM25Retriever is not from index,
-    # nodes in BM25Retriever can not be updated through 'indexer.insert_nodes()',
-    # which means nodes should be passed to BM25Retriever after data preparation stage, not init stage
+    # BM25 scoring is served by the knowledge base's BM25Index, which is updated
+    # incrementally when files are added or removed, so queries only score and never rebuild
 
-    def __init__(self, indexer, **kwargs):
+    def __init__(self, indexer, bm25_index, **kwargs):
         BaseComponent.__init__(
             self,
             comp_type=CompType.RETRIEVER,
             comp_subtype=RetrieverType.BM25,
         )
-        self._docstore = indexer._docstore
         self.topk = kwargs["similarity_top_k"]
         self._index = indexer
+        self._bm25_index = bm25_index
 
     def run(self, **kwargs) -> Any:
         for k, v in kwargs.items():
             if k == "query":
-                if self._index.comp_subtype == "milvus_vector":
-                    raise NotImplementedError("not support BM25 retriever for Milvus vector store")
                 top_k = kwargs["top_k"] if kwargs["top_k"] else self.topk
-                nodes = cast(List[BaseNode], list(self._docstore.docs.values()))
-                similarity_top_k = min(len(nodes), top_k)
-                bm25_retr = BM25Retriever.from_defaults(nodes=nodes, similarity_top_k=similarity_top_k)
-                return bm25_retr.retrieve(v)
+                if _is_cancelled(kwargs):
+                    return None
+                return self._bm25_index.retrieve(v, top_k)
 
         return None
 
@@ -148,23 +206,27 @@ class KBadminRetriever(BaseComponent):
         self.embedding_url = indexer.kbadmin_embedding_url
         self.embedding = indexer.embedding
         self._index = indexer
+        # Shared per embedding endpoint, concurrent queries are embedded in one request
+        self._embedding_client = embedding_client_registry.get_client(
+            self.embedding_url + "/embeddings", self.embedding_model_name
+        )
 
-    def similarity_search_with_embedding(self, query: str, k) -> list[tuple[Document, float]]:
-        url = self.embedding_url + "/embeddings"
-        embedding_info = {"model": self.embedding_model_name, "input": query}
-        # Get embedding result from embedding service
-        response = requests.post(url, headers={"Content-Type": "application/json"}, json=embedding_info)
-        embedding_json = response.json()
-        embedding = embedding_json["data"][0]["embedding"]
+    def _search_by_vector(self, embedding, k) -> list[tuple[Document, float]]:
         docs_and_scores = self.vector_db.similarity_search_with_score_by_vector(embedding=embedding, k=k)
         relevance_score_fn = self.vector_db._select_relevance_score_fn()
         return [(doc, relevance_score_fn(score)) for doc, score in docs_and_scores]
 
-    def run(self, **kwargs) -> Any:
-        query = kwargs["query"]
-        top_k = kwargs["top_k"] if kwargs["top_k"] else self.topk
-        # langchain retrieval
-        docs_and_similarities = self.similarity_search_with_embedding(query=query, k=top_k)
+    def similarity_search_with_embedding(self, query: str, k) -> list[tuple[Document, float]]:
+        # Get embedding result from embedding service
+        embedding = self._embedding_client.embed_sync(query)
+        return self._search_by_vector(embedding, k)
+
+    async def asimilarity_search_with_embedding(self, query: str, k) -> list[tuple[Document, float]]:
+        embedding = await self._embedding_client.embed(query)
+        return await asyncio.to_thread(self._search_by_vector, embedding, k)
+
+    @staticmethod
+    def _to_nodes(docs_and_similarities) -> List[NodeWithScore]:
         node_with_scores: List[NodeWithScore] = []
         for doc, similarity in docs_and_similarities:
             score: Optional[float] = None
@@ -175,7 +237,48 @@ class KBadminRetriever(BaseComponent):
             node_with_scores.append(NodeWithScore(node=node, score=score))
         return node_with_scores
 
+    def run(self, **kwargs) -> Any:
+        query = kwargs["query"]
+        top_k = kwargs["top_k"] if kwargs["top_k"] else self.topk
+        # langchain retrieval
+        return self._to_nodes(self.similarity_search_with_embedding(query=query, k=top_k))
+
+    async def arun(self, **kwargs) -> Any:
+        query = kwargs["query"]
+        top_k = kwargs["top_k"] if kwargs["top_k"] else self.topk
+        return self._to_nodes(await self.asimilarity_search_with_embedding(query=query, k=top_k))
+
     @model_serializer
     def ser_model(self):
         set = {"idx": self.idx, "retriever_type": self.comp_subtype}
         return set
+
+
+def fuse_retrieval_results(
+    results: List[List[NodeWithScore]], fusion_type: str = FusionType.CONCAT, rrf_k: int = 60
+) -> List[NodeWithScore]:
+    """Merge the ranked lists returned by several retrievers into one list.
+
+    concat keeps every list in retriever order, rrf uses reciprocal rank fusion and
+    score_norm sums min-max normalized scores. Nodes returned by several retrievers
+    are de-duplicated for rrf and score_norm.
+    """
+    if fusion_type == FusionType.CONCAT or len(results) <= 1:
+        return [node for retri_res in results for node in retri_res]
+
+    fused_scores = {}
+    fused_nodes = {}
+    for retri_res in results:
+        if fusion_type == FusionType.RRF:
+            node_scores = [1.0 / (rrf_k + rank + 1) for rank in range(len(retri_res))]
+        elif fusion_type == FusionType.SCORE_NORM:
+            raw_scores = [node.score or 0.0 for node in retri_res]
+            low, high = (min(raw_scores), max(raw_scores)) if raw_scores else (0.0, 0.0)
+            node_scores = [(score - low) / (high - low) if high > low else 1.0 for score in raw_scores]
+        else:
+            raise ValueError(f"Fusion type {fusion_type} not supported")
+        for node, score in zip(retri_res, node_scores):
+            fused_scores[node.node_id] = fused_scores.get(node.node_id, 0.0) + score
+            fused_nodes.setdefault(node.node_id, node.node)
+    ranked = sorted(fused_scores.items(), key=lambda item: item[1], reverse=True)
+    return [NodeWithScore(node=fused_nodes[node_id], score=score) for node_id, score in ranked]
@@ -2,12 +2,16 @@
 # SPDX-License-Identifier: Apache-2.0
 
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional
 
 from edgecraftrag.base import BaseComponent, CompType
 from pydantic import model_serializer
 
 
+def format_message(message: Dict[str, str]) -> str:
+    return f"{message['role']}: {message['content']}"
+
+
 class Session(BaseComponent):
     def __init__(self, session_id: str):
         super().__init__(comp_type=CompType.SESSION)
@@ -15,6 +19,11 @@ class Session(BaseComponent):
         self.messages: List[Dict[str, str]] = []
         self.created_at: datetime = datetime.now()
         self.current_messages: Optional[Dict[str, str]] = None
+        # Chunks of the message being streamed, joined only when read or committed
+        self._stream_role: Optional[str] = None
+        self._stream_chunks: List[str] = []
+        # tokenizer key -> token count of each message in self.messages, in order
+        self._token_counts: Dict[str, List[int]] = {}
 
     def add_message(self, role: str, content: str) -> None:
         if role not in ("user", "assistant"):
@@ -27,6 +36,14 @@ class Session(BaseComponent):
 
     def clear_messages(self) -> None:
         self.messages = []
+        self._token_counts = {}
+
+    def get_token_counts(self, key: str, count_tokens: Callable[[str], int]) -> List[int]:
+        """Token count of each formatted message, only messages added since the last call are tokenized."""
+        counts = self._token_counts.setdefault(key, [])
+        for message in self.messages[len(counts) :]:
+            counts.append(count_tokens(format_message(message)))
+        return counts
 
     def get_user_message_titel(self) -> Optional[str]:
         for msg in self.messages:
@@ -36,7 +53,9 @@ class Session(BaseComponent):
 
     def to_dict(self) -> Dict[str, Any]:
         concat_messages = self.messages.copy()
-        if self.current_messages:
+        if self._stream_role:
+            concat_messages.append({"role": self._stream_role, "content": self.get_streaming_content()})
+        elif self.current_messages:
             concat_messages.append(self.current_messages)
         return {
             "session_id": self.session_id,
@@ -48,6 +67,28 @@ class Session(BaseComponent):
     def update_current_message(self, role: str, content: str) -> None:
         self.current_messages = {"role": role, "content": content}
 
+    def start_streaming_message(self, role: str) -> None:
+        if role not in ("user", "assistant"):
+            raise ValueError("Role should be 'user' or 'assistant'")
+        self._stream_role = role
+        self._stream_chunks = []
+        self.current_messages = None
+
+    def append_streaming_chunk(self, chunk: str) -> None:
+        self._stream_chunks.append(chunk)
+
+    def get_streaming_content(self) -> str:
+        return "".join(self._stream_chunks)
+
+    def finish_streaming_message(self) -> Optional[Dict[str, str]]:
+        if not self._stream_role:
+            return None
+        message = {"role": self._stream_role, "content": self.get_streaming_content()}
+        self._stream_role = None
+        self._stream_chunks = []
+        self.add_message(message["role"], message["content"])
+        return message
+
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> "Session":
         session_id = data.get("session_id", f"session_{data.get('idx', 'unknown')}")
@@ -0,0 +1,163 @@
+# Copyright (C) 2025 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+_STOP = object()
+_COMPACT = object()
+
+
+class SessionJournal:
+    """Append-only journal of session changes, folded periodically into a JSON snapshot.
+
+    Records are written by a background thread that fsyncs once per batch, so the cost of
+    persisting a message does not depend on how much history is stored. Every record carries a
+    sequence number and each session in the snapshot remembers the last sequence it includes,
+    so a crash between writing the snapshot and truncating the journal never replays a record twice.
+    """
+
+    def __init__(
+        self,
+        snapshot_path: str,
+        snapshot_fn: Callable[[], Dict[str, Dict]],
+        lock: threading.RLock,
+        journal_path: Optional[str] = None,
+        flush_interval: Optional[float] = None,
+        compact_records: Optional[int] = None,
+    ):
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path or snapshot_path + ".journal"
+        self.flush_interval = flush_interval or float(os.getenv("SESSION_JOURNAL_FLUSH_INTERVAL", "0.2"))
+        self.compact_records = compact_records or int(os.getenv("SESSION_JOURNAL_COMPACT_RECORDS", "1000"))
+        # Held by the caller while mutating sessions, so a snapshot always matches a sequence number
+        self.lock = lock
+        self._snapshot_fn = snapshot_fn
+        self._seq = 0
+        self._records_since_compaction = 0
+        self._queue: queue.Queue = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+
+    def load(self) -> Tuple[Dict[str, Dict], List[Dict]]:
+        """Return the snapshot and the journal records that still have to be applied on top of it."""
+        snapshot = {}
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+            if not isinstance(snapshot, dict):
+                raise ValueError("Invalid session file format: expected dict")
+        records = []
+        if os.path.exists(self.journal_path):
+            good_offset = 0
+            with open(self.journal_path, "rb") as f:
+                for line in f:
+                    try:
+                        if not line.endswith(b"\n"):
+                            raise ValueError("unterminated record")
+                        records.append(json.loads(line))
+                    except ValueError:
+                        # A torn tail from an interrupted write, everything before it is intact
+                        break
+                    good_offset += len(line)
+                torn = f.seek(0, os.SEEK_END) > good_offset
+            if torn:
+                # Cut it off, records appended later would otherwise be glued to it and lost on the next load
+                print(f"Session journal {self.journal_path}: dropping a torn record at offset {good_offset}")
+                with open(self.journal_path, "r+b") as f:
+                    f.truncate(good_offset)
+                    f.flush()
+                    os.fsync(f.fileno())
+        watermarks = {sid: data.get("journal_seq", 0) for sid, data in snapshot.items() if isinstance(data, dict)}
+        self._seq = max([0, *watermarks.values(), *(record["seq"] for record in records)])
+        self._records_since_compaction = len(records)
+        pending = [record for record in records if record["seq"] > watermarks.get(record["sid"], 0)]
+        return snapshot, pending
+
+    def append(self, sid: str, op: str, **fields) -> None:
+        with self.lock:
+            if self._closed:
+                return
+            self._seq += 1
+            self._put({"seq": self._seq, "sid": sid, "op": op, **fields})
+
+    def request_compaction(self) -> None:
+        self._put(_COMPACT)
+
+    def close(self) -> None:
+        with self.lock:
+            if self._closed:
+                return
+            self._closed = True
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join()
+
+    def _put(self, item) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="session-journal", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+        self._queue.put(item)
+
+    def _next_batch(self) -> List:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        # Records arriving within the flush window share one write and one fsync
+        while batch[-1] is not _STOP:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        os.makedirs(os.path.dirname(self.journal_path), exist_ok=True)
+        f = open(self.journal_path, "a", encoding="utf-8")
+        try:
+            while True:
+                batch = self._next_batch()
+                records = [item for item in batch if isinstance(item, dict)]
+                try:
+                    if records:
+                        f.write("".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records))
+                        f.flush()
+                        os.fsync(f.fileno())
+                        self._records_since_compaction += len(records)
+                    stop = _STOP in batch
+                    if self._records_since_compaction and (
+                        stop or _COMPACT in batch or self._records_since_compaction >= self.compact_records
+                    ):
+                        f = self._compact(f)
+                except Exception as e:
+                    print(f"Session journal write failed: {e}")
+                    stop = _STOP in batch
+                if stop:
+                    break
+        finally:
+            f.close()
+
+    def _compact(self, f):
+        with self.lock:
+            seq = self._seq
+            data = self._snapshot_fn()
+        for session_data in data.values():
+            session_data["journal_seq"] = seq
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as tmp:
+            json.dump(data, tmp, indent=2, ensure_ascii=False)
+            tmp.flush()
+            os.fsync(tmp.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        # Records with seq <= the snapshot watermark may still be queued, they are skipped on replay
+        f.close()
+        self._records_since_compaction = 0
+        return open(self.journal_path, "w", encoding="utf-8")
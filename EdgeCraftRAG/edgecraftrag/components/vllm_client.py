@@ -0,0 +1,90 @@
+# Copyright (C) 2025 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+import threading
+from typing import Dict, Tuple
+
+import httpx
+from llama_index.llms.openai_like import OpenAILike
+
+
+class _PooledClient:
+
+    def __init__(self, limits: httpx.Limits):
+        self.transport = httpx.AsyncHTTPTransport(limits=limits)
+        self.async_http_client = httpx.AsyncClient(transport=self.transport)
+        self.http_client = httpx.Client(limits=limits)
+
+    def pool_metrics(self, max_connections: int) -> Dict:
+        # httpcore does not expose pool statistics publicly, read them from the pool if available
+        pool = getattr(self.transport, "_pool", None)
+        connections = list(getattr(pool, "connections", []) or [])
+        idle = sum(1 for conn in connections if conn.is_idle())
+        active = len(connections) - idle
+        queued = len(getattr(pool, "_requests", []) or [])
+        return {
+            "connections": len(connections),
+            "active_connections": active,
+            "idle_connections": idle,
+            "queued_requests": queued,
+            "saturation": active / max_connections if max_connections else 0.0,
+        }
+
+
+class VLLMClientRegistry:
+    """Process-wide registry of HTTP connection pools for vLLM endpoints.
+
+    OpenAILike objects carry per-request sampling parameters and are cheap to build,
+    the connection pools behind them are shared per (endpoint, model).
+    """
+
+    def __init__(self):
+        self.pool_size = int(os.getenv("VLLM_POOL_SIZE", "100"))
+        self.keepalive_connections = int(os.getenv("VLLM_KEEPALIVE_CONNECTIONS", "20"))
+        self.keepalive_expiry = float(os.getenv("VLLM_KEEPALIVE_EXPIRY", "30"))
+        self._clients: Dict[Tuple[str, str], _PooledClient] = {}
+        self._lock = threading.Lock()
+
+    def _limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.pool_size,
+            max_keepalive_connections=self.keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+    def get_client(self, api_base: str, model: str) -> _PooledClient:
+        key = (api_base, model)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = _PooledClient(self._limits())
+                self._clients[key] = client
+            return client
+
+    def create_llm(self, api_base: str, model: str, **kwargs) -> OpenAILike:
+        client = self.get_client(api_base, model)
+        return OpenAILike(
+            api_key="fake",
+            api_base=api_base,
+            model=model,
+            http_client=client.http_client,
+            async_http_client=client.async_http_client,
+            **kwargs,
+        )
+
+    def get_metrics(self) -> Dict:
+        with self._lock:
+            clients = dict(self._clients)
+        return {
+            "pool_size": self.pool_size,
+            "keepalive_connections": self.keepalive_connections,
+            "keepalive_expiry": self.keepalive_expiry,
+            "pools": {
+                f"{api_base}|{model}": client.pool_metrics(self.pool_size)
+                for (api_base, model), client in clients.items()
+            },
+        }
+
+
+vllm_client_registry = VLLMClientRegistry()
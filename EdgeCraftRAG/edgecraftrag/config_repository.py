@@ -1,8 +1,10 @@
 # Copyright (C) 2024 Intel Corporation
 # SPDX-License-Identifier: Apache-2.0
 
+import copy
 import json
 import os
+import threading
 import time
 from typing import Dict, List, Optional
 
@@ -13,12 +15,31 @@ from pymilvus import (
     CollectionSchema,
     DataType,
     FieldSchema,
+    MilvusException,
     connections,
     utility,
 )
 
+_DUMMY_VECTOR = [0.0, 0.0]
+
+
+def _milvus_str(value) -> str:
+    # Quoted and escaped string literal for a filter expression, expr_params templates need Milvus 2.5
+    return json.dumps(str(value), ensure_ascii=False)
+
 
 class MilvusConfigRepository:
+    """Config rows keyed by idx, written with upserts and read through an in-process cache.
+
+    The collection is loaded once when connecting. Every repository opened on the same collection
+    shares a write version, a cached read is only served while no other repository in the process
+    has written since the cache was filled.
+    """
+
+    # collection name -> number of writes made through any repository in this process
+    _versions: Dict[str, int] = {}
+    _versions_lock = threading.Lock()
+
     def __init__(
         self,
         Repo_config_name: Optional[str] = "pipeline_config",
@@ -34,6 +55,10 @@ class MilvusConfigRepository:
         self.alias = Repo_config_name
         self.collection = None
         self.connected = False
+        self._lock = threading.RLock()
+        # idx -> {"idx", "config_json"}, None until the first full read
+        self._cache: Optional[Dict[str, Dict]] = None
+        self._cache_version = -1
 
     def _connect(self) -> None:
         try:
@@ -52,6 +77,7 @@ class MilvusConfigRepository:
                     auto_id=False,
                 ),
                 FieldSchema(name="config_json", dtype=DataType.JSON),
+                # Milvus requires a vector field in every collection, it is never searched
                 FieldSchema(name="dummy_vector", dtype=DataType.FLOAT_VECTOR, dim=2),
             ]
             schema = CollectionSchema(fields, description="Config storage (idx as primary key)")
@@ -84,36 +110,97 @@ class MilvusConfigRepository:
             raise ConnectionError(f"Max retries ({max_retries}) reached")
         return None
 
+    def _run(self, op, *args, **kwargs):
+        # The collection stays loaded, load it again only if it was released behind our back
+        try:
+            return op(*args, **kwargs)
+        except MilvusException as e:
+            if "not loaded" not in str(e).lower():
+                raise
+            self.collection.load()
+            return op(*args, **kwargs)
+
+    def _version(self) -> int:
+        return self._versions.get(self.collection_name, 0)
+
+    def _cache_valid(self) -> bool:
+        return self._cache is not None and self._cache_version == self._version()
+
+    def _written(self, apply) -> None:
+        """Record a write, apply it to the cache if the cache was up to date, otherwise drop the cache."""
+        with self._lock:
+            was_valid = self._cache_valid()
+            with self._versions_lock:
+                self._versions[self.collection_name] = self._version() + 1
+            if was_valid:
+                apply(self._cache)
+                self._cache_version = self._version()
+            else:
+                self._cache = None
+
+    def _load_cache(self) -> Dict[str, Dict]:
+        with self._lock:
+            if not self._cache_valid():
+                version = self._version()
+                # Strong consistency, the rows written just before by another repository must be visible
+                rows = self._run(
+                    self.collection.query,
+                    expr="idx != ''",
+                    output_fields=["idx", "config_json"],
+                    consistency_level="Strong",
+                )
+                self._cache = {row["idx"]: {"idx": row["idx"], "config_json": row["config_json"]} for row in rows}
+                self._cache_version = version
+            return self._cache
+
+    def _upsert(self, configs: Dict[str, Dict]) -> None:
+        idx_list = list(configs.keys())
+        self._run(
+            self.collection.upsert,
+            [idx_list, [configs[idx] for idx in idx_list], [_DUMMY_VECTOR for _ in idx_list]],
+        )
+
+        def apply(cache):
+            for idx in idx_list:
+                cache[idx] = {"idx": idx, "config_json": copy.deepcopy(configs[idx])}
+
+        self._written(apply)
+
+    def _delete(self, idx_list: List[str]) -> None:
+        self._run(self.collection.delete, f"idx in [{', '.join(_milvus_str(idx) for idx in idx_list)}]")
+
+        def apply(cache):
+            for idx in idx_list:
+                cache.pop(idx, None)
+
+        self._written(apply)
+
     def save_configs(self, configs: List[Dict]) -> None:
-        self.collection.delete("idx != ''")
-        insert_data = []
-        for config in configs:
-            insert_data.append(
-                {
-                    "idx": config["idx"],
-                    "config_json": config,
-                    "dummy_vector": [0.0, 0.0],
-                }
-            )
-        if insert_data:
-            idx_list = [i["idx"] for i in insert_data]
-            configs_list = [i["config_json"] for i in insert_data]
-            vectors = [i["dummy_vector"] for i in insert_data]
-            self.collection.insert([idx_list, configs_list, vectors])
-            self.collection.flush()
-        else:
+        if not configs:
             print("No data to insert")
+        stale = set(self._load_cache().keys()) - {config["idx"] for config in configs}
+        if stale:
+            self._delete(list(stale))
+        if configs:
+            self._upsert({config["idx"]: config for config in configs})
 
     def get_configs(self, idx: Optional[str] = None, output_fields: Optional[list] = None) -> List[Dict]:
         try:
-            self.collection.load()
+            if output_fields is None or set(output_fields) <= {"idx", "config_json"}:
+                with self._lock:
+                    if idx is None:
+                        rows = list(self._load_cache().values())
+                    elif self._cache_valid():
+                        rows = [self._cache[idx]] if idx in self._cache else []
+                    else:
+                        rows = None
+                if rows is not None:
+                    # Callers may modify what they read, the cache must not change with it
+                    return copy.deepcopy(rows)
             output_fields = output_fields or ["idx", "config_json"]
             if idx:
-                expr = f'idx == "{idx}"'
-            else:
-                expr = "idx != ''"
-            results = self.collection.query(expr=expr, output_fields=output_fields)
-            return results
+                return self._run(self.collection.query, expr=f"idx == {_milvus_str(idx)}", output_fields=output_fields)
+            return self._run(self.collection.query, expr="idx != ''", output_fields=output_fields)
         except Exception as e:
             print(f"Read error: {e}")
             return []
@@ -122,8 +209,8 @@ class MilvusConfigRepository:
         if not self.connected or not self.collection:
             raise RuntimeError("Not connected to Milvus")
         try:
-            self.collection.load()
-            self.collection.insert([[idx], [config_json], [[0.0, 0.0]]])
+            # An upsert, so adding an idx twice never leaves duplicate rows
+            self._upsert({idx: config_json})
             return True
         except Exception as e:
             print(f"Add failed: {e}")
@@ -133,9 +220,7 @@ class MilvusConfigRepository:
         if not self.connected or not self.collection:
             raise RuntimeError("Not connected to Milvus")
         try:
-            self.collection.load()
-            res = self.collection.delete(f'idx == "{idx}"')
-            self.collection.flush()
+            self._delete([idx])
             return True
         except Exception as e:
             print(f"Delete failed: {e}")
@@ -145,9 +230,7 @@ class MilvusConfigRepository:
         if not self.connected or not self.collection:
             raise RuntimeError("Not connected to Milvus")
         try:
-            self.collection.load()
-            upsert_data = [[idx], [new_config_json], [[0.0, 0.0]]]
-            self.collection.upsert(upsert_data)
+            self._upsert({idx: new_config_json})
             return True
         except Exception as e:
             print(f"Upsert failed: {str(e)}")
@@ -155,9 +238,8 @@ class MilvusConfigRepository:
 
     def clear_all_config(self):
         try:
-            self.collection.load()
-            res = self.collection.delete("idx != ''")
-            self.collection.flush()
+            self._run(self.collection.delete, "idx != ''")
+            self._written(lambda cache: cache.clear())
             return True
         except Exception as e:
             print(f"Clear all configs failed: {e}")
@@ -252,7 +334,7 @@ class MilvusDocumentRecordRepository:
         self.collection.insert(insert_data)
 
     def delete_records_by_file_id(self, file_id: str) -> List[str]:
-        expr = f'file_id == "{file_id}"'
+        expr = f"file_id == {_milvus_str(file_id)}"
         results = self.collection.query(expr=expr, output_fields=["doc_id"])
         deleted_doc_ids = [res["doc_id"] for res in results]
 
@@ -261,9 +343,8 @@ class MilvusDocumentRecordRepository:
         return deleted_doc_ids
 
     def get_records_by_file_id(self, file_id: str) -> List[Dict]:
-        expr = f'file_id == "{file_id}"'
         results = self.collection.query(
-            expr=expr,
+            expr=f"file_id == {_milvus_str(file_id)}",
             output_fields=["id", "file_id", "file_path", "doc_id", "metadata"],
         )
         return results
@@ -32,6 +32,11 @@ class Context:
         self.knowledgemgr = KnowledgeManager()
         self.agentmgr = AgentManager(self.plmgr)
         self.sessionmgr = SessionManager()
+        self.modmgr.set_in_use_checker(self._model_in_use)
+
+    def _model_in_use(self, model) -> bool:
+        active_pl = self.plmgr.get_active_pipeline()
+        return active_pl is not None and active_pl.model_existed(model.model_id)
 
     def get_pipeline_mgr(self):
         return self.plmgr
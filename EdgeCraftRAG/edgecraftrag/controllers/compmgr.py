@@ -2,7 +2,16 @@
 # SPDX-License-Identifier: Apache-2.0
 
 from edgecraftrag.api_schema import IndexerIn, ModelIn, NodeParserIn
-from edgecraftrag.base import BaseComponent, BaseMgr, CallbackType, ModelType, NodeParserType
+from edgecraftrag.base import (
+    BaseComponent,
+    BaseMgr,
+    CallbackType,
+    FaissIndexType,
+    IndexerType,
+    ModelType,
+    NodeParserType,
+)
+from edgecraftrag.components.faiss_index import get_faiss_params
 
 
 class NodeParserMgr(BaseMgr):
@@ -44,6 +53,13 @@ class IndexerMgr(BaseMgr):
                         or (v.model.model_id_or_path == indin.embedding_model.model_path)
                     )
                     and v.model.device == indin.embedding_model.device
+                    and (
+                        indin.indexer_type != IndexerType.FAISS_VECTOR
+                        or (
+                            v.faiss_index_type == (indin.faiss_index_type or FaissIndexType.FLAT)
+                            and v.faiss_params == get_faiss_params(indin.faiss_params)
+                        )
+                    )
                 ):
                     return v
         return None
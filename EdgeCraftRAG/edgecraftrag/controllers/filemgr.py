@@ -2,56 +2,246 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import asyncio
+import hashlib
 import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Any, Callable, List, Optional
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
 
 from edgecraftrag.base import BaseMgr
-from edgecraftrag.components.data import File
+from edgecraftrag.components.data import File, iter_file_documents
 from llama_index.core.schema import Document
 
+FILE_ADD_WORKERS = int(os.getenv("FILE_ADD_WORKERS", str(min(8, os.cpu_count() or 1))))
+FILE_ADD_BATCH_SIZE = int(os.getenv("FILE_ADD_BATCH_SIZE", "32"))
+# Files of one type loaded by one worker with a shared reader
+FILE_LOAD_BATCH_SIZE = int(os.getenv("FILE_LOAD_BATCH_SIZE", "8"))
+
+
+def content_hash(file_path: str) -> Optional[str]:
+    digest = hashlib.sha256()
+    try:
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+    except OSError as e:
+        print(f"Hash file {file_path} failed: {e}")
+        return None
+    return digest.hexdigest()
+
+
+def _clone_documents(documents: List[Document], file_path: str) -> List[Document]:
+    # Same content under another path, only the path dependent metadata and the ids differ
+    clones = []
+    for doc in documents:
+        metadata = dict(doc.metadata, file_path=file_path, file_name=Path(file_path).name)
+        clones.append(doc.model_copy(update={"id_": str(uuid.uuid4()), "metadata": metadata}))
+    return clones
+
 
 class FilelMgr(BaseMgr):
+    """Files and their documents, indexed by id, name, path and content hash.
+
+    Bulk adds hash files and load the new ones in parallel, batch by batch. Files whose content is
+    already loaded are not parsed again.
+    """
 
     def __init__(self):
         super().__init__()
+        self._lock = threading.RLock()
+        # name -> file ids in insertion order, the first one wins lookups by name
+        self._by_name: Dict[str, List[str]] = {}
+        self._by_hash: Dict[str, List[str]] = {}
+        self._by_path: Dict[str, str] = {}
+        # file id -> names of the knowledge bases holding the file, one file entry is shared by all of them
+        self._kb_refs: Dict[str, Set[str]] = {}
+        self.last_add_report: List[Dict] = []
+
+    def add(self, comp: File, name: str = None):
+        with self._lock:
+            super().add(comp, name)
+            idx = name or comp.idx
+            self._by_name.setdefault(comp.name, []).append(idx)
+            if comp.file_path:
+                self._by_path[str(comp.file_path)] = idx
+            file_hash = getattr(comp, "content_hash", None)
+            if file_hash:
+                self._by_hash.setdefault(file_hash, []).append(idx)
+
+    def remove(self, idx):
+        with self._lock:
+            file = self.components.get(idx)
+            super().remove(idx)
+            if file is None:
+                return
+            for index, key in ((self._by_name, file.name), (self._by_hash, getattr(file, "content_hash", None))):
+                ids = index.get(key)
+                if ids and idx in ids:
+                    ids.remove(idx)
+                    if not ids:
+                        del index[key]
+            if file.file_path and self._by_path.get(str(file.file_path)) == idx:
+                del self._by_path[str(file.file_path)]
+            self._kb_refs.pop(idx, None)
 
     def add_text(self, text: str):
         file = File(file_name="text", content=text)
+        file.content_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
         self.add(file)
         return file.documents
 
-    def add_files(self, docs: Any):
+    def add_files(self, docs: Any, kb_name: Optional[str] = None):
+        return [doc for _, documents in self.iter_add_files(docs, kb_name) for doc in documents]
+
+    def iter_add_files(self, docs: Any, kb_name: Optional[str] = None) -> Iterator[Tuple[str, List[Document]]]:
+        """Add files (or the files below directories), yielding (file_path, documents) per file as it is loaded.
+
+        Consumers such as the node parser can start on the first files while the rest are still loading.
+        Files are yielded in completion order, not in the order given. With kb_name, each file is referenced
+        by that knowledge base and del_file only removes it once no knowledge base references it.
+        """
         if not isinstance(docs, list):
             docs = [docs]
 
-        input_docs = []
+        file_paths = []
         for doc in docs:
             if not os.path.exists(doc):
                 continue
 
             if os.path.isfile(doc):
-                files = [doc]
+                file_paths.append(doc)
             elif os.path.isdir(doc):
-                files = [os.path.join(root, f) for root, _, files in os.walk(doc) for f in files]
-            else:
-                continue
+                file_paths.extend(os.path.join(root, f) for root, _, files in os.walk(doc) for f in files)
+
+        self.last_add_report = []
+        if not file_paths:
+            return
+        num_batches = (len(file_paths) + FILE_ADD_BATCH_SIZE - 1) // FILE_ADD_BATCH_SIZE
+        with ThreadPoolExecutor(max_workers=max(1, FILE_ADD_WORKERS)) as executor:
+            for batch_num in range(num_batches):
+                batch = file_paths[batch_num * FILE_ADD_BATCH_SIZE : (batch_num + 1) * FILE_ADD_BATCH_SIZE]
+                yield from self._add_batch(executor, batch, batch_num + 1, num_batches, kb_name)
+
+    def add_unloaded_files(
+        self, file_paths: List[str], file_hashes: List[Optional[str]], kb_name: Optional[str] = None
+    ):
+        """Register files without loading them, their documents are read from disk when first asked for.
 
-            if not files:
+        For files whose nodes are already cached, e.g. on startup, where loading every document up front
+        would hold the whole corpus in memory. Missing files (no hash) are skipped.
+        """
+        with self._lock:
+            for file_path, file_hash in zip(file_paths, file_hashes):
+                if file_hash is None:
+                    continue
+                same_path = self._by_path.get(str(Path(file_path)))
+                if same_path and getattr(self.components[same_path], "content_hash", None) == file_hash:
+                    self._add_ref(same_path, set(), kb_name)
+                    continue
+                refs = set()
+                if same_path:
+                    refs = self._kb_refs.get(same_path, set())
+                    self.remove(same_path)
+                file = File(file_path=file_path, documents=[])
+                file.content_hash = file_hash
+                file.release_documents()
+                self.add(file)
+                self._add_ref(file.idx, refs, kb_name)
+
+    def _add_batch(
+        self,
+        executor: ThreadPoolExecutor,
+        batch: List[str],
+        batch_num: int,
+        num_batches: int,
+        kb_name: Optional[str] = None,
+    ):
+        start = time.perf_counter()
+        hashes = list(executor.map(content_hash, batch))
+        to_load: Dict[str, Tuple[str, str]] = {}
+        skipped = 0
+        num_docs = 0
+        for file_path, file_hash in zip(batch, hashes):
+            if file_hash is None:
                 continue
+            with self._lock:
+                existing = self.get_file_by_hash(file_hash)
+                same_path = self._by_path.get(str(Path(file_path)))
+                if same_path and getattr(self.components[same_path], "content_hash", None) != file_hash:
+                    # Changed since it was added, replaced by the new content, other knowledge bases keep their refs
+                    refs = self._kb_refs.get(same_path, set())
+                    self.remove(same_path)
+                    same_path = None
+                else:
+                    refs = set()
+                if same_path:
+                    file = self.components[same_path]
+                elif existing:
+                    file = File(file_path=file_path, documents=_clone_documents(existing.get_documents(), file_path))
+                    file.content_hash = file_hash
+                    self.add(file)
+                else:
+                    to_load[str(Path(file_path))] = (file_path, file_hash, refs)
+                    continue
+                self._add_ref(file.idx, refs, kb_name)
+            skipped += 1
+            documents = file.get_documents()
+            num_docs += len(documents)
+            yield file_path, documents
 
-            for file_path in files:
-                file = File(file_path=file_path)
+        loaded = iter_file_documents(
+            [file_path for file_path, _, _ in to_load.values()], batch_size=FILE_LOAD_BATCH_SIZE, executor=executor
+        )
+        for path, documents in loaded:
+            file_path, file_hash, refs = to_load[str(path)]
+            file = File(file_path=file_path, documents=documents)
+            file.content_hash = file_hash
+            with self._lock:
                 self.add(file)
-                input_docs.extend(file.documents)
+                self._add_ref(file.idx, refs, kb_name)
+            num_docs += len(documents)
+            yield file_path, file.documents
 
-        return input_docs
+        elapsed = time.perf_counter() - start
+        num_bytes = sum(os.path.getsize(file_path) for file_path, h in zip(batch, hashes) if h is not None)
+        report = {
+            "batch": batch_num,
+            "num_batches": num_batches,
+            "files": len(batch),
+            "loaded": len(to_load),
+            "skipped": skipped,
+            "docs": num_docs,
+            "seconds": round(elapsed, 3),
+            "files_per_second": round(len(batch) / elapsed, 2) if elapsed > 0 else None,
+            "mb_per_second": round(num_bytes / 1e6 / elapsed, 2) if elapsed > 0 else None,
+        }
+        self.last_add_report.append(report)
+        print(
+            f"Add files batch {batch_num}/{num_batches}: {len(to_load)} loaded, {skipped} unchanged or duplicate, "
+            f"{num_docs} docs in {elapsed:.2f}s ({report['files_per_second']} files/s, {report['mb_per_second']} MB/s)"
+        )
+
+    def _add_ref(self, idx: str, refs: Set[str], kb_name: Optional[str]) -> None:
+        kb_refs = self._kb_refs.setdefault(idx, set())
+        kb_refs.update(refs)
+        if kb_name:
+            kb_refs.add(kb_name)
 
     def get_file_by_name_or_id(self, name: str):
-        for _, file in self.components.items():
-            if file.name == name or file.idx == name:
+        with self._lock:
+            file = self.components.get(name)
+            if file is not None:
                 return file
-        return None
+            ids = self._by_name.get(name)
+            return self.components[ids[0]] if ids else None
+
+    def get_file_by_hash(self, file_hash: str):
+        with self._lock:
+            ids = self._by_hash.get(file_hash)
+            return self.components[ids[0]] if ids else None
 
     def get_files(self):
         return [file for _, file in self.components.items()]
@@ -59,22 +249,37 @@ class FilelMgr(BaseMgr):
     def get_all_docs(self) -> List[Document]:
         all_docs = []
         for _, file in self.components.items():
-            all_docs.extend(file.documents)
+            all_docs.extend(file.get_documents())
         return all_docs
 
+    def get_file_by_path(self, file_path: str):
+        with self._lock:
+            idx = self._by_path.get(str(Path(file_path)))
+            return self.components[idx] if idx is not None else self.get_file_by_name_or_id(Path(file_path).name)
+
     def get_docs_by_file(self, file_path) -> List[Document]:
-        name = Path(file_path).name
-        file = self.get_file_by_name_or_id(name)
-        return file.documents if file else []
+        file = self.get_file_by_path(file_path)
+        return file.get_documents() if file else []
 
-    def del_file(self, file_path):
-        name = Path(file_path).name
-        file = self.get_file_by_name_or_id(name)
+    def release_documents(self, file_path) -> None:
+        """Drop the documents of a file once its nodes are cached, get_docs_by_file reads them again if needed."""
+        file = self.get_file_by_path(file_path)
         if file:
+            file.release_documents()
+
+    def del_file(self, file_path, kb_name: Optional[str] = None):
+        """Remove a file, with kb_name only that knowledge base's reference unless no other one remains."""
+        with self._lock:
+            file = self.get_file_by_path(file_path)
+            if not file:
+                return False
+            kb_refs = self._kb_refs.get(file.idx, set())
+            if kb_name is not None:
+                kb_refs.discard(kb_name)
+                if kb_refs:
+                    return True
             self.remove(file.idx)
             return True
-        else:
-            return False
 
     def update_file(self, file_path):
         name = Path(file_path).name
@@ -2,6 +2,11 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import asyncio
+import gc
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 from edgecraftrag.api_schema import ModelIn
 from edgecraftrag.base import BaseComponent, BaseMgr, CompType, ModelType
@@ -14,65 +19,265 @@ from edgecraftrag.components.model import (
 )
 
 
+def _search_key(model: BaseComponent) -> Tuple[str, str]:
+    if model.comp_subtype.value == "llm":
+        return model.model_name, model.device_map
+    return model.model_id_or_path, getattr(model, "device", getattr(model, "_device", "Unknown"))
+
+
+def _estimate_model_size(model: BaseComponent) -> int:
+    # OpenVINO weights dominate the resident size of a local model, remote models cost nothing locally
+    model_path = getattr(model, "model_path", None)
+    if not model_path or not os.path.isdir(model_path):
+        return 0
+    size = 0
+    for root, _, files in os.walk(model_path):
+        size += sum(os.path.getsize(os.path.join(root, f)) for f in files if f.endswith(".bin"))
+    return size
+
+
+class ModelRef:
+    """Callable handle used by generators instead of a weakref to the model.
+
+    Returns the resident model, reloads it if it was evicted and returns None once it was deleted.
+    """
+
+    def __init__(self, mgr: "ModelMgr", model: BaseComponent):
+        self._mgr = mgr
+        self.model_id = model.model_id
+        self.search_key = _search_key(model)
+
+    def __call__(self):
+        return self._mgr.resolve_model_ref(self)
+
+    async def aresolve(self):
+        """Like calling the handle, but an evicted model is reloaded in a worker thread, off the event loop."""
+        model = self._mgr.resolve_model_ref(self, reload=False)
+        if model is None and self._mgr.is_evicted(self):
+            model = await asyncio.to_thread(self._mgr.resolve_model_ref, self)
+        return model
+
+    def peek(self):
+        """The resident model, or the load parameters of an evicted one, without reloading it."""
+        return self._mgr.resolve_model_ref(self, reload=False) or self._mgr.get_evicted_params(self)
+
+
 class ModelMgr(BaseMgr):
+    """Model registry indexed by model id and by (model path, device).
+
+    Models are shared by every pipeline and knowledge base that asks for the same weights on the same device.
+    With MODEL_MEMORY_BUDGET_MB set, least recently used LLMs that the active pipeline does not use are
+    evicted when the budget is exceeded and reloaded through their ModelRef on next use. Embedding and rerank
+    models are held directly by indexers and postprocessors, so they stay resident and only count toward the budget.
+    """
 
     def __init__(self):
         self._lock = asyncio.Lock()
         super().__init__()
+        self.memory_budget = int(os.getenv("MODEL_MEMORY_BUDGET_MB", "0")) * 1024 * 1024
+        # Opt-in: OpenVINO models share one infer request, a warmup can collide with the first real request
+        self.enable_warmup = os.getenv("MODEL_WARMUP", "false").lower() == "true"
+        self._by_model_id: Dict[str, List[str]] = {}
+        self._by_search_key: Dict[Tuple[str, str], str] = {}
+        # key -> estimated size in bytes, least recently used first
+        self._lru: OrderedDict = OrderedDict()
+        self._evicted: Dict[Tuple[str, str], ModelIn] = {}
+        # key -> (tokenizer, bench hook) of models loaded for benchmarking
+        self._bench_tools: Dict[str, Tuple[Any, Any]] = {}
+        self._registry_lock = threading.RLock()
+        self._in_use: Callable[[BaseComponent], bool] = lambda model: False
 
-    def get_model_by_name(self, name: str):
-        for _, v in self.components.items():
-            if v.model_id == name:
-                model_type = v.comp_subtype.value
-                model_info = {
-                    "model_type": model_type,
-                    "model_id": getattr(v, "model_id", "Unknown"),
-                }
-                if model_type == ModelType.LLM:
-                    model_info["model_path"] = getattr(v, "model_name", "Unknown")
-                    model_info["device"] = getattr(v, "device_map", "Unknown")
+    def set_in_use_checker(self, checker: Callable[[BaseComponent], bool]) -> None:
+        self._in_use = checker
+
+    def add(self, comp: BaseComponent, name: str = None):
+        key = name or comp.idx
+        with self._registry_lock:
+            if key in self.components:
+                self._unindex(key)
+            super().add(comp, name)
+            self._by_model_id.setdefault(comp.model_id, []).append(key)
+            search_key = _search_key(comp)
+            self._by_search_key[search_key] = key
+            self._evicted.pop(search_key, None)
+            self._lru[key] = _estimate_model_size(comp)
+            self._evict(keep=key)
+        if self.enable_warmup:
+            threading.Thread(target=self._warmup, args=(comp,), daemon=True).start()
+        return True
+
+    def remove(self, idx):
+        with self._registry_lock:
+            self._unindex(idx)
+            super().remove(idx)
+
+    def _unindex(self, key: str) -> None:
+        model = self.components.get(key)
+        if model is None:
+            return
+        keys = self._by_model_id.get(model.model_id, [])
+        if key in keys:
+            keys.remove(key)
+        if not keys:
+            self._by_model_id.pop(model.model_id, None)
+        search_key = _search_key(model)
+        if self._by_search_key.get(search_key) == key:
+            del self._by_search_key[search_key]
+        self._lru.pop(key, None)
+        self._bench_tools.pop(key, None)
+
+    def _touch(self, key: str) -> None:
+        try:
+            self._lru.move_to_end(key)
+        except KeyError:
+            # Removed meanwhile
+            pass
+
+    def _evict(self, keep: Optional[str] = None) -> None:
+        if self.memory_budget <= 0:
+            return
+        total = sum(self._lru.values())
+        for key in list(self._lru.keys()):
+            if total <= self.memory_budget:
+                break
+            model = self.components.get(key)
+            if key == keep or model is None or model.comp_subtype != ModelType.LLM or self._in_use(model):
+                continue
+            total -= self._lru[key]
+            search_key = _search_key(model)
+            self._evicted[search_key] = ModelIn(
+                model_type=ModelType.LLM,
+                model_id=model.model_id,
+                model_path=model.model_path,
+                device=model.device,
+                weight=model.weight,
+            )
+            print(f"Evicting model {model.model_id} on {model.device} to stay within the memory budget")
+            self.remove(key)
+        gc.collect()
+
+    def _warmup(self, model: BaseComponent) -> None:
+        # The first inference after compiling is slow, run it before a request has to
+        try:
+            match model.comp_subtype:
+                case ModelType.EMBEDDING:
+                    model.get_text_embedding("warmup")
+                case ModelType.RERANKER:
+                    from llama_index.core.schema import NodeWithScore, TextNode
+
+                    model.postprocess_nodes([NodeWithScore(node=TextNode(text="warmup"))], query_str="warmup")
+        except Exception as e:
+            print(f"Warmup of model {model.model_id} failed: {e}")
+
+    def get_model_ref(self, model: BaseComponent) -> ModelRef:
+        return ModelRef(self, model)
+
+    def resolve_model_ref(self, ref: ModelRef, reload: bool = True):
+        # Lookups do not take the registry lock, a model load in another thread holds it for long
+        key = self._by_search_key.get(ref.search_key)
+        model = self.components.get(key) if key is not None else None
+        if model is not None:
+            self._touch(key)
+            return model
+        model_para = self._evicted.get(ref.search_key)
+        if model_para is None or not reload:
+            return None
+        print(f"Reloading evicted model {ref.model_id}")
+        return self.get_or_load_model(model_para)
+
+    def is_evicted(self, ref: ModelRef) -> bool:
+        return ref.search_key in self._evicted
+
+    def get_evicted_params(self, ref: ModelRef) -> Optional[ModelIn]:
+        return self._evicted.get(ref.search_key)
+
+    def get_or_load_model(self, model_para: ModelIn, benchmark: bool = False) -> BaseComponent:
+        """Return the registered model with the same path and device, loading and registering it if needed.
+
+        With benchmark, a model that has to be loaded is loaded with its benchmark tokenizer and hook,
+        see get_bench_tools.
+        """
+        with self._registry_lock:
+            model = self.search_model(model_para)
+            if model is None:
+                if benchmark:
+                    model, tokenizer, bench_hook = self.load_model_ben(model_para)
+                    self.add(model)
+                    self._bench_tools[self._by_search_key[_search_key(model)]] = (tokenizer, bench_hook)
                 else:
-                    model_info["model_path"] = getattr(v, "model_id_or_path", "Unknown")
-                    model_info["device"] = getattr(v, "device", getattr(v, "_device", "Unknown"))
-                return model_info
+                    model = self.load_model(model_para)
+                    self.add(model)
+            return model
+
+    def get_bench_tools(self, model: BaseComponent, model_para: ModelIn) -> Tuple[Any, Any]:
+        with self._registry_lock:
+            tools = self._bench_tools.get(self._by_search_key.get(_search_key(model)))
+        if tools is None:
+            # Registered without benchmark tools, e.g. by a pipeline that had benchmarking off
+            _, tokenizer, bench_hook = self.load_model_ben(model_para)
+            tools = (tokenizer, bench_hook)
+        return tools
+
+    @staticmethod
+    def _model_info(model: BaseComponent) -> Dict[str, Any]:
+        model_type = model.comp_subtype.value
+        model_info = {
+            "model_type": model_type,
+            "model_id": getattr(model, "model_id", "Unknown"),
+        }
+        if model_type == ModelType.LLM:
+            model_info["model_path"] = getattr(model, "model_name", "Unknown")
+            model_info["device"] = getattr(model, "device_map", "Unknown")
+        else:
+            model_info["model_path"] = getattr(model, "model_id_or_path", "Unknown")
+            model_info["device"] = getattr(model, "device", getattr(model, "_device", "Unknown"))
+        return model_info
+
+    @staticmethod
+    def _evicted_model_info(model_para: ModelIn) -> Dict[str, Any]:
+        return {
+            "model_type": ModelType.LLM.value,
+            "model_id": model_para.model_id,
+            "model_path": model_para.model_path,
+            "device": model_para.device,
+            "evicted": True,
+        }
+
+    def get_model_by_name(self, name: str):
+        with self._registry_lock:
+            keys = self._by_model_id.get(name)
+            if keys:
+                return self._model_info(self.components[keys[0]])
+            for model_para in self._evicted.values():
+                if model_para.model_id == name:
+                    return self._evicted_model_info(model_para)
         return None
 
     def get_models(self):
-        model = {}
-        for k, v in self.components.items():
-            # Supplement the information of the model
-            model_type = v.comp_subtype.value
-            model_info = {
-                "model_type": model_type,
-                "model_id": getattr(v, "model_id", "Unknown"),
-            }
-            if model_type == ModelType.LLM:
-                model_info["model_path"] = getattr(v, "model_name", "Unknown")
-                model_info["device"] = getattr(v, "device_map", "Unknown")
-            else:
-                model_info["model_path"] = getattr(v, "model_id_or_path", "Unknown")
-                model_info["device"] = getattr(v, "device", getattr(v, "_device", "Unknown"))
-            model[k] = model_info
+        with self._registry_lock:
+            model = {k: self._model_info(v) for k, v in self.components.items()}
+            for model_para in self._evicted.values():
+                model[model_para.model_id] = self._evicted_model_info(model_para)
         return model
 
     def search_model(self, modelin: ModelIn) -> BaseComponent:
         # Compare model_path and device to search model
-        for _, v in self.components.items():
-            model_path = v.model_name if v.comp_subtype.value == "llm" else v.model_id_or_path
-            model_dev = (
-                v.device_map
-                if v.comp_subtype.value == "llm"
-                else getattr(v, "device", getattr(v, "_device", "Unknown"))
-            )
-            if model_path == modelin.model_path and model_dev == modelin.device:
-                return v
-        return None
+        key = self._by_search_key.get((modelin.model_path, modelin.device))
+        if key is None:
+            return None
+        self._touch(key)
+        return self.components[key]
 
     def del_model_by_name(self, name: str):
-        for key, v in self.components.items():
-            if v and v.model_id == name:
-                self.remove(key)
+        with self._registry_lock:
+            keys = self._by_model_id.get(name)
+            if keys:
+                self.remove(keys[0])
                 return "Model deleted"
+            for search_key, model_para in list(self._evicted.items()):
+                if model_para.model_id == name:
+                    del self._evicted[search_key]
+                    return "Model deleted"
         return "Model not found"
 
     @staticmethod
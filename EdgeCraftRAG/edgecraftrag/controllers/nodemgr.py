@@ -11,18 +11,18 @@ from llama_index.core.schema import BaseNode
 class NodeMgr:
 
     def __init__(self):
+        # np_idx -> {node_id: node}, in insertion order
         self.nodes = {}
 
     # idx: index of node_parser
     def add_nodes(self, np_idx, nodes):
-        if np_idx in self.nodes:
-            self.nodes[np_idx].extend(nodes)
-        else:
-            self.nodes[np_idx] = nodes
+        self.nodes.setdefault(np_idx, {}).update((node.node_id, node) for node in nodes)
 
-    # TODO: to be implemented
-    def del_nodes(self, nodes):
-        pass
+    def del_nodes(self, np_idx, node_ids):
+        if np_idx in self.nodes:
+            np_nodes = self.nodes[np_idx]
+            for node_id in node_ids:
+                np_nodes.pop(node_id, None)
 
     def del_nodes_by_np_idx(self, np_idx):
         if np_idx in self.nodes:
@@ -30,6 +30,6 @@ class NodeMgr:
 
     def get_nodes(self, np_idx) -> List[BaseNode]:
         if np_idx in self.nodes:
-            return self.nodes[np_idx]
+            return list(self.nodes[np_idx].values())
         else:
             return []
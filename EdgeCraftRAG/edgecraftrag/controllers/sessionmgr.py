@@ -1,15 +1,18 @@
 # Copyright (C) 2024 Intel Corporation
 # SPDX-License-Identifier: Apache-2.0
 
-import json
 import os
-from typing import Any, Dict, List, Optional
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
 
 from edgecraftrag.api_schema import SessionIn
 from edgecraftrag.base import BaseMgr, InferenceType
-from edgecraftrag.components.session import Session
+from edgecraftrag.components.session import Session, format_message
+from edgecraftrag.components.session_journal import SessionJournal
 from edgecraftrag.config_repository import MilvusConfigRepository
 from edgecraftrag.env import SESSION_FILE
+from edgecraftrag.utils import get_tokenizer
 
 
 class SessionManager(BaseMgr):
@@ -20,6 +23,12 @@ class SessionManager(BaseMgr):
 
         self.milvus_repo = MilvusConfigRepository.create_connection(Repo_config_name="session_storage", max_retries=1)
         self.components: Dict[str, Session] = {}
+        self._lock = threading.RLock()
+        self.journal = SessionJournal(self.session_file, self._snapshot, self._lock)
+        # Persist partial streamed answers every N seconds, 0 only persists the final message
+        self.stream_checkpoint_interval = float(os.getenv("SESSION_STREAM_CHECKPOINT_INTERVAL", "0"))
+        self._stream_checkpoints: Dict[str, float] = {}
+        self._failed_tokenizers: Set[str] = set()
 
         if self.milvus_repo and self.milvus_repo.connected:
             self._load_from_milvus()
@@ -53,17 +62,19 @@ class SessionManager(BaseMgr):
         return session_id
 
     def add(self, session: Session, name: str) -> None:
-        self.components[name] = session
-        if self.milvus_repo and self.milvus_repo.connected:
-            self.milvus_repo.add_config_by_idx(name, session.to_dict())
-        else:
-            self.save_to_file()
+        with self._lock:
+            self.components[name] = session
+            if self.milvus_repo and self.milvus_repo.connected:
+                self.milvus_repo.add_config_by_idx(name, session.to_dict())
+            else:
+                self.journal.append(name, "session", data=session.to_dict())
 
     def clear_current_history(self) -> None:
-        current_session = self.get_current_session()
-        if current_session:
-            current_session.clear_messages()
-            self._persist_session(current_session.idx)
+        with self._lock:
+            current_session = self.get_current_session()
+            if current_session:
+                current_session.clear_messages()
+                self._persist_session(self._current_session_id, "clear")
 
     def save_current_message(self, sessionid: str, role: str, content: str) -> str:
         current_session = self.get(sessionid)
@@ -71,8 +82,9 @@ class SessionManager(BaseMgr):
             return "No current session set"
 
         try:
-            current_session.add_message(role, content)
-            self._persist_session(sessionid)
+            with self._lock:
+                current_session.add_message(role, content)
+                self._persist_session(sessionid, "message", role=role, content=content)
             return "Message added successfully"
         except ValueError as e:
             return f"Failed to add message: {str(e)}"
@@ -87,29 +99,95 @@ class SessionManager(BaseMgr):
         except ValueError as e:
             return f"Failed to update message: {str(e)}"
 
-    def concat_history(self, sessionid: str, inference_type: str, user_message: str) -> str:
+    def start_streaming_message(self, sessionid: str, role: str) -> None:
+        current_session = self.get(sessionid)
+        if current_session:
+            current_session.start_streaming_message(role)
+            self._stream_checkpoints[sessionid] = time.monotonic()
+
+    def append_streaming_chunk(self, sessionid: str, chunk: str) -> None:
+        current_session = self.get(sessionid)
+        if not current_session:
+            return
+        current_session.append_streaming_chunk(chunk)
+        if self.stream_checkpoint_interval > 0:
+            now = time.monotonic()
+            if now - self._stream_checkpoints.get(sessionid, now) >= self.stream_checkpoint_interval:
+                self._stream_checkpoints[sessionid] = now
+                with self._lock:
+                    self._persist_session(sessionid, "partial", content=current_session.get_streaming_content())
+
+    def commit_streaming_message(self, sessionid: str) -> str:
+        current_session = self.get(sessionid)
+        if not current_session:
+            return "No current session set"
+        self._stream_checkpoints.pop(sessionid, None)
+        with self._lock:
+            message = current_session.finish_streaming_message()
+            if message is None:
+                return "No streaming message to commit"
+            self._persist_session(sessionid, "message", **message)
+        return "Message added successfully"
+
+    def concat_history(
+        self, sessionid: str, inference_type: str, user_message: str, model_path: Optional[str] = None
+    ) -> str:
         max_token = 6000
         if inference_type == InferenceType.VLLM:
             vllm_max_len = int(os.getenv("MAX_MODEL_LEN", "10240"))
             if vllm_max_len > 5000:
                 max_token = vllm_max_len - 1024
+        budget = min(max_token, int(os.getenv("CHAT_HISTORY_MAX_TOKENS", "2048")))
 
         current_session = self.get(sessionid)
         if not current_session:
             return ""
-        history_messages = current_session.get_messages()
-        recent_str = self.get_recent_chat_rounds(history_messages)
+        with self._lock:
+            recent_str = self.get_history_within_budget(current_session, budget, model_path)
 
         self.save_current_message(sessionid, "user", user_message)
-        return recent_str[-max_token:] if len(recent_str) > max_token else recent_str
+        return recent_str
 
-    def get_recent_chat_rounds(self, messages: List[Dict[str, str]]) -> str:
+    def get_history_within_budget(self, session: Session, budget: int, model_path: Optional[str] = None) -> str:
+        """The most recent messages of the last CHAT_HISTORY_ROUND rounds that fit in budget tokens, oldest first.
+
+        Tokens are counted with the model's tokenizer, or estimated from the length when it cannot be loaded.
+        """
+        history_messages = session.get_messages()
+        recent = self.get_recent_chat_rounds(history_messages)
+        if not recent:
+            return ""
+        key, count_tokens = self._get_token_counter(model_path)
+        counts = session.get_token_counts(key, count_tokens)[len(history_messages) - len(recent) :]
+
+        selected = []
+        total = 0
+        for message, count in zip(reversed(recent), reversed(counts)):
+            # One more token for the newline joining the messages
+            if total + count + 1 > budget:
+                break
+            selected.append(format_message(message))
+            total += count + 1
+        return "\n".join(reversed(selected))
+
+    def get_recent_chat_rounds(self, messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
         history_num = int(os.getenv("CHAT_HISTORY_ROUND", "0"))
         if history_num <= 0:
-            return ""
+            return []
         total = len(messages)
         start_idx = max(0, total - (history_num * 2))
-        return str(messages[start_idx:])
+        return messages[start_idx:]
+
+    def _get_token_counter(self, model_path: Optional[str]) -> Tuple[str, Callable[[str], int]]:
+        if model_path and model_path not in self._failed_tokenizers:
+            try:
+                tokenizer = get_tokenizer(model_path)
+                return model_path, lambda text: len(tokenizer.encode(text, add_special_tokens=False))
+            except Exception as e:
+                self._failed_tokenizers.add(model_path)
+                print(f"Load tokenizer {model_path} failed, chat history tokens are estimated: {e}")
+        # Roughly 3 characters per token, on the high side so the estimate rarely exceeds the budget
+        return "estimate", lambda text: len(text) // 3 + 1
 
     def get_all_sessions(self):
         return {
@@ -124,7 +202,7 @@ class SessionManager(BaseMgr):
             return {"session_id": session_id, "exists": False}
         return session.to_dict()
 
-    def _persist_session(self, session_id: str):
+    def _persist_session(self, session_id: str, op: str, **fields):
         session = self.components.get(session_id)
         if not session:
             return
@@ -132,31 +210,51 @@ class SessionManager(BaseMgr):
         if self.milvus_repo and self.milvus_repo.connected:
             self.milvus_repo.update_config_by_idx(session_id, session.to_dict())
         else:
-            self.save_to_file()
+            # Only the change is journaled, the full file is rewritten on compaction
+            self.journal.append(session_id, op, **fields)
+
+    def _snapshot(self) -> Dict[str, Dict]:
+        # Called by the journal writer with the lock held, partial streamed answers are not persisted
+        return {
+            sid: dict(session.to_dict(), messages=session.get_messages())
+            for sid, session in self.components.items()
+            if isinstance(session, Session)
+        }
+
+    def _apply_journal_record(self, record: Dict[str, Any]) -> None:
+        session_id = record["sid"]
+        if record["op"] == "session":
+            self.components[session_id] = Session.from_dict(record["data"])
+            return
+        session = self.components.get(session_id)
+        if not session:
+            return
+        if record["op"] == "message":
+            session.add_message(record["role"], record["content"])
+        elif record["op"] == "clear":
+            session.clear_messages()
+        elif record["op"] == "partial":
+            session.update_current_message("assistant", record["content"])
 
     def save_to_file(self) -> Dict[str, str]:
-        try:
-            os.makedirs(os.path.dirname(self.session_file), exist_ok=True)
-            data = {sid: session.to_dict() for sid, session in self.components.items() if isinstance(session, Session)}
-            with open(self.session_file, "w", encoding="utf-8") as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
-            return {"status": "success", "message": f"Saved to {self.session_file}"}
-        except Exception as e:
-            return {"status": "error", "message": f"Save failed: {str(e)}"}
+        self.journal.request_compaction()
+        return {"status": "success", "message": f"Compaction of {self.session_file} scheduled"}
 
     def load_from_file(self) -> Dict[str, str]:
         try:
-            if not os.path.exists(self.session_file):
+            if not os.path.exists(self.session_file) and not os.path.exists(self.journal.journal_path):
                 return {"status": "warning", "message": "Session file does not exist"}
-            with open(self.session_file, "r", encoding="utf-8") as f:
-                loaded_data = json.load(f)
-            if not isinstance(loaded_data, dict):
-                raise ValueError("Invalid session file format: expected dict")
+            snapshot, records = self.journal.load()
 
             self.components.clear()
-            for session_id, session_data in loaded_data.items():
+            for session_id, session_data in snapshot.items():
                 session = Session.from_dict(session_data)
                 self.components[session_id] = session
+            for record in records:
+                self._apply_journal_record(record)
+            if records:
+                # Fold the replayed journal into the snapshot so the next start is fast
+                self.journal.request_compaction()
             return {
                 "status": "success",
                 "message": f"Loaded {len(self.components)} sessions from {self.session_file}",
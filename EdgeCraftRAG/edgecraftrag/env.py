@@ -22,3 +22,8 @@ SESSION_FILE = os.path.join(UI_DIRECTORY, "session.json")
 
 SEARCH_CONFIG_PATH = os.path.join(UI_DIRECTORY, "configs/search_config.yaml")
 SEARCH_DIR = os.path.join(UI_DIRECTORY, "configs/experience_dir/experience.json")
+
+BM25_INDEX_DIR = os.path.join(UI_DIRECTORY, "bm25_index")
+RELOAD_MANIFEST_DIR = os.path.join(UI_DIRECTORY, "reload_manifest")
+KBS_REV_MAP_FILE = os.path.join(CONFIG_DIRECTORY, "kbs_rev_map.json")
+LOCAL_STORE_FILE = os.path.join(UI_DIRECTORY, "edgecraftrag.db")
@@ -4,6 +4,7 @@
 import asyncio
 import io
 import os
+from functools import lru_cache
 from pathlib import Path
 from typing import Iterator, List, Optional
 
@@ -41,6 +42,11 @@ class DocxParagraphPicturePartitioner:
             yield Image(text="IMAGE", metadata=element_metadata)
 
 
+@lru_cache(maxsize=8)
+def get_tokenizer(model_path):
+    return AutoTokenizer.from_pretrained(model_path)
+
+
 def get_prompt_template(model_path, prompt_content=None, template_path=None, enable_think=False):
     if prompt_content is not None:
         template = prompt_content
@@ -55,7 +61,7 @@ def get_prompt_template(model_path, prompt_content=None, template_path=None, ena
         template = Path(normalized_path).read_text(encoding=None)
     else:
         template = DEFAULT_TEMPLATE
-    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    tokenizer = get_tokenizer(model_path)
     messages = [{"role": "system", "content": template}, {"role": "user", "content": "\n{input}\n"}]
     prompt_template = tokenizer.apply_chat_template(
         messages,